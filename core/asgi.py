@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Sob ASGI as conexões persistentes não são reaproveitadas com segurança entre as threads das views
+# síncronas (recomendação da documentação do Django): cada requisição abre e fecha a sua
+os.environ['DB_CONN_MAX_AGE'] = '0'
 
 application = get_asgi_application()
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 import dj_database_url
 
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'entregas.metricas.MetricasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,13 +58,33 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
+# --- CONEXÕES COM O BANCO ---
+# DB_CONN_MAX_AGE: segundos que uma conexão é reaproveitada entre requisições (0 = abre e fecha a cada
+# requisição, pagando o handshake TLS toda vez). DB_CONN_HEALTH_CHECKS testa a conexão reaproveitada
+# no início de cada requisição, descartando-a se o banco a derrubou. Sob ASGI (core/asgi.py) as
+# conexões persistentes ficam sempre desligadas.
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///' + os.path.join(BASE_DIR, 'db.sqlite3'),
-        conn_max_age=0 
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+        conn_health_checks=os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
     )
 }
 
+# DB_POOL=1: pool de conexões nativo (exige Django >= 5.1 com psycopg 3). Em versões sem suporte
+# o ajuste é ignorado e continuam valendo as conexões persistentes acima.
+if os.environ.get('DB_POOL') == '1' and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    import django
+    from importlib.util import find_spec
+
+    if django.VERSION >= (5, 1) and find_spec('psycopg') and find_spec('psycopg_pool'):
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -84,4 +106,123 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # --- CHAVES DO GOOGLE RECAPTCHA ENTERPRISE ---
 RECAPTCHA_SITE_KEY = os.environ.get('RECAPTCHA_SITE_KEY')
 GOOGLE_PROJECT_ID = os.environ.get('GOOGLE_PROJECT_ID')
-GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
\ No newline at end of file
+GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+# Token fixo aceito sem consultar o Google, para testes de carga locais (comando carga_balcao).
+# Só vale com DEBUG ligado: em produção (RENDER) é sempre ignorado.
+RECAPTCHA_TOKEN_TESTE = os.environ.get('RECAPTCHA_TOKEN_TESTE') if DEBUG else None
+
+# --- CACHE ---
+# 'locmem' (padrão, memória de cada processo), 'file' (compartilhado entre os workers da mesma máquina)
+# ou 'db' (compartilhado via tabela no banco; rode "python manage.py createcachetable")
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'db':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_drogafoz'}}
+elif CACHE_BACKEND == 'file':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, '.cache'))}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'drogafoz'}}
+
+# --- SESSÕES E USUÁRIO LOGADO EM CACHE ---
+# Sessões lidas do cache (gravadas também no banco) e usuário/permissões guardados no cache pelo
+# backend de autenticação, economizando as consultas de sessão e usuário em cada requisição do admin.
+# Com 'locmem' (um cache por worker) as cópias em cache duram pouco, para que logout e troca de senha
+# feitos em um worker valham logo nos demais; com 'file' ou 'db' a invalidação já é imediata.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'entregas.sessoes')
+SESSION_CACHE_TIMEOUT = int(os.environ.get('SESSION_CACHE_TIMEOUT', '60' if CACHE_BACKEND == 'locmem' else '0')) or None
+AUTHENTICATION_BACKENDS = [
+    'entregas.autenticacao.BackendUsuarioEmCache',
+    # Mantém válidas as sessões abertas antes do backend em cache (até o próximo login)
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_CACHE_TIMEOUT = int(os.environ.get('AUTH_CACHE_TIMEOUT', '60' if CACHE_BACKEND == 'locmem' else '300'))
+
+# --- LIMITADOR DE REQUISIÇÕES DA CONSULTA PÚBLICA ---
+# Formato "capacidade/segundos". 'memoria' guarda os baldes em cada processo; 'cache' usa o CACHES acima.
+LIMITADOR_ATIVO = os.environ.get('LIMITADOR_ATIVO', '1') == '1'
+LIMITADOR_BACKEND = os.environ.get('LIMITADOR_BACKEND', 'memoria')
+LIMITADOR_CONFIAR_X_FORWARDED_FOR = 'RENDER' in os.environ
+LIMITE_CONSULTA_IP = os.environ.get('LIMITE_CONSULTA_IP', '10/60')
+LIMITE_CONSULTA_DOCUMENTO = os.environ.get('LIMITE_CONSULTA_DOCUMENTO', '6/300')
+
+# --- CACHE DA CONSULTA PÚBLICA (segundos) ---
+# Com o cache 'locmem' a invalidação só alcança o próprio worker; os demais enxergam a mudança
+# quando este tempo expira. Com 'file' ou 'db' a invalidação é imediata para todos.
+CONSULTA_CACHE_TIMEOUT = int(os.environ.get('CONSULTA_CACHE_TIMEOUT', '120'))
+
+# --- CACHE DO AUTOCOMPLETE DE CLIENTES (segundos) ---
+# Respostas repetidas do autocomplete do balcão (ver entregas/autocompletar.py). Alterar um cliente
+# invalida tudo na hora no próprio worker; com 'locmem', os demais esperam no máximo este tempo.
+AUTOCOMPLETAR_CACHE_TIMEOUT = int(os.environ.get('AUTOCOMPLETAR_CACHE_TIMEOUT', '30'))
+
+# --- MÉTRICAS POR TELA ---
+# Latência, quantidade/tempo de SQL e tamanho da resposta por rota, gravados na tabela MetricaRota
+# a cada METRICAS_INTERVALO segundos e mantidos por METRICAS_RETENCAO_DIAS. Relatório em /admin/metricas/.
+# Desligadas no "manage.py test": a gravação no encerramento (atexit) rodaria depois de o banco de
+# teste ter sido destruído.
+METRICAS_ATIVAS = os.environ.get('METRICAS_ATIVAS', '1') == '1' and sys.argv[1:2] != ['test']
+METRICAS_INTERVALO = int(os.environ.get('METRICAS_INTERVALO', '60'))
+METRICAS_RETENCAO_DIAS = int(os.environ.get('METRICAS_RETENCAO_DIAS', '30'))
+
+# --- ARQUIVO DE ENCOMENDAS ---
+# Idade (em dias) a partir da qual retiradas quitadas e encomendas entregues/descartadas podem ir
+# para o arquivo ("manage.py arquivar_encomendas --confirmar").
+ARQUIVO_RETENCAO_DIAS = int(os.environ.get('ARQUIVO_RETENCAO_DIAS', '730'))
+
+# --- LIMPEZA DA LIXEIRA ---
+# Descartadas nunca retiradas com mais de LIXEIRA_RETENCAO_DIAS são apagadas (ou arquivadas) pelo
+# "manage.py limpar_lixeira --confirmar" (agendar fora do expediente), que para sozinho se entrar
+# em LIXEIRA_HORARIO_BLOQUEADO ("HH:MM-HH:MM", horário local; vazio desliga).
+LIXEIRA_RETENCAO_DIAS = int(os.environ.get('LIXEIRA_RETENCAO_DIAS', '180'))
+LIXEIRA_HORARIO_BLOQUEADO = os.environ.get('LIXEIRA_HORARIO_BLOQUEADO', '07:00-20:00')
+
+# --- AUDITORIA ---
+# 'logentry' grava no histórico do admin (django_admin_log); 'tabela' grava em EventoAuditoria,
+# particionada por mês (mantenha as partições futuras com "manage.py particoes_auditoria").
+AUDITORIA_DESTINO = os.environ.get('AUDITORIA_DESTINO', 'logentry')
+
+# --- FILA DE TAREFAS EM SEGUNDO PLANO ---
+# Executadas pelo "manage.py processar_tarefas" (ver entregas/tarefas.py). Falhas voltam para a fila
+# após TAREFAS_ESPERA_RETENTATIVA * 2^n segundos; tarefas EXECUTANDO há mais de TAREFAS_TEMPO_LIMITE
+# segundos são consideradas abandonadas; concluídas são apagadas após TAREFAS_RETENCAO_DIAS.
+TAREFAS_ESPERA_RETENTATIVA = int(os.environ.get('TAREFAS_ESPERA_RETENTATIVA', '60'))
+TAREFAS_TEMPO_LIMITE = int(os.environ.get('TAREFAS_TEMPO_LIMITE', '3600'))
+TAREFAS_RETENCAO_DIAS = int(os.environ.get('TAREFAS_RETENCAO_DIAS', '7'))
+
+# --- NOTIFICAÇÕES AOS CLIENTES ---
+# Avisos de chegada e de aumento da taxa, enviados em lotes pelo trabalhador da fila (ver
+# entregas/notificacoes.py). O backend é um backend de e-mail do Django: SMTP em produção (EMAIL_HOST,
+# EMAIL_PORT, ...), 'django.core.mail.backends.console.EmailBackend' ou '...filebased.EmailBackend'
+# (com EMAIL_FILE_PATH) para testar. NOTIFICACOES_JANELA junta chegadas próximas numa só mensagem.
+# Desligadas por padrão: com o backend de console os avisos seriam marcados como ENVIADA sem que
+# nenhum cliente recebesse nada. Ligue (NOTIFICACOES_ATIVAS=1) junto com a configuração do SMTP.
+NOTIFICACOES_ATIVAS = os.environ.get('NOTIFICACOES_ATIVAS', '0') == '1'
+NOTIFICACOES_EMAIL_BACKEND = os.environ.get('NOTIFICACOES_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+NOTIFICACOES_REMETENTE = os.environ.get('NOTIFICACOES_REMETENTE', 'Drogafoz Encomendas <nao-responda@drogafoz.com.br>')
+NOTIFICACOES_JANELA = int(os.environ.get('NOTIFICACOES_JANELA', '300'))
+NOTIFICACOES_AVISO_DIAS = int(os.environ.get('NOTIFICACOES_AVISO_DIAS', '1'))
+NOTIFICACOES_HORARIO_AVISO = os.environ.get('NOTIFICACOES_HORARIO_AVISO', '08:00')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '0') == '1'
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, '.emails'))
+
+# --- MUDANÇAS DE ESTOQUE AO VIVO (SSE) ---
+# /admin/eventos/ transmite entregas, cancelamentos, chegadas e descartes às telas abertas (ver
+# entregas/eventos.py). O fluxo contínuo precisa de servidor ASGI, ex:
+#   gunicorn core.asgi:application -k uvicorn.workers.UvicornWorker
+# (sob ASGI, DB_CONN_MAX_AGE vale sempre 0; ver core/asgi.py).
+# Sob WSGI cada tela consulta a cada EVENTOS_INTERVALO segundos. Os eventos ficam EVENTOS_RETENCAO_HORAS no banco.
+EVENTOS_INTERVALO = int(os.environ.get('EVENTOS_INTERVALO', '3'))
+EVENTOS_DURACAO_MAXIMA = int(os.environ.get('EVENTOS_DURACAO_MAXIMA', '300'))
+EVENTOS_RETENCAO_HORAS = int(os.environ.get('EVENTOS_RETENCAO_HORAS', '24'))
+
+# --- SUGESTÃO DE REMETENTES ---
+# Índice de frequência dos remetentes (ver entregas/remetentes.py), refeito pela fila a cada
+# REMETENTES_ATUALIZACAO segundos; entre uma atualização e outra, encomendas novas somam nele.
+# Precisa de cache compartilhado ('file' ou 'db'): com 'locmem' o índice montado pela fila não chega
+# aos workers, e por isso fica desligado por padrão.
+REMETENTES_ATIVOS = os.environ.get('REMETENTES_ATIVOS', '0' if CACHE_BACKEND == 'locmem' else '1') == '1'
+REMETENTES_ATUALIZACAO = int(os.environ.get('REMETENTES_ATUALIZACAO', '3600'))
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path
-from entregas.views import relatorio_entregas, consulta_publica, home
-from entregas.views import gerenciar_palavras, gerenciar_anotacoes
+from entregas.views import relatorio_entregas, consulta_publica, home, api_consulta_v1
+from entregas.views import gerenciar_palavras, gerenciar_anotacoes, status_limitador, relatorio_metricas, fluxo_eventos
 
 urlpatterns = [
     # Rota Raiz (Home Page)
@@ -9,12 +9,16 @@ urlpatterns = [
     
     # Rota de Consulta Pública
     path('consulta/', consulta_publica, name='consulta_publica'),
+    path('api/v1/consulta/', api_consulta_v1, name='api_consulta_v1'),
 
     # Rotas do Admin (Restritas)
     path('admin/relatorio/', relatorio_entregas, name='relatorio_entregas'),
     
     path('admin/gerenciar-palavras/', gerenciar_palavras, name='gerenciar_palavras'),
     path('admin/gerenciar-anotacoes/', gerenciar_anotacoes, name='gerenciar_anotacoes'),
+    path('admin/limitador/', status_limitador, name='status_limitador'),
+    path('admin/metricas/', relatorio_metricas, name='relatorio_metricas'),
+    path('admin/eventos/', fluxo_eventos, name='fluxo_eventos'),
     
     path('admin/', admin.site.urls),
 ]
\ No newline at end of file
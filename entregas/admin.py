@@ -9,15 +9,17 @@ from django.http import HttpResponse, HttpResponseRedirect
 from django.urls import path, reverse
 from django.core import serializers
 from django.contrib import messages
-from django.contrib.admin.models import LogEntry, CHANGE
-from django.contrib.contenttypes.models import ContentType
 from django.db import connection, IntegrityError, transaction
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Count, OuterRef, Q, Subquery
 from django import forms
 from django.contrib.admin.widgets import AutocompleteSelect
-from .models import Cliente, Encomenda, Retirada, AnotacaoCliente
+from . import arquivo, auditoria, autocompletar, chegadas, eventos, notificacoes, palavras_chave, recibos, remetentes
+from .models import Cliente, Encomenda, Retirada, AnotacaoCliente, EncomendaArquivada, EncomendaExpurgada, RetiradaArquivada, Tarefa, Notificacao
+from .models import ConflitoDeEdicao
 import re 
 import json
+from itertools import chain
 
 admin.site.site_header = "DROGAFOZ ENCOMENDAS"
 admin.site.site_title = "Drogafoz Admin"
@@ -61,14 +63,19 @@ class CustomUserAdmin(BuscaSemAcentoMixin, UserAdmin):
     )
 
     def has_delete_permission(self, request, obj=None):
-        if User.objects.count() <= 1: return False
+        # Só conta os usuários ao apagar um usuário específico (sem obj, é chamado em toda tela do admin)
+        if obj is not None and User.objects.count() <= 1: return False
         return super().has_delete_permission(request, obj)
 
+# --- AUTOCOMPLETE DE CLIENTES: busca dedicada (entregas/autocompletar.py) no lugar da busca genérica do admin ---
+class ClienteAutocompleteSelect(AutocompleteSelect):
+    url_name = '%s:entregas_cliente_autocompletar'
+
 # --- INÍCIO CORREÇÃO 5 (FORM DO RETIRANTE) ---
 class RetiranteForm(forms.Form):
     retirante = forms.ModelChoiceField(
         queryset=Cliente.objects.all().order_by('-id'),
-        widget=AutocompleteSelect(Retirada._meta.get_field('retirado_por'), admin.site),
+        widget=ClienteAutocompleteSelect(Retirada._meta.get_field('retirado_por'), admin.site),
         required=True,
         label="Quem está retirando as encomendas no balcão? (Obrigatório)"
     )
@@ -82,8 +89,37 @@ class RetiranteForm(forms.Form):
         self.fields['retirante'].widget.can_delete_related = False
 # --- FIM CORREÇÃO 5 ---
 
+# --- CONTROLE DE VERSÃO NOS FORMULÁRIOS (EDIÇÕES SIMULTÂNEAS) ---
+# O formulário carrega a versão do registro num campo oculto. Se outra tela salvou depois disso, o erro
+# aparece no próprio formulário; a corrida que sobrar (dois saves no mesmo instante) é barrada pelo
+# UPDATE condicional do modelo (VersaoMixin) e vira uma mensagem no changeform_view.
+class VersaoFormMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'versao' in self.fields:
+            self.fields['versao'].widget = forms.HiddenInput()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        versao = cleaned_data.get('versao')
+        # Aqui o instance ainda tem a versão lida do banco neste POST (o form só a copia depois do clean)
+        if self.instance.pk and versao is not None and versao != self.instance.versao:
+            raise ValidationError(
+                "Outra pessoa salvou este registro enquanto você editava. Recarregue a página para ver os "
+                "dados atuais e refaça as suas alterações."
+            )
+        return cleaned_data
+
+class VersaoAdminMixin:
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except ConflitoDeEdicao as e:
+            messages.error(request, str(e))
+            return HttpResponseRedirect(request.get_full_path())
+
 # --- NOVO: FORMULÁRIO DE ENCOMENDA COM VALIDAÇÃO SEGURA ---
-class EncomendaAdminForm(forms.ModelForm):
+class EncomendaAdminForm(VersaoFormMixin, forms.ModelForm):
     class Meta:
         model = Encomenda
         fields = '__all__'
@@ -103,6 +139,101 @@ class EncomendaAdminForm(forms.ModelForm):
         
         return cleaned_data
 
+# --- CHEGADA EM LOTE (FORMULÁRIOS) ---
+class ChegadaLoteForm(forms.Form):
+    data_chegada = forms.DateTimeField(
+        required=False, label="Data de Chegada",
+        widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        input_formats=['%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'],
+        help_text="Em branco: a hora em que o lote for gravado.",
+    )
+    remetente = forms.CharField(
+        max_length=255, required=False, label="Remetente do lote",
+        help_text="Usado nas linhas em que o remetente ficar em branco.",
+    )
+    valor_base = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, initial=10, label="Valor Base")
+
+    def clean_data_chegada(self):
+        data_chegada = self.cleaned_data.get('data_chegada') or timezone.now().replace(microsecond=0)
+        if data_chegada > timezone.now():
+            raise ValidationError("ERRO: A Data de Chegada não pode ser uma data futura.")
+        return data_chegada
+
+class ClienteDoLoteField(forms.ModelChoiceField):
+    # O formset carrega de uma vez os clientes de todas as linhas (in_bulk) em vez de um get() por linha
+    carregados = None
+
+    def to_python(self, value):
+        if self.carregados is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.carregados[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+
+class LinhaChegadaForm(forms.Form):
+    cliente = ClienteDoLoteField(
+        queryset=Cliente.objects.all(),
+        widget=ClienteAutocompleteSelect(Encomenda._meta.get_field('cliente'), admin.site),
+    )
+    descricao = forms.CharField(max_length=200, label="Descrição")
+    remetente = forms.CharField(max_length=255, required=False, label="Remetente")
+    observacao = forms.CharField(max_length=150, required=False, label="Observação")
+
+class LinhaChegadaFormSet(forms.BaseFormSet):
+    # Preenchidos pela view depois de validar o cabeçalho (ChegadaLoteForm)
+    data_chegada = None
+    remetente_padrao = ''
+
+    def full_clean(self):
+        ids = set()
+        for form in self.forms:
+            valor = form.data.get(form.add_prefix('cliente'))
+            if valor and str(valor).isdigit():
+                ids.add(int(valor))
+        carregados = Cliente.objects.in_bulk(ids)
+        for form in self.forms:
+            form.fields['cliente'].carregados = carregados
+        super().full_clean()
+
+    def clean(self):
+        if not any(form.has_changed() for form in self.forms):
+            raise ValidationError("Preencha pelo menos uma encomenda.")
+        # As linhas com erro de campo ficam de fora; as demais são conferidas mesmo assim (todos os erros de uma vez)
+        linhas = []
+        vistas = {}
+        for numero, form in enumerate(self.forms, start=1):
+            if not form.has_changed() or form.errors:
+                continue
+            dados = form.cleaned_data
+            if not dados['remetente']:
+                if not self.remetente_padrao:
+                    form.add_error('remetente', "Informe o remetente (ou o remetente do lote).")
+                    continue
+                dados['remetente'] = self.remetente_padrao
+
+            # Mesma proteção do unique_together (cliente, descrição, data de chegada), dentro do lote
+            par = (dados['cliente'].pk, dados['descricao'])
+            if par in vistas:
+                form.add_error('descricao', f"Repetida: igual à linha {vistas[par]} (mesmo cliente e descrição).")
+                continue
+            vistas[par] = numero
+            linhas.append((form, dados))
+
+        if self.data_chegada is None:
+            return
+        existentes = chegadas.duplicadas_no_banco(self.data_chegada, [dados for _, dados in linhas])
+        for form, dados in linhas:
+            if (dados['cliente'].pk, dados['descricao']) in existentes:
+                form.add_error('descricao', "Já existe encomenda deste cliente com esta descrição e data de chegada.")
+
+    def linhas(self):
+        return [form.cleaned_data for form in self.forms if form.has_changed()]
+
+ChegadaLoteFormSet = forms.formset_factory(
+    LinhaChegadaForm, formset=LinhaChegadaFormSet, extra=10, max_num=500, absolute_max=500, validate_max=True,
+)
+
 @admin.action(description='Marcar selecionados como "Entregue ao Cliente"')
 def marcar_entregue(modeladmin, request, queryset):
     # --- GARANTE A PERSISTÊNCIA DOS IDs SUBMETIDOS EM TODAS AS ETAPAS ---
@@ -119,7 +250,8 @@ def marcar_entregue(modeladmin, request, queryset):
         retirante_id = request.POST.get('retirante')
         
         try:
-            with transaction.atomic():
+            # Os registros de auditoria e os eventos de estoque da baixa são gravados num lote só, depois do commit
+            with transaction.atomic(), auditoria.lote(), eventos.lote():
                 if not retirante_id:
                     raise ValueError("Você precisa selecionar quem está retirando no balcão.")
                 
@@ -143,16 +275,19 @@ def marcar_entregue(modeladmin, request, queryset):
                 erros_conversao = 0
                 total_cobrado = 0.0
                 
-                # TRAVA 2: Bloqueio de Concorrência Real no Banco de Dados
-                encomendas_lock = Encomenda.objects.select_for_update().filter(pk__in=selected, descartado=False)
+                # TRAVA 2: Concorrência otimista (campo versao). As encomendas são lidas sem lock e cada save()
+                # só grava se a versão no banco ainda for a lida aqui; se outro caixa deu baixa, descartou ou
+                # editou no meio tempo, o save levanta ConflitoDeEdicao e a baixa inteira é desfeita. As linhas
+                # ficam travadas só do UPDATE até o commit. Ordem por id: dois caixas atualizam na mesma ordem.
+                encomendas_baixa = list(Encomenda.objects.select_related('cliente').filter(pk__in=selected, descartado=False).order_by('pk'))
                 
                 # NOVA TRAVA: Verificação contra exclusão de pacotes durante a operação.
-                # Se len(encomendas_lock) != len(selected), significa que alguém 
+                # Se len(encomendas_baixa) != len(selected), significa que alguém 
                 # apagou ou "descartou" uma encomenda via pop-up enquanto essa tela estava aberta.
-                if len(encomendas_lock) != len(selected):
+                if len(encomendas_baixa) != len(selected):
                     raise ValueError("Algumas encomendas selecionadas foram descartadas ou apagadas do sistema. Operação abortada por segurança.")
                 
-                for encomenda in encomendas_lock:
+                for encomenda in encomendas_baixa:
                     if encomenda.status == 'ENTREGUE':
                         raise ValueError(f"A encomenda #{encomenda.id} já foi entregue em outro caixa. Operação abortada para evitar faturamento duplicado.")
 
@@ -186,16 +321,11 @@ def marcar_entregue(modeladmin, request, queryset):
                         encomenda.save()
                         total_cobrado += valor_final
 
-                        LogEntry.objects.log_action(
-                            user_id=request.user.id,
-                            content_type_id=ContentType.objects.get_for_model(encomenda).pk,
-                            object_id=encomenda.pk,
-                            object_repr=str(encomenda),
-                            action_flag=CHANGE,
-                            change_message=f"Baixado na Retirada #{retirada.id}. Cobrado: {encomenda.valor_cobrado}"
-                        )
+                        auditoria.registrar(request.user, encomenda, f"Baixado na Retirada #{retirada.id}. Cobrado: {encomenda.valor_cobrado}")
                         count += 1
                     
+                    except ConflitoDeEdicao:
+                        raise ValueError(f"A encomenda #{encomenda.id} foi alterada em outro caixa durante a baixa. Operação abortada para evitar faturamento duplicado.")
                     except ValueError as e:
                         erros_conversao += 1
                         raise ValueError(f"Erro de conversão financeira no pacote #{encomenda.id}: {str(e)}")
@@ -203,6 +333,8 @@ def marcar_entregue(modeladmin, request, queryset):
                         raise Exception(f"Erro ao salvar pacote #{encomenda.id}: {str(e)}")
                 
                 retirada.valor_total = total_cobrado
+                # Recibo congelado com os valores desta baixa (a tela da retirada e as reimpressões leem dele)
+                retirada.recibo = recibos.montar(retirante, encomendas_baixa)
                 retirada.save()
 
                 msg = f"{count} encomenda(s) baixadas com sucesso! Retirada #{retirada.id} registrada."
@@ -329,6 +461,7 @@ def marcar_entregue(modeladmin, request, queryset):
         'anotacoes_destaque': anotacoes_destaque,
         'anotacoes_outros': anotacoes_outros,
         'clientes_na_tela': clientes_ids,
+        'ultimo_evento': eventos.ultimo_id(),
     }
     return render(request, 'admin/confirmar_entrega.html', context)
 
@@ -427,19 +560,31 @@ class RetiradaStatusFilter(admin.SimpleListFilter):
 class RetiradaAdmin(admin.ModelAdmin):
     list_display = ('id', 'get_retirado_por_nome', 'get_qtd_clientes', 'get_qtd_encomendas', 'get_data_hora', 'get_valor_total_fmt')
     list_filter = (RetiradaStatusFilter, 'data_retirada', 'operador')
+    # Evita um COUNT(*) da tabela inteira a cada carregamento da lista
+    show_full_result_count = False
     search_fields = ('=id', 'retirado_por__nome', 'retirado_por__cpf', 'encomendas__cliente__nome', 'retirado_por__observacao', 'encomendas__cliente__cpf')
-    
+    list_select_related = ('retirado_por',)
+
+    def get_queryset(self, request):
+        # Contagens por subconsulta (e não Count + JOIN): a busca por encomendas__cliente também
+        # faz JOIN com as encomendas e multiplicaria os totais
+        encomendas = Encomenda.objects.filter(retirada=OuterRef('pk')).order_by().values('retirada')
+        return super().get_queryset(request).annotate(
+            qtd_clientes=Subquery(encomendas.annotate(qtd=Count('cliente', distinct=True)).values('qtd')),
+            qtd_encomendas=Subquery(encomendas.annotate(qtd=Count('id')).values('qtd')),
+        )
+
     @admin.display(description='Retirado Por', ordering='retirado_por__nome')
     def get_retirado_por_nome(self, obj):
         return f"{obj.retirado_por.nome} ({obj.retirado_por.observacao})" if obj.retirado_por.observacao else obj.retirado_por.nome
 
     @admin.display(description='Qtd de Clientes')
     def get_qtd_clientes(self, obj):
-        return obj.encomendas.values('cliente').distinct().count()
+        return obj.qtd_clientes or 0
 
     @admin.display(description='Qtd de Encomendas')
     def get_qtd_encomendas(self, obj):
-        return obj.encomendas.count()
+        return obj.qtd_encomendas or 0
 
     @admin.display(description='Data e Hora da Retirada', ordering='data_retirada')
     def get_data_hora(self, obj):
@@ -471,7 +616,8 @@ class RetiradaAdmin(admin.ModelAdmin):
         return my_urls + urls
 
     def exportar_xml(self, request):
-        queryset = Retirada.objects.all()
+        # O histórico completo inclui as retiradas que já foram para o arquivo (mesmos IDs e campos)
+        queryset = chain(Retirada.objects.all(), arquivo.como_retiradas(RetiradaArquivada.objects.all()))
         data = serializers.serialize("xml", queryset)
         response = HttpResponse(data, content_type="application/xml")
         response['Content-Disposition'] = 'attachment; filename="retiradas_drogafoz.xml"'
@@ -481,7 +627,7 @@ class RetiradaAdmin(admin.ModelAdmin):
         retirada = get_object_or_404(Retirada, pk=object_id)
         if retirada.status == 'ATIVA':
             try:
-                with transaction.atomic():
+                with transaction.atomic(), eventos.lote():
                     # TRAVA DE CONCORRÊNCIA NO ROLLBACK: Garante segurança se dois caixas cancelarem ao mesmo tempo
                     retirada_lock = Retirada.objects.select_for_update().get(pk=retirada.pk)
                     if retirada_lock.status == 'ATIVA':
@@ -497,59 +643,26 @@ class RetiradaAdmin(admin.ModelAdmin):
                             
                         messages.success(request, f"Retirada #{retirada_lock.id} cancelada com sucesso. As encomendas voltaram ao stock e o recibo foi limpo.")
                         
-                        LogEntry.objects.log_action(
-                            user_id=request.user.id, 
-                            content_type_id=ContentType.objects.get_for_model(retirada_lock).pk,
-                            object_id=retirada_lock.pk, 
-                            object_repr=str(retirada_lock), 
-                            action_flag=CHANGE, 
-                            change_message=f"Rollback manual efetuado"
-                        )
+                        auditoria.registrar(request.user, retirada_lock, "Rollback manual efetuado")
             except Exception as e:
                 messages.error(request, f"Ação Revertida de forma atómica. Erro ao cancelar retirada: {e}")
         return HttpResponseRedirect(reverse('admin:entregas_retirada_changelist'))
 
     def change_view(self, request, object_id, form_url='', extra_context=None):
-        retirada = get_object_or_404(Retirada, pk=object_id)
-        encomendas = retirada.encomendas.all().select_related('cliente').order_by('cliente__nome', 'data_chegada')
-        
-        resumo_agrupado = {}
-        desconto_geral = 0.0
-        sugerido_geral = 0.0
-        
-        for enc in encomendas:
-            c_id = enc.cliente.id
-            if c_id not in resumo_agrupado:
-                resumo_agrupado[c_id] = {'cliente': enc.cliente, 'itens': [], 'subtotal': 0.0, 'sugerido': 0.0, 'desconto': 0.0}
-            
-            dias_estoque = (enc.data_entrega - enc.data_chegada).days if enc.data_entrega else 0
-            if dias_estoque < 0: dias_estoque = 0
-            enc.dias_estoque_calculado = dias_estoque
-            
-            # Cálculo do valor Sugerido/Esperado (Multiplicador de ciclos de 10 dias * Valor Base)
-            multiplicador = max(1, dias_estoque // 10)
-            enc.valor_sugerido = float(enc.valor_base) * multiplicador
-            
-            resumo_agrupado[c_id]['itens'].append(enc)
-            resumo_agrupado[c_id]['sugerido'] += enc.valor_sugerido
-            
-            if enc.valor_cobrado:
-                resumo_agrupado[c_id]['subtotal'] += float(enc.valor_cobrado)
-                
-        # Calcula o desconto final por cliente e os totais globais
-        for grupo in resumo_agrupado.values():
-            grupo['desconto'] = grupo['sugerido'] - grupo['subtotal']
-            # Evitar mostrar desconto negativo caso tenha sido cobrado a mais por algum motivo
-            if grupo['desconto'] < 0: 
-                grupo['desconto'] = 0.0
-            desconto_geral += grupo['desconto']
-            sugerido_geral += grupo['sugerido']
-                
+        # O recibo vem pronto da baixa (Retirada.recibo); só retiradas sem recibo gravado montam na hora
+        retirada = get_object_or_404(Retirada.objects.select_related('operador'), pk=object_id)
+        if retirada.recibo is None:
+            encomendas = retirada.encomendas.select_related('cliente')
+            retirada.recibo = recibos.montar(retirada.retirado_por, encomendas)
+        recibo = recibos.ler(retirada.recibo)
+
         extra_context = extra_context or {}
         extra_context['retirada'] = retirada
-        extra_context['resumo_agrupado'] = resumo_agrupado.values()
-        extra_context['desconto_geral'] = desconto_geral
-        extra_context['sugerido_geral'] = sugerido_geral
+        extra_context['retirante'] = recibo['retirado_por']
+        extra_context['resumo_agrupado'] = recibo['grupos']
+        extra_context['qtd_itens'] = recibo['qtd_itens']
+        extra_context['desconto_geral'] = recibo['desconto_geral']
+        extra_context['sugerido_geral'] = recibo['sugerido_geral']
         extra_context['show_save'] = False
         extra_context['show_save_and_continue'] = False
         extra_context['show_delete'] = False
@@ -557,7 +670,7 @@ class RetiradaAdmin(admin.ModelAdmin):
         return render(request, 'admin/visualizar_retirada.html', extra_context)
 
 # --- NOVO: FORMULÁRIO DE CLIENTE PARA LIMPAR CPF AUTOMATICAMENTE ---
-class ClienteAdminForm(forms.ModelForm):
+class ClienteAdminForm(VersaoFormMixin, forms.ModelForm):
     class Meta:
         model = Cliente
         fields = '__all__'
@@ -575,15 +688,31 @@ class ClienteAdminForm(forms.ModelForm):
         return cpf
 
 @admin.register(Cliente)
-class ClienteAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
+class ClienteAdmin(VersaoAdminMixin, BuscaSemAcentoMixin, admin.ModelAdmin):
     form = ClienteAdminForm # Aplica o formulário criado acima
     actions = None
     list_display = ('id', 'get_nome_status', 'cpf', 'rg', 'genero', 'telefone', 'telefone2', 'email')
-    search_fields = ('=id', 'nome', 'cpf', 'rg', 'observacao', 'telefone', 'telefone2', 'email')
+    search_fields = ('=id', 'nome', 'cpf', 'rg', 'observacao', 'email')
     list_per_page = 25
     list_max_show_all = 10000
     readonly_fields = ('id',)
-    fields = ('id', 'nome', 'observacao', 'cpf', 'rg', 'genero', 'telefone', 'telefone2', 'email')
+    fields = ('id', 'nome', 'observacao', 'cpf', 'rg', 'genero', 'telefone', 'telefone2', 'email', 'versao')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Telefones: busca pelos campos normalizados, aceitando qualquer formatação ("+55 (45) 99999-1234")
+        digitos = re.sub(r'\D', '', search_term)
+        if len(digitos) >= 8 and re.fullmatch(r'[\d\s()+./-]+', search_term.strip()):
+            # Número colado (telefone ou documento): só igualdades indexadas, sem os icontains da busca
+            # normal, que num OR obrigariam a varrer a tabela (mesmas regras de autocompletar._por_digitos)
+            qs = queryset.filter(cpf=digitos) | queryset.filter(rg=digitos) | queryset.por_telefone(digitos)
+            if len(digitos) <= 9:
+                qs |= queryset.filter(pk=int(digitos))
+            return qs, False
+
+        qs, use_distinct = super().get_search_results(request, queryset, search_term)
+        if len(digitos) >= 4 and re.fullmatch(r'[\d\s()+.-]+', search_term.strip()):
+            qs = qs | queryset.filter(Q(telefone_normalizado__contains=digitos) | Q(telefone2_normalizado__contains=digitos))
+        return qs, use_distinct
 
     def get_ordering(self, request):
         if request.resolver_match and request.resolver_match.url_name == 'autocomplete':
@@ -601,9 +730,23 @@ class ClienteAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
 
     def get_urls(self):
         urls = super().get_urls()
-        my_urls = [path('exportar-xml/', self.exportar_xml)]
+        my_urls = [
+            path('exportar-xml/', self.exportar_xml),
+            path('autocompletar/', self.admin_site.admin_view(self.autocompletar), name='entregas_cliente_autocompletar'),
+        ]
         return my_urls + urls
 
+    def autocompletar(self, request):
+        # Mesmo formato de resposta do autocomplete do admin (select2): {"results": [...], "pagination": {...}}
+        from django.http import JsonResponse
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            pagina = min(max(1, int(request.GET.get('page', 1))), 50)
+        except ValueError:
+            pagina = 1
+        return JsonResponse(autocompletar.buscar_em_cache(request.GET.get('term', ''), pagina))
+
     def exportar_xml(self, request):
         queryset = Cliente.objects.all()
         data = serializers.serialize("xml", queryset)
@@ -616,7 +759,8 @@ class ClienteAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
             # Trava de segurança: impede exclusão em cascata se o cliente tiver histórico
             tem_encomendas = Encomenda.objects.filter(cliente=obj).exists()
             tem_retiradas = Retirada.objects.filter(retirado_por=obj).exists()
-            if tem_encomendas or tem_retiradas:
+            tem_arquivo = obj.encomendas_arquivadas.exists() or obj.retiradas_arquivadas.exists()
+            if tem_encomendas or tem_retiradas or tem_arquivo:
                 return False
         return super().has_delete_permission(request, obj)
 
@@ -624,9 +768,11 @@ class ClienteAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 @admin.register(Encomenda)
-class EncomendaAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
+class EncomendaAdmin(VersaoAdminMixin, BuscaSemAcentoMixin, admin.ModelAdmin):
     form = EncomendaAdminForm
     show_facets = admin.ShowFacets.NEVER
+    # Evita um COUNT(*) da tabela inteira a cada carregamento da lista
+    show_full_result_count = False
     
     list_display = (
         'id', 'get_cliente_nome', 'get_descricao_fmt', 'get_remetente_fmt', 'get_observacao_fmt', 'get_status_fmt', 
@@ -635,6 +781,7 @@ class EncomendaAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
     )
     
     list_filter = (StatusFilter,) 
+    list_select_related = ('cliente',)
     search_fields = ('=id', 'cliente__nome', 'remetente', 'cliente__observacao', 'cliente__cpf')
     autocomplete_fields = ['cliente']
     actions = [marcar_entregue]
@@ -648,6 +795,17 @@ class EncomendaAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
         if obj and hasattr(obj, 'retirada_id') and obj.retirada_id:
             return False
         return super().has_delete_permission(request, obj)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'cliente':
+            kwargs['widget'] = ClienteAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def changelist_view(self, request, extra_context=None):
+        # Ponto de partida do fluxo de mudanças de estoque: o que acontecer depois desta leitura chega à tela
+        extra_context = extra_context or {}
+        extra_context['ultimo_evento'] = eventos.ultimo_id()
+        return super().changelist_view(request, extra_context)
     
     fieldsets = (
         ('Dados da Encomenda', {
@@ -663,7 +821,8 @@ class EncomendaAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
                 'valor_base', 
                 'valor_calculado', 
                 'valor_cobrado',
-                'retirada'
+                'retirada',
+                'versao',
             )
         }),
         ('Área de Controle (Zona de Perigo)', {
@@ -784,9 +943,110 @@ class EncomendaAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
         my_urls = [
             path('exportar-xml/', self.exportar_xml),
             path('api-anotacoes/', self.admin_site.admin_view(self.api_anotacoes), name='entregas_encomenda_api_anotacoes'),
+            path('chegada-em-lote/', self.admin_site.admin_view(self.chegada_em_lote), name='entregas_encomenda_chegada_lote'),
+            path('chegada-em-lote/api/', self.admin_site.admin_view(self.api_chegada_em_lote), name='entregas_encomenda_api_chegada_lote'),
+            path('remetentes/', self.admin_site.admin_view(self.sugerir_remetentes), name='entregas_encomenda_remetentes'),
+            path('palavras-chave/', self.admin_site.admin_view(self.sugerir_donos), name='entregas_encomenda_palavras_chave'),
         ]
         return my_urls + urls
 
+    def sugerir_donos(self, request):
+        # Clientes cujas palavras-chave aparecem na descrição, no remetente ou na observação digitados
+        from django.http import JsonResponse
+        textos = {campo: request.GET.get(campo, '')[:500] for campo in palavras_chave.CAMPOS}
+        return JsonResponse({'sugestoes': palavras_chave.sugerir(**textos)})
+
+    def sugerir_remetentes(self, request):
+        # Sugestões do índice em memória (entregas/remetentes.py): sem consulta ao banco
+        from django.http import JsonResponse
+        termo = request.GET.get('q', '')[:100]
+        return JsonResponse({'resultados': remetentes.sugerir(termo)})
+
+    # --- CHEGADA EM LOTE (TELA E API) ---
+    def _validar_lote(self, dados):
+        cabecalho = ChegadaLoteForm(dados)
+        formset = ChegadaLoteFormSet(dados, prefix='linhas')
+        if cabecalho.is_valid():
+            formset.data_chegada = cabecalho.cleaned_data['data_chegada']
+            formset.remetente_padrao = cabecalho.cleaned_data['remetente']
+        valido = cabecalho.is_valid() and formset.is_valid()
+        return cabecalho, formset, valido
+
+    def _registrar_lote(self, request, cabecalho, formset):
+        return chegadas.registrar(
+            request.user, cabecalho.cleaned_data['data_chegada'], formset.linhas(), cabecalho.cleaned_data['valor_base'],
+        )
+
+    def chegada_em_lote(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        if request.method == 'POST':
+            cabecalho, formset, valido = self._validar_lote(request.POST)
+            if valido:
+                try:
+                    encomendas = self._registrar_lote(request, cabecalho, formset)
+                except IntegrityError:
+                    # Outra tela gravou uma encomenda igual entre a validação e o INSERT: nada do lote foi salvo
+                    messages.error(request, "Uma das encomendas acabou de ser registrada em outra tela. Nada foi salvo; confira e envie de novo.")
+                else:
+                    messages.success(request, f"{len(encomendas)} encomenda(s) registrada(s) (#{encomendas[0].pk} a #{encomendas[-1].pk}).")
+                    return HttpResponseRedirect(reverse('admin:entregas_encomenda_changelist'))
+        else:
+            cabecalho = ChegadaLoteForm()
+            formset = ChegadaLoteFormSet(prefix='linhas')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Chegada em Lote',
+            'opts': self.model._meta,
+            'cabecalho': cabecalho,
+            'formset': formset,
+            'media': self.media + formset.media,
+        }
+        return render(request, 'admin/chegada_em_lote.html', context)
+
+    def api_chegada_em_lote(self, request):
+        # Mesmo lote em JSON: {"data_chegada", "remetente", "valor_base", "encomendas": [{"cliente", "descricao", "remetente", "observacao"}]}
+        from django.http import JsonResponse
+
+        if request.method != 'POST':
+            return JsonResponse({'status': 'error', 'erro': 'Use POST.'}, status=405)
+        if not self.has_add_permission(request):
+            return JsonResponse({'status': 'error', 'erro': 'Sem permissão para adicionar encomendas.'}, status=403)
+        try:
+            payload = json.loads(request.body)
+            linhas = payload.get('encomendas') or []
+            if not isinstance(linhas, list) or not all(isinstance(l, dict) for l in linhas):
+                raise ValueError
+        except (ValueError, AttributeError):
+            return JsonResponse({'status': 'error', 'erro': 'JSON inválido.'}, status=400)
+
+        dados = {
+            'data_chegada': payload.get('data_chegada') or '',
+            'remetente': payload.get('remetente') or '',
+            'valor_base': payload.get('valor_base', 10),
+            'linhas-TOTAL_FORMS': len(linhas),
+            'linhas-INITIAL_FORMS': 0,
+        }
+        for i, linha in enumerate(linhas):
+            for campo in ('cliente', 'descricao', 'remetente', 'observacao'):
+                dados[f'linhas-{i}-{campo}'] = linha.get(campo) or ''
+
+        cabecalho, formset, valido = self._validar_lote(dados)
+        if not valido:
+            erros = {
+                'lote': cabecalho.errors.get_json_data(),
+                'linhas': {i: form.errors.get_json_data() for i, form in enumerate(formset.forms) if form.errors},
+                'geral': list(formset.non_form_errors()),
+            }
+            return JsonResponse({'status': 'error', 'erros': erros}, status=400)
+        try:
+            encomendas = self._registrar_lote(request, cabecalho, formset)
+        except IntegrityError:
+            return JsonResponse({'status': 'error', 'erro': 'Uma das encomendas acabou de ser registrada em outra tela. Nada foi salvo.'}, status=409)
+        return JsonResponse({'status': 'ok', 'ids': [enc.pk for enc in encomendas]}, status=201)
+
     def api_anotacoes(self, request):
         from django.http import JsonResponse
         from django.utils.timezone import make_aware
@@ -824,8 +1084,79 @@ class EncomendaAdmin(BuscaSemAcentoMixin, admin.ModelAdmin):
         return JsonResponse({'status': 'error'}, status=400)
 
     def exportar_xml(self, request):
-        queryset = Encomenda.objects.all()
+        queryset = chain(Encomenda.objects.all(), arquivo.como_encomendas(EncomendaArquivada.objects.all()))
         data = serializers.serialize("xml", queryset, use_natural_foreign_keys=True)
         response = HttpResponse(data, content_type="application/xml")
         response['Content-Disposition'] = 'attachment; filename="encomendas_drogafoz.xml"'
-        return response
\ No newline at end of file
+        return response
+
+# --- ARQUIVO (SOMENTE LEITURA) ---
+class ArquivoSomenteLeituraMixin:
+    show_facets = admin.ShowFacets.NEVER
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(RetiradaArquivada)
+class RetiradaArquivadaAdmin(ArquivoSomenteLeituraMixin, admin.ModelAdmin):
+    list_display = ('id', 'retirado_por', 'data_retirada', 'valor_total', 'status', 'operador')
+    list_select_related = ('retirado_por', 'operador')
+    search_fields = ('=id', 'retirado_por__nome', 'retirado_por__cpf')
+
+@admin.register(EncomendaArquivada)
+class EncomendaArquivadaAdmin(ArquivoSomenteLeituraMixin, admin.ModelAdmin):
+    list_display = ('id', 'cliente', 'descricao', 'status', 'descartado', 'data_chegada', 'data_entrega', 'valor_cobrado', 'retirada_id')
+    list_select_related = ('cliente',)
+    search_fields = ('=id', 'cliente__nome', 'cliente__cpf', 'remetente')
+
+@admin.register(EncomendaExpurgada)
+class EncomendaExpurgadaAdmin(ArquivoSomenteLeituraMixin, admin.ModelAdmin):
+    list_display = ('id', 'cliente_id', 'descricao', 'data_chegada', 'expurgada_em')
+    search_fields = ('=id', '=cliente_id', 'descricao')
+
+# --- FILA DE TAREFAS ---
+@admin.action(description='Reenfileirar tarefas selecionadas (zera as tentativas)')
+def reenfileirar_tarefas(modeladmin, request, queryset):
+    qtd = queryset.exclude(status='EXECUTANDO').update(status='PENDENTE', tentativas=0, executar_apos=timezone.now(), concluida_em=None)
+    messages.success(request, f"{qtd} tarefa(s) de volta à fila.")
+
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'nome', 'status', 'tentativas', 'max_tentativas', 'executar_apos', 'iniciada_em', 'concluida_em', 'trabalhador')
+    list_filter = ('status', 'nome')
+    search_fields = ('=id', 'nome')
+    readonly_fields = ('nome', 'argumentos', 'status', 'executar_apos', 'tentativas', 'max_tentativas', 'criada_em', 'iniciada_em', 'concluida_em', 'trabalhador', 'resultado', 'erro')
+    actions = [reenfileirar_tarefas]
+    show_facets = admin.ShowFacets.NEVER
+
+    def has_add_permission(self, request):
+        # Tarefas são criadas pelo código (entregas.tarefas.enfileirar), com argumentos já validados
+        return False
+
+# --- NOTIFICAÇÕES (CAIXA DE SAÍDA) ---
+@admin.action(description='Enviar novamente (volta para a fila de envio)')
+def reenviar_notificacoes(modeladmin, request, queryset):
+    qtd = queryset.exclude(status__in=('PENDENTE', 'ENVIANDO')).update(status='PENDENTE', tentativas=0, erro='')
+    transaction.on_commit(notificacoes._agendar_envio)
+    messages.success(request, f"{qtd} notificação(ões) de volta à fila de envio.")
+
+@admin.register(Notificacao)
+class NotificacaoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'cliente', 'tipo', 'encomenda', 'status', 'tentativas', 'criada_em', 'enviada_em')
+    list_filter = ('status', 'tipo')
+    list_select_related = ('cliente', 'encomenda__cliente')
+    search_fields = ('=id', 'cliente__nome', 'cliente__cpf')
+    readonly_fields = ('cliente', 'encomenda', 'tipo', 'referencia', 'status', 'tentativas', 'criada_em', 'reservada_em', 'enviada_em', 'erro')
+    actions = [reenviar_notificacoes]
+    show_facets = admin.ShowFacets.NEVER
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class EntregasConfig(AppConfig):
     name = 'entregas'
+
+    def ready(self):
+        from . import metricas, signals  # noqa: F401
@@ -0,0 +1,125 @@
+import time
+
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q
+
+from .models import Encomenda, EncomendaArquivada, Retirada, RetiradaArquivada
+
+# --- ARQUIVO DE ENCOMENDAS (HISTÓRICO QUENTE x FRIO) ---
+# A tabela de encomendas é consultada o dia inteiro pelo balcão, mas a maior parte dela é histórico
+# que ninguém mais altera. O arquivamento move, em lotes com transações curtas, para as tabelas
+# RetiradaArquivada/EncomendaArquivada (mesmos IDs):
+#   - retiradas anteriores ao corte cujas encomendas foram TODAS entregues antes do corte (quitadas),
+#     junto com essas encomendas; retiradas canceladas (sem encomendas) também vão;
+#   - encomendas entregues sem retirada vinculada (baixas antigas) e descartadas que nunca saíram.
+# Pendentes nunca são arquivadas. Cada lote copia e apaga na mesma transação: ou o histórico
+# financeiro está numa tabela ou na outra, nunca em nenhuma.
+#
+# Relatórios e exportações juntam as duas tabelas quando o período pedido alcança o arquivo
+# (tabelas_de_encomendas); como tudo no arquivo é anterior ao último corte, períodos recentes
+# continuam lendo só a tabela quente.
+
+CAMPOS_RETIRADA = ('id', 'retirado_por_id', 'operador_id', 'data_retirada', 'valor_total', 'status', 'recibo')
+CAMPOS_ENCOMENDA = (
+    'id', 'cliente_id', 'descricao', 'remetente', 'observacao', 'data_chegada', 'data_entrega',
+    'valor_base', 'valor_calculado', 'valor_cobrado', 'status', 'descartado', 'retirada_id',
+)
+
+
+def retiradas_elegiveis(corte):
+    em_aberto = Encomenda.objects.filter(retirada=OuterRef('pk')).filter(
+        Q(data_entrega__gte=corte) | Q(data_entrega__isnull=True) | ~Q(status='ENTREGUE')
+    )
+    return Retirada.objects.filter(data_retirada__lt=corte).filter(~Exists(em_aberto))
+
+
+def encomendas_avulsas_elegiveis(corte):
+    return Encomenda.objects.filter(retirada__isnull=True).filter(
+        Q(status='ENTREGUE', data_entrega__lt=corte) | Q(status='PENDENTE', descartado=True, data_chegada__lt=corte)
+    )
+
+
+def mover_encomendas(encomendas):
+    EncomendaArquivada.objects.bulk_create([EncomendaArquivada(**e) for e in encomendas])
+    # Delete em lote (sem o Encomenda.delete(), que barra encomendas com retirada): a cópia acabou de ser gravada
+    Encomenda.objects.filter(pk__in=[e['id'] for e in encomendas]).delete()
+
+
+def arquivar_lote_retiradas(corte, tamanho):
+    # skip_locked: uma retirada sendo cancelada no balcão agora fica para o próximo lote
+    with transaction.atomic():
+        retiradas = list(
+            retiradas_elegiveis(corte).order_by('pk')
+            .select_for_update(skip_locked=True).values(*CAMPOS_RETIRADA)[:tamanho]
+        )
+        if not retiradas:
+            return 0, 0
+        ids = [r['id'] for r in retiradas]
+        encomendas = list(Encomenda.objects.select_for_update().filter(retirada_id__in=ids).order_by('pk').values(*CAMPOS_ENCOMENDA))
+
+        RetiradaArquivada.objects.bulk_create([RetiradaArquivada(**r) for r in retiradas])
+        mover_encomendas(encomendas)
+        Retirada.objects.filter(pk__in=ids).delete()
+    return len(retiradas), len(encomendas)
+
+
+def arquivar_lote_avulsas(corte, tamanho):
+    with transaction.atomic():
+        encomendas = list(
+            encomendas_avulsas_elegiveis(corte).order_by('pk')
+            .select_for_update(skip_locked=True).values(*CAMPOS_ENCOMENDA)[:tamanho]
+        )
+        if encomendas:
+            mover_encomendas(encomendas)
+    return len(encomendas)
+
+
+def arquivar(corte, tamanho_lote=500, pausa=0.0, ao_concluir_lote=None):
+    # Executa lotes até não sobrar nada elegível; a pausa entre lotes alivia o banco em horário de uso
+    totais = {'retiradas': 0, 'encomendas': 0}
+    while True:
+        retiradas, encomendas = arquivar_lote_retiradas(corte, tamanho_lote)
+        if not retiradas:
+            break
+        totais['retiradas'] += retiradas
+        totais['encomendas'] += encomendas
+        if ao_concluir_lote:
+            ao_concluir_lote(totais)
+        time.sleep(pausa)
+
+    while True:
+        encomendas = arquivar_lote_avulsas(corte, tamanho_lote)
+        if not encomendas:
+            break
+        totais['encomendas'] += encomendas
+        if ao_concluir_lote:
+            ao_concluir_lote(totais)
+        time.sleep(pausa)
+    return totais
+
+
+# --- LEITURA UNIFICADA (QUENTE + ARQUIVO) ---
+
+def limite_do_arquivo():
+    # Data mais recente guardada no arquivo (None se estiver vazio), lida pelos índices de data
+    datas = EncomendaArquivada.objects.aggregate(chegada=Max('data_chegada'), entrega=Max('data_entrega'))
+    return max((d for d in datas.values() if d is not None), default=None)
+
+
+def tabelas_de_encomendas(limite, inicio=None):
+    # Modelos a consultar para um período que começa em 'inicio' (None = todo o histórico).
+    # Os dois modelos têm os mesmos nomes de campos, então os mesmos filtros valem para ambos.
+    if limite is None or (inicio is not None and inicio > limite):
+        return [Encomenda]
+    return [Encomenda, EncomendaArquivada]
+
+
+def como_encomendas(queryset):
+    # Registros do arquivo como instâncias (não salvas) de Encomenda, para exportações no formato original
+    for valores in queryset.values(*CAMPOS_ENCOMENDA).iterator():
+        yield Encomenda(**valores)
+
+
+def como_retiradas(queryset):
+    for valores in queryset.values(*CAMPOS_RETIRADA).iterator():
+        yield Retirada(**valores)
@@ -0,0 +1,157 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry, ADDITION, CHANGE, DELETION
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# --- AUDITORIA EM LOTE ---
+# Os eventos de auditoria de uma operação (ex: a baixa de 20 encomendas) são acumulados em memória e
+# gravados com um único bulk_create DEPOIS do commit, fora da transação crítica que segura os locks.
+# Se a transação for desfeita, os eventos são descartados junto com ela.
+#
+# AUDITORIA_DESTINO escolhe onde os eventos são gravados:
+#   'logentry' -> django_admin_log (aparece no "Histórico" de cada objeto no admin)
+#   'tabela'   -> EventoAuditoria, tabela só de inserções particionada por mês (ver particoes_auditoria)
+#
+# Uso:
+#   with auditoria.lote():
+#       for enc in encomendas:
+#           ...
+#           auditoria.registrar(request.user, enc, "Baixado")
+
+ACOES = (ADDITION, CHANGE, DELETION)
+
+_local = threading.local()
+
+
+def _destino():
+    return getattr(settings, 'AUDITORIA_DESTINO', 'logentry')
+
+
+@contextmanager
+def lote():
+    # Lotes aninhados juntam os eventos no lote mais externo
+    if getattr(_local, 'eventos', None) is not None:
+        yield
+        return
+
+    _local.eventos = []
+    try:
+        yield
+        eventos = _local.eventos
+    finally:
+        _local.eventos = None
+
+    if eventos:
+        transaction.on_commit(lambda: gravar(eventos), robust=True)
+
+
+def registrar(usuario, objeto, mensagem, acao=CHANGE):
+    if acao not in ACOES:
+        raise ValueError(f"Ação de auditoria inválida: {acao!r}")
+
+    # A representação é tirada agora, com o objeto no estado em que foi auditado
+    evento = {
+        'data': timezone.now(),
+        'usuario_id': getattr(usuario, 'pk', None),
+        'usuario_nome': getattr(usuario, 'username', '') or '',
+        'content_type_id': ContentType.objects.get_for_model(objeto).pk,
+        'object_id': objeto.pk,
+        'object_repr': str(objeto)[:200],
+        'acao': acao,
+        'mensagem': mensagem,
+    }
+
+    eventos = getattr(_local, 'eventos', None)
+    if eventos is not None:
+        eventos.append(evento)
+    else:
+        transaction.on_commit(lambda: gravar([evento]), robust=True)
+
+
+def gravar(eventos):
+    # Chamado pelo on_commit(robust=True): uma falha aqui é registrada no log do Django
+    # sem desfazer nem derrubar a operação que já foi confirmada
+    if _destino() == 'tabela':
+        from .models import EventoAuditoria
+        EventoAuditoria.objects.bulk_create([EventoAuditoria(**e) for e in eventos])
+        return
+
+    # O django_admin_log exige um usuário: eventos sem operador só vão para a tabela própria
+    LogEntry.objects.bulk_create([
+        LogEntry(
+            action_time=e['data'],
+            user_id=e['usuario_id'],
+            content_type_id=e['content_type_id'],
+            object_id=str(e['object_id']),
+            object_repr=e['object_repr'],
+            action_flag=e['acao'],
+            change_message=e['mensagem'],
+        )
+        for e in eventos if e['usuario_id'] is not None
+    ])
+
+
+# --- CONSULTA ---
+# Mesmo formato de resultado para os dois destinos (dicionários com data, usuario_id, content_type_id,
+# object_id, object_repr, acao e mensagem), do mais recente para o mais antigo. Na tabela própria o
+# filtro por período só lê as partições dos meses envolvidos, e objeto/operador usam os índices
+# (content_type, object_id, data) e (usuario, data).
+
+def eventos(objeto=None, operador=None, inicio=None, fim=None):
+    if _destino() == 'tabela':
+        from .models import EventoAuditoria
+        qs = EventoAuditoria.objects.values(
+            'data', 'usuario_id', 'usuario_nome', 'content_type_id', 'object_id', 'object_repr', 'acao', 'mensagem',
+        )
+        campo_data, campo_usuario = 'data', 'usuario_id'
+    else:
+        qs = LogEntry.objects.values(
+            'content_type_id', 'object_id', 'object_repr',
+            data=F('action_time'), usuario_id=F('user_id'), usuario_nome=F('user__username'),
+            acao=F('action_flag'), mensagem=F('change_message'),
+        )
+        campo_data, campo_usuario = 'action_time', 'user_id'
+
+    if objeto is not None:
+        object_id = objeto.pk if _destino() == 'tabela' else str(objeto.pk)
+        qs = qs.filter(content_type_id=ContentType.objects.get_for_model(objeto).pk, object_id=object_id)
+    if operador is not None:
+        qs = qs.filter(**{campo_usuario: getattr(operador, 'pk', operador)})
+    if inicio is not None:
+        qs = qs.filter(**{f'{campo_data}__gte': inicio})
+    if fim is not None:
+        qs = qs.filter(**{f'{campo_data}__lt': fim})
+    return qs.order_by(f'-{campo_data}')
+
+
+# --- PARTIÇÕES MENSAIS (PostgreSQL) ---
+
+def _inicio_mes(ano, mes):
+    return datetime(ano + (mes - 1) // 12, (mes - 1) % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def criar_particoes(a_partir_de, meses):
+    # Cria (se ainda não existirem) as partições de 'meses' meses a partir do mês de 'a_partir_de'.
+    # Linhas de meses sem partição caem na partição padrão, que precisa ficar vazia para que a
+    # partição do mês possa ser criada depois: rode o comando antes da virada do mês.
+    criadas = []
+    with connection.cursor() as cursor:
+        for i in range(meses):
+            inicio = _inicio_mes(a_partir_de.year, a_partir_de.month + i)
+            fim = _inicio_mes(inicio.year, inicio.month + 1)
+            nome = f"entregas_eventoauditoria_p{inicio:%Y_%m}"
+            cursor.execute("SELECT to_regclass(%s)", [nome])
+            if cursor.fetchone()[0] is not None:
+                continue
+            cursor.execute(
+                f"CREATE TABLE {nome} PARTITION OF entregas_eventoauditoria "
+                f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+            )
+            criadas.append(nome)
+    return criadas
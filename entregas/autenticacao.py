@@ -0,0 +1,73 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+# --- USUÁRIO E PERMISSÕES EM CACHE ---
+# Toda requisição do admin busca o usuário logado (e, para quem não é superusuário, as permissões)
+# no banco. Este backend guarda o usuário e o conjunto de permissões no cache por alguns minutos.
+#
+# Invalidação (entregas/signals.py): salvar ou apagar o usuário (troca de senha, is_active, is_staff,
+# last_login), sair do sistema, ou mudar grupos/permissões limpa as entradas. Com o cache 'locmem'
+# cada worker tem o seu cache, então os demais só enxergam a mudança quando AUTH_CACHE_TIMEOUT
+# expira; com 'file' ou 'db' a invalidação vale para todos imediatamente.
+
+PREFIXO = 'auth:v1'
+
+
+def _cache():
+    return caches[getattr(settings, 'AUTH_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_CACHE_TIMEOUT', 300)
+
+
+def _chave_usuario(user_id):
+    return f"{PREFIXO}:usuario:{user_id}"
+
+
+def _chave_permissoes(user_id, versao):
+    return f"{PREFIXO}:permissoes:{user_id}:{versao}"
+
+
+def _versao_permissoes():
+    # Mudanças nas permissões de um grupo afetam vários usuários: troca a versão de todos de uma vez
+    versao = _cache().get(f"{PREFIXO}:versao_permissoes")
+    if versao is None:
+        versao = uuid.uuid4().hex
+        _cache().add(f"{PREFIXO}:versao_permissoes", versao, timeout=None)
+        versao = _cache().get(f"{PREFIXO}:versao_permissoes", versao)
+    return versao
+
+
+def invalidar_usuario(user_id):
+    _cache().delete_many([_chave_usuario(user_id), _chave_permissoes(user_id, _versao_permissoes())])
+
+
+def invalidar_permissoes():
+    _cache().set(f"{PREFIXO}:versao_permissoes", uuid.uuid4().hex, timeout=None)
+
+
+class BackendUsuarioEmCache(ModelBackend):
+    def get_user(self, user_id):
+        chave = _chave_usuario(user_id)
+        usuario = _cache().get(chave)
+        if usuario is None:
+            usuario = super().get_user(user_id)
+            if usuario is not None:
+                _cache().set(chave, usuario, timeout=_timeout())
+        return usuario if usuario is not None and self.user_can_authenticate(usuario) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return super().get_all_permissions(user_obj, obj)
+        if not hasattr(user_obj, '_perm_cache'):
+            chave = _chave_permissoes(user_obj.pk, _versao_permissoes())
+            permissoes = _cache().get(chave)
+            if permissoes is None:
+                permissoes = super().get_all_permissions(user_obj)
+                _cache().set(chave, permissoes, timeout=_timeout())
+            user_obj._perm_cache = permissoes
+        return user_obj._perm_cache
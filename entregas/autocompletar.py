@@ -0,0 +1,120 @@
+import hashlib
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+
+from .models import Cliente, normalizar_texto
+
+# --- AUTOCOMPLETE DE CLIENTES (BALCÃO) ---
+# A busca de cliente dos campos "cliente" (encomenda, chegada em lote) e "retirante" (baixa) é a
+# requisição mais frequente do balcão. O autocomplete genérico do admin roda a busca inteira do
+# ClienteAdmin (vários icontains com unaccent) e monta o __str__ de cada objeto; este é dedicado:
+#   - só dígitos (CPF, RG, código, telefone em qualquer formato): igualdade nos documentos e no
+#     código, e a busca reversa de telefone (ClienteQuerySet.por_telefone);
+#   - texto: primeiro os nomes que começam pelo termo (índice cliente_nome_norm_idx sobre o nome
+#     normalizado), depois os que têm todas as palavras do termo como início de alguma palavra do
+#     nome ("silva maria" acha "Maria da Silva"); com a extensão pg_trgm instalada, quando nada casar,
+#     os nomes parecidos por trigramas (erros de digitação);
+#   - devolve só id e texto, lendo só as colunas do texto.
+# O resultado fica em cache por AUTOCOMPLETAR_CACHE_TIMEOUT segundos; qualquer alteração de cliente
+# troca a geração e as respostas antigas deixam de valer.
+
+PREFIXO = 'autocompletar_clientes:v1'
+POR_PAGINA = 20
+CAMPOS = ('pk', 'nome', 'observacao', 'cpf')
+
+_trigramas = None
+
+
+def invalidar():
+    cache.set(f"{PREFIXO}:geracao", uuid.uuid4().hex, timeout=None)
+
+
+def _geracao():
+    chave = f"{PREFIXO}:geracao"
+    geracao = cache.get(chave)
+    if geracao is None:
+        cache.add(chave, uuid.uuid4().hex, timeout=None)
+        geracao = cache.get(chave)
+    return geracao
+
+
+def tem_trigramas():
+    global _trigramas
+    if _trigramas is None:
+        if connection.vendor != 'postgresql':
+            _trigramas = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trigramas = cursor.fetchone() is not None
+    return _trigramas
+
+
+def rotulo(pk, nome, observacao, cpf):
+    # Mesmo texto do Cliente.__str__, sem montar o objeto
+    texto = f"#{pk} - {nome}"
+    if observacao:
+        texto = f"{texto} ({observacao})"
+    return f"{texto} ({cpf})" if cpf else texto
+
+
+def _por_digitos(digitos, limite):
+    candidatos = Cliente.objects.filter(cpf=digitos) | Cliente.objects.filter(rg=digitos)
+    if len(digitos) <= 9:
+        candidatos |= Cliente.objects.filter(pk=int(digitos))
+    if len(digitos) >= 8:
+        candidatos |= Cliente.objects.por_telefone(digitos)
+    return list(candidatos.order_by('nome_normalizado', 'pk').values_list(*CAMPOS)[:limite])
+
+
+def _por_nome(normalizado, limite):
+    clientes = Cliente.objects.order_by('nome_normalizado', 'pk')
+    linhas = list(clientes.filter(nome_normalizado__startswith=normalizado).values_list(*CAMPOS)[:limite])
+    if len(linhas) < limite:
+        por_palavras = clientes.exclude(nome_normalizado__startswith=normalizado)
+        for palavra in normalizado.split():
+            por_palavras = por_palavras.filter(Q(nome_normalizado__startswith=palavra) | Q(nome_normalizado__contains=f" {palavra}"))
+        linhas += por_palavras.values_list(*CAMPOS)[:limite - len(linhas)]
+    if not linhas and len(normalizado) >= 3 and tem_trigramas():
+        from django.contrib.postgres.search import TrigramSimilarity
+        linhas = list(
+            Cliente.objects.annotate(similaridade=TrigramSimilarity('nome_normalizado', normalizado))
+            .filter(nome_normalizado__trigram_similar=normalizado)
+            .order_by('-similaridade', 'pk').values_list(*CAMPOS)[:limite]
+        )
+    return linhas
+
+
+def buscar(termo, pagina=1):
+    termo = termo.strip()[:100]
+    limite = pagina * POR_PAGINA + 1
+    digitos = re.sub(r'\D', '', termo)
+
+    if not termo:
+        linhas = list(Cliente.objects.order_by('-pk').values_list(*CAMPOS)[:limite])
+    elif digitos and re.fullmatch(r'[\d\s().+/-]+', termo):
+        linhas = _por_digitos(digitos, limite)
+    else:
+        normalizado = normalizar_texto(termo)
+        linhas = _por_nome(normalizado, limite) if normalizado else []
+
+    inicio = (pagina - 1) * POR_PAGINA
+    return {
+        'results': [{'id': str(l[0]), 'text': rotulo(*l)} for l in linhas[inicio:inicio + POR_PAGINA]],
+        'pagination': {'more': len(linhas) > inicio + POR_PAGINA},
+    }
+
+
+def buscar_em_cache(termo, pagina=1):
+    resumo = hashlib.md5(termo.strip().encode()).hexdigest()
+    chave = f"{PREFIXO}:{_geracao()}:{resumo}:{pagina}"
+    resposta = cache.get(chave)
+    if resposta is None:
+        resposta = buscar(termo, pagina)
+        cache.set(chave, resposta, timeout=settings.AUTOCOMPLETAR_CACHE_TIMEOUT)
+    return resposta
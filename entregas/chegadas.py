@@ -0,0 +1,47 @@
+from django.contrib.admin.models import ADDITION
+from django.db import transaction
+
+from . import auditoria, consultas, eventos, notificacoes, remetentes
+from .models import Encomenda
+
+# --- CHEGADA EM LOTE ---
+# Quando a transportadora deixa dezenas de volumes de uma vez, lançar um por um no formulário do admin
+# recarrega a página (e o autocomplete) a cada encomenda. Aqui o lote inteiro, com a mesma data de
+# chegada, é validado junto e gravado num único INSERT (bulk_create) dentro de uma transação:
+#   - a proteção contra duplicidade (cliente, descrição, data de chegada) é conferida dentro do próprio
+#     lote e contra o banco numa consulta só (ver duplicadas_no_banco);
+#   - o bulk_create não dispara post_save, então os efeitos dos sinais de uma encomenda nova (cache da
+#     consulta pública, aviso de chegada, evento de estoque, sugestão de remetentes) e a auditoria são
+#     feitos aqui, em lote.
+
+
+def duplicadas_no_banco(data_chegada, linhas):
+    # Pares (cliente, descrição) do lote que já existem com a mesma data de chegada
+    if not linhas:
+        return set()
+    existentes = Encomenda.objects.filter(
+        data_chegada=data_chegada,
+        cliente_id__in={l['cliente'].pk for l in linhas},
+        descricao__in={l['descricao'] for l in linhas},
+    ).order_by().values_list('cliente_id', 'descricao')
+    return set(existentes)
+
+
+def registrar(usuario, data_chegada, linhas, valor_base):
+    # 'linhas': dicionários já validados com cliente (instância), descricao, remetente e observacao
+    novas = [
+        Encomenda(
+            cliente=l['cliente'], descricao=l['descricao'], remetente=l['remetente'],
+            observacao=l.get('observacao') or None, data_chegada=data_chegada, valor_base=valor_base,
+        )
+        for l in linhas
+    ]
+    with transaction.atomic(), auditoria.lote():
+        encomendas = Encomenda.objects.bulk_create(novas)
+        for enc in encomendas:
+            auditoria.registrar(usuario, enc, "Registrada na chegada em lote", acao=ADDITION)
+        notificacoes.registrar_chegadas(encomendas)
+        eventos.publicar(encomendas, 'ADICIONADA')
+        remetentes.registrar([enc.remetente for enc in encomendas])
+        transaction.on_commit(lambda: consultas.invalidar_clientes(e.cliente_id for e in encomendas))
+    return encomendas
@@ -0,0 +1,109 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import FilteredRelation, Q
+from django.utils import timezone
+
+from .models import Cliente, calcular_cobranca
+
+# --- CONSULTA PÚBLICA POR DOCUMENTO (CPF/RG) ---
+# Uma única ida ao banco responde "o cliente existe?" e "quais encomendas estão pendentes",
+# e o resultado bruto fica em cache por documento. As taxas são recalculadas a cada leitura
+# (dependem do dia atual), então o cache nunca mostra um valor desatualizado.
+#
+# Invalidação: cada cliente tem uma "geração" no cache. Qualquer alteração nas encomendas
+# (ou no próprio cadastro) troca a geração e as entradas que dependiam dela deixam de valer,
+# sem precisar consultar o banco para descobrir o CPF/RG do cliente.
+
+PREFIXO = 'consulta_publica:v1'
+
+
+def _chave_documento(documento):
+    return f"{PREFIXO}:doc:{documento}"
+
+
+def _chave_geracao(cliente_id):
+    return f"{PREFIXO}:geracao:{cliente_id}"
+
+
+def invalidar_cliente(cliente_id):
+    cache.set(_chave_geracao(cliente_id), uuid.uuid4().hex, timeout=None)
+
+
+def invalidar_clientes(cliente_ids):
+    cache.set_many({_chave_geracao(c_id): uuid.uuid4().hex for c_id in set(cliente_ids)}, timeout=None)
+
+
+def invalidar_documentos(*documentos):
+    cache.delete_many([_chave_documento(d) for d in documentos if d])
+
+
+def _buscar_no_banco(documento):
+    # LEFT JOIN filtrado: devolve uma linha por encomenda pendente, ou uma única linha
+    # com campos nulos quando o cliente existe mas não tem nada aguardando retirada.
+    linhas = (
+        Cliente.objects
+        .filter(Q(cpf=documento) | Q(rg=documento))
+        .annotate(pendentes=FilteredRelation(
+            'encomenda',
+            condition=Q(encomenda__status='PENDENTE', encomenda__descartado=False),
+        ))
+        .order_by('-pendentes__data_chegada')
+        .values_list('id', 'pendentes__id', 'pendentes__data_chegada', 'pendentes__valor_base')
+    )
+
+    clientes = []
+    encomendas = []
+    for cliente_id, encomenda_id, data_chegada, valor_base in linhas:
+        if cliente_id not in clientes:
+            clientes.append(cliente_id)
+        if encomenda_id is not None:
+            encomendas.append({'id': encomenda_id, 'data_chegada': data_chegada, 'valor_base': valor_base})
+    return clientes, encomendas
+
+
+def _ler_do_cache(documento):
+    entrada = cache.get(_chave_documento(documento))
+    if entrada is None:
+        return None
+    geracoes = cache.get_many([_chave_geracao(c_id) for c_id in entrada['clientes']])
+    for c_id, geracao in entrada['geracoes'].items():
+        if geracoes.get(_chave_geracao(c_id)) != geracao:
+            return None
+    return entrada
+
+
+def buscar_pendentes(documento):
+    entrada = _ler_do_cache(documento)
+    if entrada is None:
+        clientes, encomendas = _buscar_no_banco(documento)
+        geracoes = cache.get_many([_chave_geracao(c_id) for c_id in clientes])
+        entrada = {
+            'clientes': clientes,
+            'geracoes': {c_id: geracoes.get(_chave_geracao(c_id)) for c_id in clientes},
+            'encomendas': encomendas,
+        }
+        cache.set(_chave_documento(documento), entrada, timeout=settings.CONSULTA_CACHE_TIMEOUT)
+
+    agora = timezone.now()
+    resultados = []
+    total_geral = 0.0
+    for enc in entrada['encomendas']:
+        dias_estoque, multiplicador, valor_final = calcular_cobranca(enc['data_chegada'], enc['valor_base'], agora)
+        resultados.append({
+            'id': enc['id'],
+            'data_chegada': enc['data_chegada'],
+            'valor_base': enc['valor_base'],
+            'dias_display': dias_estoque,
+            'valor_final_display': valor_final,
+            # Flag para destacar SOMENTE se ultrapassar 10 dias
+            'is_atrasado': dias_estoque > 19,
+        })
+        total_geral += valor_final
+
+    return {
+        'cliente_existe': bool(entrada['clientes']),
+        'resultados': resultados,
+        'total_geral': total_geral,
+    }
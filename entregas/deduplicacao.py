@@ -0,0 +1,191 @@
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F
+
+from . import auditoria, consultas
+from .models import Cliente, Encomenda, Retirada, AnotacaoCliente, EncomendaArquivada, Notificacao, RetiradaArquivada
+from .models import normalizar_texto
+
+# --- DETECÇÃO DE CLIENTES DUPLICADOS ---
+# Comparar todos com todos seria O(n²) (5 bilhões de pares com 100 mil clientes).
+# Em vez disso, cada cliente é colocado em "blocos" (nome normalizado, primeiro+último nome,
+# telefone, documento, e-mail) e só são comparados os clientes que caem no mesmo bloco.
+# Blocos gigantes (ex: "maria silva") são ignorados para manter o custo linear.
+
+MAX_BLOCO = 50
+LIMIAR_PADRAO = 0.85
+
+
+def apenas_digitos(texto):
+    return re.sub(r'\D', '', texto or '')
+
+
+class _Candidato:
+    __slots__ = ('id', 'nome', 'cpf', 'rg', 'telefones', 'email')
+
+    def __init__(self, id, nome, cpf, rg, telefone, telefone2, email):
+        self.id = id
+        self.nome = normalizar_texto(nome)
+        self.cpf = apenas_digitos(cpf)
+        self.rg = apenas_digitos(rg)
+        self.telefones = {t[-8:] for t in (apenas_digitos(telefone), apenas_digitos(telefone2)) if len(t) >= 8}
+        self.email = (email or '').strip().lower()
+
+    def chaves_bloco(self):
+        if self.nome:
+            yield f"nome:{self.nome}"
+            partes = self.nome.split()
+            if len(partes) > 1:
+                yield f"extremos:{partes[0]} {partes[-1]}"
+        for telefone in self.telefones:
+            yield f"tel:{telefone}"
+        for documento in {self.cpf, self.rg} - {''}:
+            yield f"doc:{documento}"
+        if self.email:
+            yield f"email:{self.email}"
+
+
+def pontuar(a, b):
+    # Documentos diferentes do mesmo tipo = pessoas diferentes (homônimos)
+    if (a.cpf and b.cpf and a.cpf != b.cpf) or (a.rg and b.rg and a.rg != b.rg):
+        return 0.0
+
+    documentos_a = {a.cpf, a.rg} - {''}
+    documentos_b = {b.cpf, b.rg} - {''}
+    if documentos_a & documentos_b:
+        return 1.0
+
+    comparador = SequenceMatcher(None, a.nome, b.nome)
+    if comparador.real_quick_ratio() < 0.6:
+        return 0.0
+    score = comparador.ratio()
+
+    if a.telefones & b.telefones:
+        score += 0.1
+    if a.email and a.email == b.email:
+        score += 0.1
+    return min(score, 1.0)
+
+
+def encontrar_duplicados(limiar=LIMIAR_PADRAO, max_bloco=MAX_BLOCO, queryset=None):
+    queryset = queryset if queryset is not None else Cliente.objects.all()
+    campos = ('id', 'nome', 'cpf', 'rg', 'telefone', 'telefone2', 'email')
+
+    candidatos = {}
+    blocos = defaultdict(list)
+    for linha in queryset.order_by().values_list(*campos).iterator(chunk_size=2000):
+        candidato = _Candidato(*linha)
+        candidatos[candidato.id] = candidato
+        for chave in candidato.chaves_bloco():
+            blocos[chave].append(candidato.id)
+
+    # Union-Find: pares aprovados viram grupos (A~B e B~C => {A, B, C})
+    pai = {}
+
+    def raiz(x):
+        while pai.get(x, x) != x:
+            pai[x] = pai.get(pai[x], pai[x])
+            x = pai[x]
+        return x
+
+    pontuacoes = {}
+    comparados = set()
+    for ids in blocos.values():
+        if len(ids) < 2 or len(ids) > max_bloco:
+            continue
+        for i, id_a in enumerate(ids):
+            for id_b in ids[i + 1:]:
+                par = (id_a, id_b) if id_a < id_b else (id_b, id_a)
+                if par in comparados:
+                    continue
+                comparados.add(par)
+                score = pontuar(candidatos[par[0]], candidatos[par[1]])
+                if score >= limiar:
+                    pontuacoes[par] = score
+                    pai[raiz(par[1])] = raiz(par[0])
+
+    grupos = defaultdict(set)
+    menor_score = {}
+    for (id_a, id_b), score in pontuacoes.items():
+        r = raiz(id_a)
+        grupos[r].update((id_a, id_b))
+        menor_score[r] = min(score, menor_score.get(r, 1.0))
+
+    resultado = [
+        {'clientes': sorted(membros), 'score': round(menor_score[r], 3)}
+        for r, membros in grupos.items()
+    ]
+    resultado.sort(key=lambda g: (-g['score'], g['clientes'][0]))
+    return resultado
+
+
+# --- MESCLAGEM DE CLIENTES ---
+CAMPOS_COMPLEMENTARES = ('cpf', 'rg', 'genero', 'telefone', 'telefone2', 'email', 'observacao')
+
+
+def mesclar_clientes(principal_id, duplicados_ids, usuario=None):
+    # Move TODO o histórico dos duplicados para o cliente principal com UPDATEs em lote
+    # (encomendas, retiradas e anotações, inclusive as do arquivo) e apaga os duplicados, tudo numa única transação.
+    duplicados_ids = sorted({int(i) for i in duplicados_ids} - {int(principal_id)})
+    if not duplicados_ids:
+        raise ValidationError("Informe ao menos um cliente duplicado diferente do principal.")
+    todos_ids = [int(principal_id)] + duplicados_ids
+
+    with transaction.atomic():
+        clientes = {c.pk: c for c in Cliente.objects.select_for_update().filter(pk__in=todos_ids)}
+        faltando = set(todos_ids) - set(clientes)
+        if faltando:
+            raise ValidationError(f"Clientes não encontrados: {sorted(faltando)}")
+        principal = clientes[int(principal_id)]
+        duplicados = [clientes[i] for i in duplicados_ids]
+
+        cpfs = {c.cpf for c in clientes.values() if c.cpf}
+        if len(cpfs) > 1:
+            raise ValidationError("Os clientes possuem CPFs diferentes e não podem ser mesclados.")
+        # O RG também identifica o cliente na consulta pública: mesclar descartaria o RG dos duplicados
+        rgs = {c.rg for c in clientes.values() if c.rg}
+        if len(rgs) > 1:
+            raise ValidationError("Os clientes possuem RGs diferentes e não podem ser mesclados.")
+
+        # Proteção contra duplicidade exata (unique_together) depois da mesclagem
+        conflitos = (
+            Encomenda.objects.filter(cliente_id__in=todos_ids)
+            .values('descricao', 'data_chegada')
+            .annotate(qtd=Count('id'))
+            .filter(qtd__gt=1)
+        )
+        if conflitos.exists():
+            raise ValidationError("Existem encomendas idênticas (mesma descrição e data de chegada) entre os clientes. Corrija-as antes de mesclar.")
+
+        movidas = {
+            # versao + 1: um formulário aberto com a encomenda ainda no cliente antigo não a devolve para ele
+            'encomendas': Encomenda.objects.filter(cliente_id__in=duplicados_ids).update(cliente_id=principal.pk, versao=F('versao') + 1),
+            'retiradas': Retirada.objects.filter(retirado_por_id__in=duplicados_ids).update(retirado_por_id=principal.pk),
+            'anotacoes': AnotacaoCliente.objects.filter(cliente_id__in=duplicados_ids).update(cliente_id=principal.pk),
+            'encomendas_arquivadas': EncomendaArquivada.objects.filter(cliente_id__in=duplicados_ids).update(cliente_id=principal.pk),
+            'retiradas_arquivadas': RetiradaArquivada.objects.filter(retirado_por_id__in=duplicados_ids).update(retirado_por_id=principal.pk),
+            'notificacoes': Notificacao.objects.filter(cliente_id__in=duplicados_ids).update(cliente_id=principal.pk),
+        }
+
+        # Completa os dados que faltam no principal com os dos duplicados
+        for campo in CAMPOS_COMPLEMENTARES:
+            if not getattr(principal, campo):
+                for duplicado in duplicados:
+                    if getattr(duplicado, campo):
+                        setattr(principal, campo, getattr(duplicado, campo))
+                        break
+
+        # Os duplicados saem antes de salvar o principal (o CPF é único no banco)
+        Cliente.objects.filter(pk__in=duplicados_ids).delete()
+        principal.save()
+
+        if usuario is not None:
+            auditoria.registrar(usuario, principal, f"Mesclado com os clientes {', '.join(f'#{i}' for i in duplicados_ids)}")
+
+        transaction.on_commit(lambda: consultas.invalidar_clientes(todos_ids))
+
+    return principal, movidas
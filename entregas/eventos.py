@@ -0,0 +1,212 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import tarefas
+from .models import EventoEstoque
+
+# --- MUDANÇAS DE ESTOQUE AO VIVO (SERVER-SENT EVENTS) ---
+# Com vários caixas abertos, uma tela descobre que a encomenda já saiu em outro caixa só ao recarregar
+# a lista inteira (ou no rollback do "já foi entregue em outro caixa"). Cada mudança de estoque
+# (ADICIONADA, ENTREGUE, CANCELADA, DESCARTADA) vira um evento compacto {id, tipo, encomenda, cliente}:
+#   - gravado em EventoEstoque depois do commit (transação desfeita não gera evento), com ids na
+#     ordem dos commits; quem altera várias encomendas numa transação (baixa, cancelamento) junta os
+#     eventos com eventos.lote() numa gravação só;
+#   - entregue na hora às telas ligadas a este mesmo processo pelo corretor em memória;
+#   - lido do banco a cada EVENTOS_INTERVALO segundos por cada fluxo aberto, o que cobre as mudanças
+#     feitas em outros processos/servidores (e o caso de o corretor perder eventos por fila cheia).
+# O fluxo (views.fluxo_eventos) precisa de servidor ASGI para ficar aberto; sob WSGI ele responde só o
+# que já existe no banco e pede ao navegador que reconecte, o que vira uma consulta periódica.
+
+class Corretor:
+    # Distribui eventos às filas asyncio dos fluxos abertos neste processo. Quem publica roda em
+    # threads (views síncronas), por isso a entrega passa por call_soon_threadsafe do loop de cada fila.
+    def __init__(self):
+        self._assinantes = set()
+        self._trava = threading.Lock()
+
+    def assinar(self):
+        fila = asyncio.Queue(maxsize=500)
+        with self._trava:
+            self._assinantes.add((asyncio.get_running_loop(), fila))
+        return fila
+
+    def cancelar(self, fila):
+        with self._trava:
+            self._assinantes = {a for a in self._assinantes if a[1] is not fila}
+
+    def publicar(self, eventos):
+        with self._trava:
+            assinantes = list(self._assinantes)
+        for loop, fila in assinantes:
+            try:
+                loop.call_soon_threadsafe(_entregar, fila, eventos)
+            except RuntimeError:
+                # Loop já encerrado: o fluxo vai sair e cancelar a assinatura
+                pass
+
+
+def _entregar(fila, eventos):
+    for evento in eventos:
+        try:
+            fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Tela lenta: o que sobrar chega pela leitura do banco
+            return
+
+
+corretor = Corretor()
+
+
+# --- PUBLICAÇÃO ---
+
+def tipo_da_mudanca(encomenda, criada):
+    # Compara com a fotografia tirada ao carregar do banco (ainda a de antes, durante o post_save)
+    if criada:
+        return None if encomenda.descartado else 'ADICIONADA'
+    antes = getattr(encomenda, '_fotografia', None)
+    if not antes or 'status' not in antes or 'descartado' not in antes:
+        return None
+    if encomenda.descartado and not antes['descartado']:
+        return 'DESCARTADA'
+    if antes['status'] != encomenda.status:
+        return 'ENTREGUE' if encomenda.status == 'ENTREGUE' else 'CANCELADA'
+    return None
+
+
+def _gravar(eventos):
+    # O id vem da sequência, que não segue a ordem dos commits: duas gravações simultâneas poderiam
+    # ficar visíveis com o id maior antes do menor, e a leitura "pk > último lido" pularia o menor.
+    # A trava (só entre gravações; a leitura não espera) faz a ordem dos ids ser a dos commits.
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {connection.ops.quote_name(EventoEstoque._meta.db_table)} IN EXCLUSIVE MODE")
+        criados = EventoEstoque.objects.bulk_create(eventos)
+    corretor.publicar([serializar(e) for e in criados])
+
+
+_local = threading.local()
+
+
+@contextmanager
+def lote():
+    # Junta os eventos do bloco (ex: a baixa de N encomendas, um save() por encomenda) numa única
+    # gravação depois do commit, em vez de uma transação com a trava da tabela por encomenda.
+    # Lotes aninhados juntam os eventos no lote mais externo.
+    if getattr(_local, 'eventos', None) is not None:
+        yield
+        return
+
+    _local.eventos = []
+    try:
+        yield
+        eventos = _local.eventos
+    finally:
+        _local.eventos = None
+
+    if eventos:
+        transaction.on_commit(lambda: _gravar(eventos), robust=True)
+
+
+def publicar(encomendas, tipo):
+    eventos = [EventoEstoque(tipo=tipo, encomenda_id=e.pk, cliente_id=e.cliente_id) for e in encomendas]
+    if not eventos:
+        return
+    pendentes = getattr(_local, 'eventos', None)
+    if pendentes is not None:
+        pendentes.extend(eventos)
+    else:
+        transaction.on_commit(lambda: _gravar(eventos), robust=True)
+
+
+def serializar(evento):
+    return {'id': evento.pk, 'tipo': evento.tipo, 'encomenda': evento.encomenda_id, 'cliente': evento.cliente_id}
+
+
+# --- LEITURA ---
+
+def ultimo_id():
+    return EventoEstoque.objects.aggregate(ultimo=Max('pk'))['ultimo'] or 0
+
+
+def eventos_desde(ultimo, limite=200):
+    return [serializar(e) for e in EventoEstoque.objects.filter(pk__gt=ultimo).order_by('pk')[:limite]]
+
+
+def _ler_e_fechar(ultimo):
+    # Leitura do fluxo, fora do ciclo da requisição (que já terminou): ninguém fecharia a conexão
+    try:
+        return eventos_desde(ultimo)
+    finally:
+        connection.close()
+
+
+def formatar(evento):
+    # Sem "id:": o Last-Event-ID do navegador só avança com a leitura do banco (ver fluxo)
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+
+
+def resposta_unica(ultimo):
+    # Fallback para WSGI: o que houver no banco e o pedido de reconexão (o "retry:" vira o intervalo da consulta)
+    eventos = eventos_desde(ultimo)
+    partes = [f"retry: {settings.EVENTOS_INTERVALO * 1000}\n\n"] + [formatar(e) for e in eventos]
+    if eventos:
+        partes.append(f"id: {eventos[-1]['id']}\n\n")
+    return ''.join(partes)
+
+
+async def fluxo(ultimo):
+    # Gerador do corpo text/event-stream. Eventos do corretor saem na hora; a leitura do banco, a cada
+    # EVENTOS_INTERVALO, manda o que faltou e então um "id:" com até onde leu. Assim o Last-Event-ID de
+    # uma reconexão nunca pula um evento de outro processo que ainda não tinha sido lido.
+    # Termina após EVENTOS_DURACAO_MAXIMA segundos: o navegador reconecta sozinho de onde parou.
+    fila = corretor.assinar()
+    vistos = set()
+    intervalo = settings.EVENTOS_INTERVALO
+    fim = time.monotonic() + settings.EVENTOS_DURACAO_MAXIMA
+    proxima_leitura = 0.0
+    try:
+        yield f"retry: {intervalo * 1000}\n\n"
+        while time.monotonic() < fim:
+            espera = proxima_leitura - time.monotonic()
+            if espera > 0:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), timeout=espera)
+                except asyncio.TimeoutError:
+                    continue
+                if evento['id'] not in vistos:
+                    vistos.add(evento['id'])
+                    yield formatar(evento)
+                continue
+
+            eventos = await sync_to_async(_ler_e_fechar)(ultimo)
+            proxima_leitura = time.monotonic() + intervalo
+            if not eventos:
+                yield ": ping\n\n"
+                continue
+            for evento in eventos:
+                if evento['id'] not in vistos:
+                    yield formatar(evento)
+            ultimo = eventos[-1]['id']
+            vistos = {i for i in vistos if i > ultimo}
+            yield f"id: {ultimo}\n\n"
+    finally:
+        corretor.cancelar(fila)
+
+
+# --- LIMPEZA (TAREFA PERIÓDICA DA FILA) ---
+
+@tarefas.registrar('limpar_eventos_estoque', proxima_execucao=lambda agora: agora + timedelta(hours=1))
+def limpar_eventos_estoque():
+    corte = timezone.now() - timedelta(hours=settings.EVENTOS_RETENCAO_HORAS)
+    return EventoEstoque.objects.filter(data__lt=corte).delete()[0]
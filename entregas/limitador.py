@@ -0,0 +1,197 @@
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+# --- LIMITADOR DE REQUISIÇÕES (TOKEN BUCKET) ---
+# Cada chave (IP do cliente ou documento consultado) tem um "balde" com N fichas.
+# Cada consulta gasta 1 ficha e o balde é reabastecido continuamente (N fichas por período).
+# Quando o balde está vazio a requisição é recusada antes do banco de dados (o balde por IP também
+# antes do reCAPTCHA; o por documento só depois dele).
+
+def interpretar_limite(valor):
+    # Formato "capacidade/segundos" (ex: "10/60" = 10 consultas a cada 60 segundos)
+    capacidade, periodo = str(valor).split('/', 1)
+    capacidade, periodo = int(capacidade), float(periodo)
+    if capacidade <= 0 or periodo <= 0:
+        raise ValueError(f"Limite inválido: {valor!r}")
+    return capacidade, periodo
+
+
+def _consumir(estado, capacidade, periodo, agora):
+    # Recalcula as fichas do balde desde o último acesso e tenta gastar uma.
+    # Retorna (novo_estado, permitido, segundos_para_proxima_ficha)
+    taxa = capacidade / periodo
+    if estado is None:
+        fichas = float(capacidade)
+    else:
+        fichas, ultimo = estado
+        fichas = min(float(capacidade), fichas + (agora - ultimo) * taxa)
+
+    if fichas >= 1:
+        return (fichas - 1, agora), True, 0
+    return (fichas, agora), False, (1 - fichas) / taxa
+
+
+class BackendMemoria:
+    # Baldes guardados no próprio processo (cada worker do gunicorn tem os seus).
+    # O dicionário fica em ordem de último acesso (cada consumo reinsere a chave no fim),
+    # então os primeiros itens são sempre os baldes parados há mais tempo.
+    MAX_CHAVES = 50000
+
+    def __init__(self):
+        self._baldes = {}
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def consumir(self, chave, capacidade, periodo):
+        agora = time.monotonic()
+        with self._lock:
+            if len(self._baldes) >= self.MAX_CHAVES:
+                self._podar(agora)
+            # Cada balde guarda o próprio período: IP e documento têm janelas diferentes
+            anterior = self._baldes.pop(chave, None)
+            estado, permitido, espera = _consumir(anterior and anterior[:2], capacidade, periodo, agora)
+            self._baldes[chave] = (*estado, periodo)
+        return permitido, espera
+
+    def _podar(self, agora):
+        # Remove baldes parados há mais que o seu período (já estariam cheios de novo); se ainda
+        # faltar espaço, descarta os mais antigos até sobrar 10% de folga
+        for chave in [c for c, (_, ultimo, periodo) in self._baldes.items() if agora - ultimo > periodo]:
+            del self._baldes[chave]
+        excedente = len(self._baldes) - int(self.MAX_CHAVES * 0.9)
+        for chave in list(itertools.islice(self._baldes, max(0, excedente))):
+            del self._baldes[chave]
+
+    def incrementar(self, contador):
+        with self._lock:
+            self._contadores[contador] = self._contadores.get(contador, 0) + 1
+
+    def contadores(self):
+        with self._lock:
+            return dict(self._contadores)
+
+    def limpar(self):
+        with self._lock:
+            self._baldes.clear()
+            self._contadores.clear()
+
+
+class BackendCache:
+    # Baldes guardados no cache do Django (compartilhado entre workers quando o cache
+    # configurado for 'file' ou 'db'). A leitura/escrita não é atômica: sob concorrência
+    # extrema o limite pode ser ultrapassado por poucas requisições, o que é aceitável aqui.
+    PREFIXO = 'limitador'
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def consumir(self, chave, capacidade, periodo):
+        chave_cache = f"{self.PREFIXO}:balde:{chave}"
+        agora = time.time()
+        estado, permitido, espera = _consumir(self.cache.get(chave_cache), capacidade, periodo, agora)
+        self.cache.set(chave_cache, estado, timeout=int(periodo) + 1)
+        return permitido, espera
+
+    def incrementar(self, contador):
+        chave_cache = f"{self.PREFIXO}:contador:{contador}"
+        if not self.cache.add(chave_cache, 1, timeout=None):
+            try:
+                self.cache.incr(chave_cache)
+            except ValueError:
+                self.cache.set(chave_cache, 1, timeout=None)
+        nomes = self._nomes()
+        if contador not in nomes:
+            self.cache.set(f"{self.PREFIXO}:contadores", nomes | {contador}, timeout=None)
+
+    def _nomes(self):
+        return set(self.cache.get(f"{self.PREFIXO}:contadores") or ())
+
+    def contadores(self):
+        nomes = self._nomes()
+        valores = self.cache.get_many([f"{self.PREFIXO}:contador:{n}" for n in nomes])
+        return {n: valores.get(f"{self.PREFIXO}:contador:{n}", 0) for n in nomes}
+
+    def limpar(self):
+        for nome in self._nomes():
+            self.cache.delete(f"{self.PREFIXO}:contador:{nome}")
+        self.cache.delete(f"{self.PREFIXO}:contadores")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                tipo = getattr(settings, 'LIMITADOR_BACKEND', 'memoria')
+                if tipo == 'cache':
+                    _backend = BackendCache(getattr(settings, 'LIMITADOR_CACHE_ALIAS', 'default'))
+                elif tipo == 'memoria':
+                    _backend = BackendMemoria()
+                else:
+                    raise ValueError(f"LIMITADOR_BACKEND desconhecido: {tipo!r}")
+    return _backend
+
+
+def ip_do_cliente(request):
+    # Atrás do proxy do Render o IP real é o último item do X-Forwarded-For
+    # (os anteriores podem ter sido forjados pelo próprio cliente).
+    if getattr(settings, 'LIMITADOR_CONFIAR_X_FORWARDED_FOR', False):
+        encaminhado = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if encaminhado:
+            return encaminhado.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '') or 'desconhecido'
+
+
+def verificar(escopo, chave, limite):
+    # Retorna 0 se a requisição pode seguir, ou os segundos de espera se foi bloqueada
+    if not getattr(settings, 'LIMITADOR_ATIVO', True):
+        return 0
+
+    capacidade, periodo = interpretar_limite(limite)
+    backend = get_backend()
+    permitido, espera = backend.consumir(f"{escopo}:{chave}", capacidade, periodo)
+
+    if permitido:
+        backend.incrementar(f"{escopo}.permitidas")
+        return 0
+
+    backend.incrementar(f"{escopo}.bloqueadas")
+    # Só o escopo: a chave é IP ou CPF/RG do cliente e não deve ir para os logs
+    logger.warning("Limite de requisições atingido (%s)", escopo)
+    return max(1, int(espera + 0.999))
+
+
+def verificar_consulta(request):
+    # TRAVA ANTI-RASPAGEM da consulta pública, por IP: antes do reCAPTCHA e do banco
+    return verificar('consulta_ip', ip_do_cliente(request), settings.LIMITE_CONSULTA_IP)
+
+
+def verificar_documento(documento):
+    # Por documento consultado: só DEPOIS do reCAPTCHA aprovado. Se gastasse a ficha antes, um script
+    # sem token válido, trocando de IP, manteria qualquer CPF/RG bloqueado para o próprio cliente.
+    return verificar('consulta_documento', documento, settings.LIMITE_CONSULTA_DOCUMENTO)
+
+
+def estatisticas():
+    return {
+        'backend': getattr(settings, 'LIMITADOR_BACKEND', 'memoria'),
+        'limite_ip': settings.LIMITE_CONSULTA_IP,
+        'limite_documento': settings.LIMITE_CONSULTA_DOCUMENTO,
+        'contadores': get_backend().contadores(),
+    }
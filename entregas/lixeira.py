@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import arquivo
+from .models import Encomenda, EncomendaExpurgada
+
+# --- LIMPEZA DA LIXEIRA ---
+# Encomendas descartadas que nunca foram retiradas ficam na tabela para sempre e entram em toda
+# contagem da lista de encomendas. Passado o prazo de retenção, elas são apagadas em lotes pequenos
+# (uma transação curta por lote), deixando uma "lápide" compacta em EncomendaExpurgada, ou movidas
+# para o arquivo de encomendas (entregas/arquivo.py) quando se quer manter o registro completo.
+#
+# Para não disputar a tabela com o balcão, a limpeza para ao entrar em LIXEIRA_HORARIO_BLOQUEADO
+# ("HH:MM-HH:MM", horário local; vazio desliga) e continua na próxima execução.
+
+CAMPOS_LAPIDE = ('id', 'cliente_id', 'descricao', 'data_chegada')
+
+
+def expurgaveis(corte):
+    return Encomenda.objects.filter(descartado=True, status='PENDENTE', retirada__isnull=True, data_chegada__lt=corte)
+
+
+def em_horario_bloqueado(agora=None):
+    faixa = getattr(settings, 'LIXEIRA_HORARIO_BLOQUEADO', '')
+    if not faixa:
+        return False
+    inicio, fim = (datetime.strptime(h.strip(), '%H:%M').time() for h in faixa.split('-', 1))
+    hora = timezone.localtime(agora).time()
+    # Faixas que passam da meia-noite (ex: "22:00-06:00") também valem
+    return inicio <= hora < fim if inicio <= fim else hora >= inicio or hora < fim
+
+
+def expurgar_lote(corte, tamanho, arquivar=False):
+    with transaction.atomic():
+        if arquivar:
+            encomendas = list(
+                expurgaveis(corte).order_by('pk').select_for_update(skip_locked=True).values(*arquivo.CAMPOS_ENCOMENDA)[:tamanho]
+            )
+            if encomendas:
+                arquivo.mover_encomendas(encomendas)
+            return len(encomendas)
+
+        encomendas = list(expurgaveis(corte).order_by('pk').select_for_update(skip_locked=True).values(*CAMPOS_LAPIDE)[:tamanho])
+        if encomendas:
+            EncomendaExpurgada.objects.bulk_create(
+                [EncomendaExpurgada(**e) for e in encomendas], ignore_conflicts=True,
+            )
+            Encomenda.objects.filter(pk__in=[e['id'] for e in encomendas]).delete()
+        return len(encomendas)
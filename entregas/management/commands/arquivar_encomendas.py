@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from entregas import arquivo
+from entregas.models import Encomenda, EncomendaArquivada, RetiradaArquivada
+
+
+class Command(BaseCommand):
+    help = 'Move retiradas quitadas e encomendas entregues/descartadas mais antigas que o prazo de retenção para o arquivo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.ARQUIVO_RETENCAO_DIAS, help='Idade mínima (em dias) do que vai para o arquivo.')
+        parser.add_argument('--lote', type=int, default=500, help='Retiradas (ou encomendas avulsas) por transação.')
+        parser.add_argument('--pausa', type=float, default=0.2, help='Segundos de espera entre lotes.')
+        parser.add_argument('--confirmar', action='store_true', help='Executa de fato. Sem esta opção apenas mostra o que seria arquivado.')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['lote'] < 1:
+            raise CommandError('--dias e --lote precisam ser maiores que zero.')
+        corte = timezone.now() - timedelta(days=options['dias'])
+        self.stdout.write(f"Corte: tudo que terminou antes de {timezone.localtime(corte):%d/%m/%Y %H:%M}")
+
+        if not options['confirmar']:
+            retiradas = arquivo.retiradas_elegiveis(corte)
+            avulsas = arquivo.encomendas_avulsas_elegiveis(corte).values('descartado').annotate(qtd=Count('id'))
+            por_tipo = {linha['descartado']: linha['qtd'] for linha in avulsas}
+            self.stdout.write(
+                f"  {retiradas.count()} retirada(s) quitada(s) com "
+                f"{Encomenda.objects.filter(retirada__in=retiradas).count()} encomenda(s)\n"
+                f"  {por_tipo.get(False, 0)} encomenda(s) entregue(s) sem retirada\n"
+                f"  {por_tipo.get(True, 0)} encomenda(s) descartada(s)\n"
+                f"Tabela de encomendas hoje: {Encomenda.objects.count()} | já no arquivo: {EncomendaArquivada.objects.count()} "
+                f"encomenda(s), {RetiradaArquivada.objects.count()} retirada(s)"
+            )
+            self.stdout.write(self.style.WARNING("Simulação apenas. Use --confirmar para arquivar."))
+            return
+
+        def progresso(totais):
+            self.stdout.write(f"  ... {totais['retiradas']} retirada(s), {totais['encomendas']} encomenda(s)")
+
+        totais = arquivo.arquivar(corte, tamanho_lote=options['lote'], pausa=options['pausa'], ao_concluir_lote=progresso)
+        self.stdout.write(self.style.SUCCESS(
+            f"Arquivadas {totais['retiradas']} retirada(s) e {totais['encomendas']} encomenda(s)."
+        ))
@@ -0,0 +1,73 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+# Cada "requisição" simulada dispara os mesmos sinais que o Django dispara numa requisição real
+# (request_started / request_finished), que são os pontos onde as conexões são verificadas,
+# reaproveitadas ou fechadas conforme CONN_MAX_AGE e CONN_HEALTH_CHECKS.
+MODOS = {
+    'sem_reuso': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+    'persistente': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': False},
+    'persistente_health_check': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+}
+
+
+class Command(BaseCommand):
+    help = 'Compara a latência por requisição abrindo uma conexão nova a cada vez x reaproveitando conexões.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=200)
+        parser.add_argument('--consultas', type=int, default=3, help='Consultas por requisição simulada.')
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--json', dest='arquivo_json', help='Salva os resultados neste arquivo JSON.')
+
+    def handle(self, *args, **options):
+        conexao = connections[options['database']]
+        originais = {chave: conexao.settings_dict.get(chave) for chave in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        resultados = {}
+
+        try:
+            for modo, ajustes in MODOS.items():
+                conexao.close()
+                conexao.settings_dict.update(ajustes)
+                resultados[modo] = self._medir(conexao, options['requisicoes'], options['consultas'])
+        finally:
+            conexao.close()
+            conexao.settings_dict.update(originais)
+
+        base = resultados['sem_reuso']['media_ms']
+        self.stdout.write(f"Banco: {conexao.vendor} ({conexao.settings_dict.get('HOST') or conexao.settings_dict.get('NAME')})")
+        for modo, r in resultados.items():
+            ganho = f" ({base / r['media_ms']:.1f}x mais rápido)" if modo != 'sem_reuso' and r['media_ms'] else ''
+            self.stdout.write(f"{modo:<26} média {r['media_ms']:.3f} ms | p95 {r['p95_ms']:.3f} ms | conexões abertas {r['conexoes_abertas']}{ganho}")
+
+        if options['arquivo_json']:
+            with open(options['arquivo_json'], 'w', encoding='utf-8') as arquivo:
+                json.dump({'vendor': conexao.vendor, 'resultados': resultados}, arquivo, indent=2)
+
+    def _medir(self, conexao, requisicoes, consultas):
+        tempos = []
+        conexoes_abertas = 0
+        for _ in range(requisicoes):
+            inicio = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            if conexao.connection is None:
+                conexoes_abertas += 1
+            with conexao.cursor() as cursor:
+                for _ in range(consultas):
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+            request_finished.send(sender=self.__class__)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+
+        tempos.sort()
+        return {
+            'media_ms': statistics.fmean(tempos),
+            'p50_ms': tempos[len(tempos) // 2],
+            'p95_ms': tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))],
+            'conexoes_abertas': conexoes_abertas,
+        }
@@ -0,0 +1,200 @@
+import json
+import statistics
+import time
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from entregas import consultas
+from entregas.models import AnotacaoCliente, Cliente, Encomenda, Retirada
+
+# --- BENCHMARK DOS FLUXOS PRINCIPAIS ---
+# Mede as telas mais usadas contra a base atual (de preferência gerada com "gerar_dados"):
+# tempo por requisição, quantidade de consultas SQL e tamanho da resposta. As requisições passam
+# pela pilha completa do Django (middlewares, admin, templates) via django.test.Client.
+# A baixa de encomendas roda dentro de uma transação desfeita no final, sem alterar a base.
+# O resultado vai para um JSON, que pode ser comparado com uma execução anterior (--comparar).
+
+
+class Command(BaseCommand):
+    help = 'Mede changelists, baixa de encomendas, relatório, consulta pública e exportações e grava o resultado em JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--cenarios', help='Lista separada por vírgulas (prefixos), ex: "changelist,consulta".')
+        parser.add_argument('--sem-exportacoes', action='store_true', help='Pula as exportações XML (pesadas em bases grandes).')
+        parser.add_argument('--json', dest='arquivo_json', default='benchmark_fluxos.json')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para comparar.')
+        parser.add_argument('--tolerancia', type=float, default=20.0, help='Piora percentual (tempo médio) considerada regressão.')
+
+    def handle(self, *args, **options):
+        usuario = self._usuario()
+        self.cliente_http = Client()
+        self.cliente_http.force_login(usuario)
+
+        cenarios = self._cenarios(options['sem_exportacoes'])
+        if options['cenarios']:
+            prefixos = [p.strip() for p in options['cenarios'].split(',') if p.strip()]
+            cenarios = {nome: c for nome, c in cenarios.items() if any(nome.startswith(p) for p in prefixos)}
+            if not cenarios:
+                raise CommandError('Nenhum cenário corresponde a --cenarios.')
+
+        resultados = {}
+        # Sem limitador de requisições, reCAPTCHA ou coleta de métricas interferindo nas medições
+        with override_settings(ALLOWED_HOSTS=['*'], LIMITADOR_ATIVO=False, METRICAS_ATIVAS=False), \
+                mock.patch('entregas.views.validar_recaptcha', return_value=True):
+            for nome, cenario in cenarios.items():
+                if cenario is None:
+                    self.stdout.write(self.style.WARNING(f"{nome:<32} ignorado (a base não tem dados para este cenário)"))
+                    continue
+                resultados[nome] = self._medir(cenario, options['repeticoes'])
+                r = resultados[nome]
+                self.stdout.write(
+                    f"{nome:<32} média {r['media_ms']:9.1f} ms | p50 {r['p50_ms']:9.1f} ms | máx {r['max_ms']:9.1f} ms "
+                    f"| {r['consultas']:4d} consultas | {r['bytes'] / 1024:9.1f} KB | HTTP {r['status']}"
+                )
+
+        relatorio = {
+            'gerado_em': timezone.now().isoformat(),
+            'banco': connection.vendor,
+            'volumes': {
+                'clientes': Cliente.objects.count(),
+                'encomendas': Encomenda.objects.count(),
+                'retiradas': Retirada.objects.count(),
+                'anotacoes': AnotacaoCliente.objects.count(),
+            },
+            'repeticoes': options['repeticoes'],
+            'cenarios': resultados,
+        }
+        with open(options['arquivo_json'], 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['arquivo_json']}"))
+
+        if options['comparar']:
+            self._comparar(options['comparar'], relatorio, options['tolerancia'])
+
+    def _usuario(self):
+        usuario, criado = User.objects.get_or_create(
+            username='benchmark', defaults={'is_staff': True, 'is_superuser': True},
+        )
+        if criado:
+            usuario.set_unusable_password()
+            usuario.save(update_fields=['password'])
+        return usuario
+
+    def _cenarios(self, sem_exportacoes):
+        http = self.cliente_http
+        pendentes_por_cliente = (
+            Encomenda.objects.filter(status='PENDENTE', descartado=False)
+            .values('cliente_id').annotate(qtd=Count('id')).filter(qtd__gte=2).order_by('-qtd')
+        )
+        grupo = pendentes_por_cliente.first()
+        selecionadas = list(
+            Encomenda.objects.filter(cliente_id=grupo['cliente_id'], status='PENDENTE', descartado=False)
+            .values_list('id', flat=True)[:5]
+        ) if grupo else []
+
+        documento = (
+            Cliente.objects.filter(encomenda__status='PENDENTE', encomenda__descartado=False)
+            .exclude(cpf=None).values_list('cpf', flat=True).first()
+        )
+        busca = Cliente.objects.values_list('nome', flat=True).first()
+
+        def acao_baixa():
+            dados = {
+                'action': 'marcar_entregue',
+                admin.helpers.ACTION_CHECKBOX_NAME: selecionadas,
+                'post': 'yes',
+                'retirante': grupo['cliente_id'],
+            }
+            dados.update({f'valor_{pk}': '10,00' for pk in selecionadas})
+            with transaction.atomic():
+                resposta = http.post('/admin/entregas/encomenda/', dados)
+                transaction.set_rollback(True)
+            return resposta
+
+        def consulta(cache_frio):
+            def executar():
+                if cache_frio:
+                    consultas.invalidar_documentos(documento)
+                return http.post('/consulta/', {'q': documento, 'g-recaptcha-response': 'benchmark'})
+            return executar
+
+        cenarios = {
+            'changelist_encomendas_pendentes': lambda: http.get('/admin/entregas/encomenda/'),
+            'changelist_encomendas_entregues': lambda: http.get('/admin/entregas/encomenda/?status=ENTREGUE'),
+            'changelist_encomendas_busca': (lambda: http.get('/admin/entregas/encomenda/', {'status': 'TODOS', 'q': busca})) if busca else None,
+            'changelist_clientes': lambda: http.get('/admin/entregas/cliente/'),
+            'changelist_retiradas': lambda: http.get('/admin/entregas/retirada/'),
+            'marcar_entregue_confirmacao': (lambda: http.post('/admin/entregas/encomenda/', {
+                'action': 'marcar_entregue', admin.helpers.ACTION_CHECKBOX_NAME: selecionadas,
+            })) if selecionadas else None,
+            'marcar_entregue_baixa': acao_baixa if selecionadas else None,
+            'relatorio_entregas_mes': lambda: http.get('/admin/relatorio/'),
+            'relatorio_entregas_historico': lambda: http.get('/admin/relatorio/', {'ignorar_periodo': 'on'}),
+            'consulta_publica_cache_frio': consulta(True) if documento else None,
+            'consulta_publica_cache_quente': consulta(False) if documento else None,
+        }
+        if not sem_exportacoes:
+            cenarios.update({
+                'exportar_clientes': lambda: http.get('/admin/entregas/cliente/exportar-xml/'),
+                'exportar_encomendas': lambda: http.get('/admin/entregas/encomenda/exportar-xml/'),
+                'exportar_retiradas': lambda: http.get('/admin/entregas/retirada/exportar-xml/'),
+            })
+        return cenarios
+
+    def _medir(self, cenario, repeticoes):
+        cenario()  # aquecimento (templates, caches e conexão)
+        tempos = []
+        for _ in range(repeticoes):
+            with CaptureQueriesContext(connection) as ctx:
+                inicio = time.perf_counter()
+                resposta = cenario()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+
+        tempos.sort()
+        tamanho = len(b''.join(resposta.streaming_content)) if resposta.streaming else len(resposta.content)
+        return {
+            'media_ms': statistics.fmean(tempos),
+            'p50_ms': statistics.median(tempos),
+            'min_ms': tempos[0],
+            'max_ms': tempos[-1],
+            'consultas': len(ctx.captured_queries),
+            'bytes': tamanho,
+            'status': resposta.status_code,
+        }
+
+    def _comparar(self, caminho, atual, tolerancia):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Não foi possível ler {caminho}: {e}")
+
+        self.stdout.write(f"\nComparação com {caminho} ({anterior.get('gerado_em', '?')}):")
+        regressoes = []
+        for nome, r in atual['cenarios'].items():
+            antes = anterior.get('cenarios', {}).get(nome)
+            if not antes or not antes.get('media_ms'):
+                continue
+            variacao = (r['media_ms'] - antes['media_ms']) / antes['media_ms'] * 100
+            consultas_antes = antes.get('consultas', r['consultas'])
+            linha = (
+                f"{nome:<32} {antes['media_ms']:9.1f} -> {r['media_ms']:9.1f} ms ({variacao:+.0f}%) "
+                f"| consultas {consultas_antes} -> {r['consultas']}"
+            )
+            if variacao > tolerancia or r['consultas'] > consultas_antes:
+                regressoes.append(nome)
+                self.stdout.write(self.style.ERROR(linha + '  REGRESSÃO'))
+            else:
+                self.stdout.write(linha)
+
+        if regressoes:
+            raise CommandError(f"Regressões acima de {tolerancia:.0f}% (ou com mais consultas): {', '.join(regressoes)}")
@@ -0,0 +1,376 @@
+import http.cookiejar
+import json
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from entregas.models import Cliente
+
+# --- TESTE DE CARGA DO BALCÃO (CIRCUITO FECHADO) ---
+# Simula o pico de segunda de manhã contra uma instância rodando (runserver/gunicorn):
+# - N caixas: buscam o cliente pelo CPF, selecionam pacotes, abrem a confirmação, dão a baixa
+#   (marcar_entregue), abrem o recibo e, de vez em quando, cancelam a retirada;
+# - M visitantes: consultam /consulta/ com o token de teste do reCAPTCHA (RECAPTCHA_TOKEN_TESTE).
+# Cada usuário virtual só envia a próxima requisição depois de receber a resposta da anterior
+# (mais um tempo de "pensar"), como acontece no balcão. Caixas disputando os mesmos clientes
+# provocam o bloqueio de baixa duplicada, e a taxa de rollback mostra quanto isso acontece.
+# Com PostgreSQL, uma thread amostra pg_locks para medir as esperas por lock durante o teste.
+#
+# A instância precisa rodar com DEBUG ligado e RECAPTCHA_TOKEN_TESTE definido (e, de preferência,
+# LIMITADOR_ATIVO=0: senão as consultas saem do mesmo IP e esbarram no limitador).
+
+RE_SELECIONAVEL = re.compile(r'name="_selected_action" value="(\d+)"')
+RE_VALOR = re.compile(r'name="valor_(\d+)"[^>]*?value="([^"]*)"', re.S)
+RE_RETIRADA = re.compile(r'/retirada/(\d+)/change/')
+MOTIVOS_ROLLBACK = {
+    'baixa_duplicada': 'já foi entregue em outro caixa',
+    'baixa_concorrente': 'foi alterada em outro caixa durante a baixa',
+    'encomenda_removida': 'foram descartadas ou apagadas',
+}
+
+
+class RespostaHTTP:
+    def __init__(self, status, corpo, cabecalhos):
+        self.status = status
+        self.corpo = corpo
+        self.cabecalhos = cabecalhos
+
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Sessao:
+    # Um navegador: cookies próprios (sessão + CSRF) e sem seguir redirecionamentos
+    def __init__(self, base, timeout):
+        self.base = base.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _SemRedirecionar)
+
+    def csrf(self):
+        return next((c.value for c in self.cookies if c.name == settings.CSRF_COOKIE_NAME), '')
+
+    def requisitar(self, metodo, caminho, dados=None):
+        url = self.base + caminho
+        corpo = None
+        cabecalhos = {'Referer': url, 'User-Agent': 'carga-balcao'}
+        if dados is not None:
+            dados = dict(dados, csrfmiddlewaretoken=self.csrf())
+            corpo = urllib.parse.urlencode(dados, doseq=True).encode()
+            cabecalhos['Content-Type'] = 'application/x-www-form-urlencoded'
+        requisicao = urllib.request.Request(url, data=corpo, headers=cabecalhos, method=metodo)
+        try:
+            with self.opener.open(requisicao, timeout=self.timeout) as resposta:
+                return RespostaHTTP(resposta.status, resposta.read().decode('utf-8', 'replace'), resposta.headers)
+        except urllib.error.HTTPError as erro:
+            return RespostaHTTP(erro.code, erro.read().decode('utf-8', 'replace'), erro.headers)
+
+    def entrar(self, usuario, senha):
+        self.requisitar('GET', '/admin/login/')
+        resposta = self.requisitar('POST', '/admin/login/', {'username': usuario, 'password': senha, 'next': '/admin/'})
+        if resposta.status != 302:
+            raise CommandError(f"Login de {usuario!r} falhou (HTTP {resposta.status}).")
+
+
+class Placar:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tempos = {}
+        self.erros = {}
+        self.eventos = {}
+
+    def medir(self, operacao, funcao):
+        inicio = time.perf_counter()
+        try:
+            resposta = funcao()
+        except OSError:
+            self.contar_erro(operacao)
+            return None
+        decorrido = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.tempos.setdefault(operacao, []).append(decorrido)
+            if resposta.status >= 500:
+                self.erros[operacao] = self.erros.get(operacao, 0) + 1
+        return resposta
+
+    def contar_erro(self, operacao):
+        with self._lock:
+            self.erros[operacao] = self.erros.get(operacao, 0) + 1
+
+    def evento(self, nome):
+        with self._lock:
+            self.eventos[nome] = self.eventos.get(nome, 0) + 1
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return None
+    indice = min(len(valores_ordenados) - 1, max(0, int(round(p / 100 * len(valores_ordenados) + 0.5)) - 1))
+    return valores_ordenados[indice]
+
+
+class AmostradorLocks(threading.Thread):
+    # Amostra as esperas por lock no PostgreSQL enquanto a carga roda
+    SQL = """
+        SELECT count(*), coalesce(max(extract(epoch FROM now() - a.query_start)), 0)
+        FROM pg_locks l JOIN pg_stat_activity a ON a.pid = l.pid
+        WHERE NOT l.granted AND a.datname = current_database()
+    """
+
+    def __init__(self, intervalo):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.parar = threading.Event()
+        self.amostras = []
+        self.maior_espera_s = 0.0
+        self.deadlocks = None
+
+    def _deadlocks(self, cursor):
+        cursor.execute('SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()')
+        return cursor.fetchone()[0]
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                deadlocks_inicio = self._deadlocks(cursor)
+                while not self.parar.wait(self.intervalo):
+                    cursor.execute(self.SQL)
+                    aguardando, espera = cursor.fetchone()
+                    self.amostras.append(aguardando)
+                    self.maior_espera_s = max(self.maior_espera_s, float(espera))
+                # As estatísticas do pg_stat_database são publicadas com atraso
+                time.sleep(0.6)
+                self.deadlocks = self._deadlocks(cursor) - deadlocks_inicio
+        finally:
+            connections.close_all()
+
+    def resumo(self):
+        com_espera = [a for a in self.amostras if a]
+        return {
+            'amostras': len(self.amostras),
+            'amostras_com_espera_pct': 100 * len(com_espera) / len(self.amostras) if self.amostras else 0,
+            'max_sessoes_aguardando': max(self.amostras, default=0),
+            'media_sessoes_aguardando': statistics.fmean(self.amostras) if self.amostras else 0,
+            'maior_espera_s': self.maior_espera_s,
+            'deadlocks': self.deadlocks,
+        }
+
+
+class Command(BaseCommand):
+    help = 'Teste de carga em circuito fechado do balcão (baixas/cancelamentos) com consultas públicas simultâneas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--usuario', required=True, help='Usuário staff usado pelos caixas.')
+        parser.add_argument('--senha', required=True)
+        parser.add_argument('--caixas', type=int, default=4)
+        parser.add_argument('--visitantes', type=int, default=8, help='Usuários simultâneos na consulta pública.')
+        parser.add_argument('--duracao', type=float, default=60, help='Segundos de carga.')
+        parser.add_argument('--clientes', type=int, default=30, help='Quantos clientes com pendências os caixas disputam (menos = mais conflito).')
+        parser.add_argument('--max-pacotes', type=int, default=4, help='Máximo de pacotes por baixa.')
+        parser.add_argument('--cancelamento', type=float, default=0.1, help='Fração das baixas que o caixa cancela em seguida.')
+        parser.add_argument('--pensar-caixa', type=float, default=1.0, help='Pausa média (s) entre os passos do caixa.')
+        parser.add_argument('--pensar-visitante', type=float, default=0.5, help='Pausa média (s) entre consultas.')
+        parser.add_argument('--token-recaptcha', default=None, help='Padrão: RECAPTCHA_TOKEN_TESTE.')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--semente', type=int, default=None)
+        parser.add_argument('--json', dest='arquivo_json', help='Salva o relatório neste arquivo JSON.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.placar = Placar()
+        self.token = options['token_recaptcha'] or getattr(settings, 'RECAPTCHA_TOKEN_TESTE', None) or ''
+        if options['visitantes'] and not self.token:
+            raise CommandError('Defina RECAPTCHA_TOKEN_TESTE (o mesmo valor na instância) ou use --token-recaptcha.')
+
+        # Alvos lidos do mesmo banco que a instância usa
+        self.alvos = list(
+            Cliente.objects.filter(encomenda__status='PENDENTE', encomenda__descartado=False)
+            .exclude(cpf=None).values_list('id', 'cpf').distinct().order_by('id')[:options['clientes']]
+        )
+        if options['caixas'] and not self.alvos:
+            raise CommandError('Não há clientes com CPF e encomendas pendentes (gere dados com "gerar_dados").')
+        self.documentos = [cpf for _, cpf in self.alvos]
+        connections.close_all()
+
+        amostrador = AmostradorLocks(0.2) if connection.vendor == 'postgresql' else None
+        self.fim = time.monotonic() + options['duracao']
+        threads = [threading.Thread(target=self._caixa, args=(i,), daemon=True) for i in range(options['caixas'])]
+        threads += [threading.Thread(target=self._visitante, args=(i,), daemon=True) for i in range(options['visitantes'])]
+
+        self.stdout.write(f"{options['caixas']} caixa(s) e {options['visitantes']} visitante(s) contra {options['url']} por {options['duracao']:.0f}s...")
+        inicio = time.monotonic()
+        if amostrador:
+            amostrador.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.monotonic() - inicio
+        if amostrador:
+            amostrador.parar.set()
+            amostrador.join()
+
+        relatorio = self._relatorio(duracao, amostrador)
+        self._imprimir(relatorio)
+        if options['arquivo_json']:
+            with open(options['arquivo_json'], 'w', encoding='utf-8') as arquivo:
+                json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+
+    def _pausa(self, aleatorio, media):
+        if media > 0:
+            time.sleep(min(aleatorio.expovariate(1 / media), media * 5))
+
+    def _caixa(self, numero):
+        aleatorio = random.Random(None if self.options['semente'] is None else self.options['semente'] + numero)
+        placar = self.placar
+        sessao = Sessao(self.options['url'], self.options['timeout'])
+        try:
+            sessao.entrar(self.options['usuario'], self.options['senha'])
+        except (CommandError, OSError) as erro:
+            self.stderr.write(f"Caixa {numero}: {erro}")
+            placar.contar_erro('login')
+            return
+
+        pensar = self.options['pensar_caixa']
+        while time.monotonic() < self.fim:
+            cliente_id, cpf = aleatorio.choice(self.alvos)
+
+            # 1. Busca o cliente na lista de pendentes
+            resposta = placar.medir('busca_cliente', lambda: sessao.requisitar(
+                'GET', '/admin/entregas/encomenda/?' + urllib.parse.urlencode({'status': 'PENDENTE', 'q': cpf})))
+            ids = RE_SELECIONAVEL.findall(resposta.corpo) if resposta else []
+            if not ids:
+                placar.evento('cliente_sem_pendentes')
+                self._pausa(aleatorio, pensar)
+                continue
+            selecionados = aleatorio.sample(ids, aleatorio.randint(1, min(len(ids), self.options['max_pacotes'])))
+            self._pausa(aleatorio, pensar)
+
+            # 2. Tela de confirmação da baixa
+            base = {'action': 'marcar_entregue', 'index': 0, '_selected_action': selecionados}
+            resposta = placar.medir('confirmacao', lambda: sessao.requisitar('POST', '/admin/entregas/encomenda/', base))
+            if resposta is None or resposta.status != 200:
+                continue
+            valores = dict(RE_VALOR.findall(resposta.corpo))
+            self._pausa(aleatorio, pensar)
+
+            # 3. Baixa (marcar_entregue com post=yes)
+            dados = dict(base, post='yes', retirante=cliente_id)
+            dados.update({f'valor_{pk}': valores.get(pk, '10.00') for pk in selecionados})
+            resposta = placar.medir('baixa', lambda: sessao.requisitar('POST', '/admin/entregas/encomenda/', dados))
+            if resposta is None:
+                continue
+            destino = resposta.cabecalhos.get('Location', '') if resposta.status == 302 else ''
+            encontrada = RE_RETIRADA.search(destino)
+            if not encontrada:
+                motivo = next((m for m, texto in MOTIVOS_ROLLBACK.items() if texto in resposta.corpo), None)
+                if motivo:
+                    placar.evento('baixa_rollback')
+                    placar.evento(f'rollback_{motivo}')
+                elif 'Rollback executado' in resposta.corpo:
+                    placar.evento('baixa_rollback')
+                    placar.evento('rollback_outro')
+                else:
+                    placar.contar_erro('baixa')
+                self._pausa(aleatorio, pensar)
+                continue
+            placar.evento('baixa_sucesso')
+
+            # 4. Recibo e, às vezes, o cancelamento (devolve os pacotes ao estoque)
+            retirada_id = encontrada.group(1)
+            placar.medir('recibo', lambda: sessao.requisitar('GET', f'/admin/entregas/retirada/{retirada_id}/change/'))
+            if aleatorio.random() < self.options['cancelamento']:
+                self._pausa(aleatorio, pensar)
+                resposta = placar.medir('cancelamento', lambda: sessao.requisitar('POST', f'/admin/entregas/retirada/{retirada_id}/cancelar/', {}))
+                if resposta is not None and resposta.status == 302:
+                    placar.evento('cancelamento_sucesso')
+            self._pausa(aleatorio, pensar)
+
+    def _visitante(self, numero):
+        aleatorio = random.Random(None if self.options['semente'] is None else self.options['semente'] + 1000 + numero)
+        placar = self.placar
+        sessao = Sessao(self.options['url'], self.options['timeout'])
+        placar.medir('consulta_publica_pagina', lambda: sessao.requisitar('GET', '/consulta/'))
+
+        while time.monotonic() < self.fim:
+            # 70% procuram um CPF que tem encomendas; o resto digita um documento sem cadastro
+            if self.documentos and aleatorio.random() < 0.7:
+                documento = aleatorio.choice(self.documentos)
+            else:
+                documento = ''.join(str(aleatorio.randint(0, 9)) for _ in range(11))
+            resposta = placar.medir('consulta_publica', lambda: sessao.requisitar(
+                'POST', '/consulta/', {'q': documento, 'g-recaptcha-response': self.token}))
+            if resposta is not None:
+                if resposta.status == 429:
+                    placar.evento('consulta_limitada')
+                elif 'A verificação de segurança falhou' in resposta.corpo:
+                    placar.evento('consulta_recaptcha_recusado')
+            self._pausa(aleatorio, self.options['pensar_visitante'])
+
+    def _relatorio(self, duracao, amostrador):
+        placar = self.placar
+        operacoes = {}
+        for operacao, tempos in sorted(placar.tempos.items()):
+            tempos = sorted(tempos)
+            operacoes[operacao] = {
+                'requisicoes': len(tempos),
+                'por_segundo': len(tempos) / duracao,
+                'erros': placar.erros.get(operacao, 0),
+                'p50_ms': percentil(tempos, 50),
+                'p95_ms': percentil(tempos, 95),
+                'p99_ms': percentil(tempos, 99),
+                'max_ms': tempos[-1],
+            }
+        for operacao, qtd in placar.erros.items():
+            operacoes.setdefault(operacao, {'requisicoes': 0, 'erros': qtd})
+
+        eventos = dict(sorted(placar.eventos.items()))
+        tentativas = eventos.get('baixa_sucesso', 0) + eventos.get('baixa_rollback', 0)
+        return {
+            'gerado_em': timezone.now().isoformat(),
+            'url': self.options['url'],
+            'caixas': self.options['caixas'],
+            'visitantes': self.options['visitantes'],
+            'clientes_disputados': len(self.alvos),
+            'duracao_s': duracao,
+            'requisicoes_por_segundo': sum(len(t) for t in placar.tempos.values()) / duracao,
+            'baixas_por_minuto': eventos.get('baixa_sucesso', 0) / duracao * 60,
+            'taxa_rollback_pct': 100 * eventos.get('baixa_rollback', 0) / tentativas if tentativas else 0,
+            'operacoes': operacoes,
+            'eventos': eventos,
+            'locks': amostrador.resumo() if amostrador else None,
+        }
+
+    def _imprimir(self, r):
+        self.stdout.write(f"\nDuração {r['duracao_s']:.1f}s | {r['requisicoes_por_segundo']:.1f} req/s | {r['baixas_por_minuto']:.1f} baixas/min | rollback {r['taxa_rollback_pct']:.1f}%")
+        for nome, o in r['operacoes'].items():
+            if not o['requisicoes']:
+                self.stdout.write(f"{nome:<26} {o['erros']} erro(s)")
+                continue
+            self.stdout.write(
+                f"{nome:<26} {o['requisicoes']:6d} req ({o['por_segundo']:6.1f}/s) | p50 {o['p50_ms']:8.1f} | p95 {o['p95_ms']:8.1f} "
+                f"| p99 {o['p99_ms']:8.1f} | máx {o['max_ms']:8.1f} ms | erros {o['erros']}"
+            )
+        if r['eventos']:
+            self.stdout.write('Eventos: ' + ', '.join(f"{k}={v}" for k, v in r['eventos'].items()))
+        if r['locks']:
+            l = r['locks']
+            self.stdout.write(
+                f"Locks: espera em {l['amostras_com_espera_pct']:.1f}% das {l['amostras']} amostras | até {l['max_sessoes_aguardando']} sessões aguardando "
+                f"| maior espera {l['maior_espera_s']:.2f}s | deadlocks {l['deadlocks']}"
+            )
+        else:
+            self.stdout.write('Locks: amostragem disponível apenas no PostgreSQL.')
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from entregas.deduplicacao import LIMIAR_PADRAO, MAX_BLOCO, encontrar_duplicados
+from entregas.models import Cliente
+
+
+class Command(BaseCommand):
+    help = 'Lista grupos de clientes provavelmente duplicados (nomes com acentos/espaços diferentes, mesmo telefone ou documento).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limiar', type=float, default=LIMIAR_PADRAO, help='Pontuação mínima (0 a 1) para considerar dois clientes iguais.')
+        parser.add_argument('--max-bloco', type=int, default=MAX_BLOCO, help='Blocos maiores que isso são ignorados (evita comparações quadráticas).')
+        parser.add_argument('--json', dest='arquivo_json', help='Salva os grupos encontrados neste arquivo JSON.')
+
+    def handle(self, *args, **options):
+        grupos = encontrar_duplicados(limiar=options['limiar'], max_bloco=options['max_bloco'])
+
+        ids = {c for grupo in grupos for c in grupo['clientes']}
+        nomes = dict(Cliente.objects.filter(pk__in=ids).values_list('id', 'nome'))
+
+        for grupo in grupos:
+            descricao = ' | '.join(f"#{c} {nomes.get(c, '?')}" for c in grupo['clientes'])
+            self.stdout.write(f"[{grupo['score']:.2f}] {descricao}")
+
+        if options['arquivo_json']:
+            with open(options['arquivo_json'], 'w', encoding='utf-8') as arquivo:
+                json.dump(grupos, arquivo, ensure_ascii=False, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f"{len(grupos)} grupo(s) de possíveis duplicados encontrados."))
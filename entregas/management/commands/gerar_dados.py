@@ -0,0 +1,277 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from entregas import recibos
+from entregas.models import (
+    AnotacaoCliente, Cliente, Encomenda, Retirada,
+    calcular_cobranca, normalizar_telefone, normalizar_texto, validar_cpf_algoritmo,
+)
+
+# --- GERADOR DE DADOS SINTÉTICOS ---
+# Monta uma base com o formato da produção para testes de desempenho locais:
+# clientes com CPF válido (ou só RG), encomendas espalhadas por vários anos, a maior parte já
+# entregue em retiradas de balcão (1 a 3 pacotes por visita), algumas pendentes e uma pequena
+# lixeira, além de anotações. Tudo com bulk_create em lotes, sem passar pelo save() de cada objeto.
+
+NOMES = (
+    'Ana', 'Maria', 'Francisca', 'Antônia', 'Adriana', 'Juliana', 'Márcia', 'Fernanda', 'Patrícia', 'Aline',
+    'José', 'João', 'Antônio', 'Francisco', 'Carlos', 'Paulo', 'Pedro', 'Lucas', 'Luiz', 'Marcos',
+    'Gabriel', 'Rafael', 'Daniel', 'Marcelo', 'Bruno', 'Eduardo', 'Felipe', 'Raimundo', 'Rodrigo', 'Sebastião',
+    'Camila', 'Letícia', 'Beatriz', 'Larissa', 'Vanessa', 'Simone', 'Cristina', 'Sandra', 'Luciana', 'Jéssica',
+)
+SOBRENOMES = (
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima', 'Gomes',
+    'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes', 'Vieira', 'Barbosa',
+    'Rocha', 'Dias', 'Nascimento', 'Andrade', 'Moreira', 'Nunes', 'Marques', 'Machado', 'Mendes', 'Freitas',
+    'Cardoso', 'Ramos', 'Gonçalves', 'Santana', 'Teixeira', 'Araújo', 'Pinto', 'Moraes', 'Batista', 'Schmidt',
+)
+REMETENTES = (
+    'Mercado Livre', 'Shopee', 'Amazon', 'Magazine Luiza', 'AliExpress', 'Correios', 'Natura', 'O Boticário',
+    'Drogasil', 'Americanas', 'Shein', 'Kabum', 'Netshoes', 'Farmácia de Manipulação', 'Laboratório Sabin',
+)
+DESCRICOES = ('Caixa pequena', 'Caixa média', 'Caixa grande', 'Envelope', 'Pacote plástico', 'Sacola', 'Medicamento', 'Documento')
+ANOTACOES = (
+    'Pediu para avisar por WhatsApp quando chegar.',
+    'Autorizou o filho a retirar.',
+    'Reclamou da demora na entrega anterior.',
+    'Prefere retirar à tarde.',
+    'Encomenda de outro endereço, conferir documento.',
+)
+DDDS = ('45', '45', '45', '41', '43', '44', '11', '21', '51')
+
+
+def gerar_cpf(aleatorio):
+    while True:
+        base = [aleatorio.randint(0, 9) for _ in range(9)]
+        if len(set(base)) == 1:
+            continue
+        for i in range(9, 11):
+            soma = sum(d * ((i + 1) - n) for n, d in enumerate(base))
+            base.append(((soma * 10) % 11) % 10)
+        cpf = ''.join(map(str, base))
+        try:
+            validar_cpf_algoritmo(cpf)
+        except ValidationError:
+            continue
+        return cpf
+
+
+class Command(BaseCommand):
+    help = 'Gera clientes, encomendas, retiradas e anotações sintéticos para testes de desempenho (ex: 100 mil clientes e 1 milhão de encomendas).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=10000)
+        parser.add_argument('--encomendas', type=int, default=100000)
+        parser.add_argument('--anotacoes', type=int, default=2000)
+        parser.add_argument('--anos', type=int, default=3, help='Período coberto pelas datas de chegada.')
+        parser.add_argument('--pendentes', type=float, default=0.04, help='Fração de encomendas ainda pendentes.')
+        parser.add_argument('--lixeira', type=float, default=0.02, help='Fração de encomendas descartadas.')
+        parser.add_argument('--lote', type=int, default=5000)
+        parser.add_argument('--semente', type=int, default=0)
+        parser.add_argument('--forcar', action='store_true', help='Permite rodar com DEBUG=False.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forcar']:
+            raise CommandError('Este comando grava milhares de registros falsos. Use --forcar para rodar com DEBUG=False.')
+
+        self.aleatorio = random.Random(options['semente'])
+        self.lote = options['lote']
+        self.agora = timezone.now()
+        inicio = time.perf_counter()
+
+        operadores = self._operadores()
+        clientes = self._clientes(options['clientes']) or list(Cliente.objects.values_list('pk', flat=True))
+        if not clientes and (options['encomendas'] or options['anotacoes']):
+            raise CommandError('Não há clientes para receber as encomendas/anotações (use --clientes).')
+        retiradas, encomendas = self._encomendas(
+            clientes, operadores, options['encomendas'], options['anos'], options['pendentes'], options['lixeira'],
+        )
+        anotacoes = self._anotacoes(clientes, options['anotacoes'])
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE entregas_cliente, entregas_encomenda, entregas_retirada, entregas_anotacaocliente')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(clientes)} clientes, {encomendas} encomendas, {retiradas} retiradas e {anotacoes} anotações "
+            f"gerados em {time.perf_counter() - inicio:.1f}s."
+        ))
+
+    def _operadores(self):
+        operadores = []
+        for i in range(1, 4):
+            operador, criado = User.objects.get_or_create(username=f'operador{i}', defaults={'is_staff': True})
+            if criado:
+                operador.set_unusable_password()
+                operador.save(update_fields=['password'])
+            operadores.append(operador)
+        return operadores
+
+    def _telefone(self):
+        return f"({self.aleatorio.choice(DDDS)}) 9{self.aleatorio.randint(8000, 9999)}-{self.aleatorio.randint(0, 9999):04d}"
+
+    def _clientes(self, quantidade):
+        aleatorio = self.aleatorio
+        existentes = set(Cliente.objects.exclude(cpf=None).values_list('cpf', flat=True))
+        ids = []
+        for inicio in range(0, quantidade, self.lote):
+            lote = []
+            for _ in range(min(self.lote, quantidade - inicio)):
+                nome = f"{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)}"
+                if aleatorio.random() < 0.6:
+                    nome = f"{nome} {aleatorio.choice(SOBRENOMES)}"
+
+                cpf = rg = None
+                if aleatorio.random() < 0.85:
+                    cpf = gerar_cpf(aleatorio)
+                    while cpf in existentes:
+                        cpf = gerar_cpf(aleatorio)
+                    existentes.add(cpf)
+                else:
+                    rg = str(aleatorio.randint(1000000, 99999999))
+
+                telefone = self._telefone()
+                telefone2 = self._telefone() if aleatorio.random() < 0.2 else None
+                lote.append(Cliente(
+                    nome=nome,
+                    cpf=cpf,
+                    rg=rg,
+                    genero=aleatorio.choice(('M', 'F', None)),
+                    telefone=telefone,
+                    telefone2=telefone2,
+                    # bulk_create não chama o save(), que é quem preenche as colunas normalizadas
+                    telefone_normalizado=normalizar_telefone(telefone),
+                    telefone2_normalizado=normalizar_telefone(telefone2),
+                    nome_normalizado=normalizar_texto(nome)[:200],
+                    email=f"{normalizar_texto(nome.split()[0])}{aleatorio.randint(1, 9999)}@exemplo.com" if aleatorio.random() < 0.3 else None,
+                ))
+            with transaction.atomic():
+                ids.extend(c.pk for c in Cliente.objects.bulk_create(lote))
+            self.stdout.write(f"Clientes: {len(ids)}/{quantidade}")
+        return ids
+
+    def _encomendas(self, clientes, operadores, quantidade, anos, fracao_pendentes, fracao_lixeira):
+        # Gera "visitas": cada uma é um cliente com 1 a 3 pacotes que chegaram em dias próximos e,
+        # se já foram entregues, saíram juntos numa única retirada.
+        aleatorio = self.aleatorio
+        periodo_dias = anos * 365
+        total_encomendas = total_retiradas = 0
+        sequencia = 0
+
+        while total_encomendas < quantidade:
+            visitas = []
+            pacotes_no_lote = 0
+            while pacotes_no_lote < self.lote and total_encomendas + pacotes_no_lote < quantidade:
+                qtd = min(aleatorio.choice((1, 1, 1, 2, 2, 3)), quantidade - total_encomendas - pacotes_no_lote)
+                sorteio = aleatorio.random()
+                if sorteio < fracao_lixeira:
+                    destino, dias_atras = 'lixeira', aleatorio.randint(0, periodo_dias)
+                elif sorteio < fracao_lixeira + fracao_pendentes:
+                    destino, dias_atras = 'pendente', aleatorio.randint(0, 120)
+                else:
+                    destino, dias_atras = 'entregue', aleatorio.randint(1, periodo_dias)
+                visitas.append((aleatorio.choice(clientes), qtd, destino, dias_atras))
+                pacotes_no_lote += qtd
+
+            with transaction.atomic():
+                retiradas = []
+                # Baixas canceladas e refeitas: (cancelada, a que entregou de fato). Como no cancelar_retirada,
+                # a cancelada guarda só o recibo e o total; as encomendas voltaram ao estoque e saíram na outra.
+                canceladas = []
+                for cliente_id, _, destino, _ in visitas:
+                    if destino == 'entregue':
+                        retirada = Retirada(retirado_por_id=cliente_id, operador=aleatorio.choice(operadores), valor_total=0)
+                        retiradas.append(retirada)
+                        if aleatorio.random() < 0.01:
+                            canceladas.append((
+                                Retirada(retirado_por_id=cliente_id, operador=retirada.operador, valor_total=0, status='CANCELADA'),
+                                retirada,
+                            ))
+                Retirada.objects.bulk_create(retiradas + [cancelada for cancelada, _ in canceladas])
+                fila_retiradas = iter(retiradas)
+
+                encomendas = []
+                baixas = []
+                for cliente_id, qtd, destino, dias_atras in visitas:
+                    retirada = next(fila_retiradas) if destino == 'entregue' else None
+                    ultima_chegada = None
+                    total_visita = Decimal('0')
+                    for _ in range(qtd):
+                        sequencia += 1
+                        chegada = self.agora - timedelta(
+                            days=dias_atras + aleatorio.randint(0, 5),
+                            seconds=aleatorio.randint(0, 86399),
+                        )
+                        ultima_chegada = max(ultima_chegada or chegada, chegada)
+                        encomenda = Encomenda(
+                            cliente_id=cliente_id,
+                            descricao=f"{aleatorio.choice(DESCRICOES)} #{sequencia}",
+                            remetente=aleatorio.choice(REMETENTES),
+                            data_chegada=chegada,
+                            valor_base=Decimal(aleatorio.choice((5, 10, 10, 10, 15))),
+                            descartado=destino == 'lixeira',
+                        )
+                        encomendas.append(encomenda)
+                        if retirada is not None:
+                            encomenda.retirada = retirada
+                            encomenda.status = 'ENTREGUE'
+
+                    if retirada is not None:
+                        # Retirada depois que o último pacote chegou (mas nunca no futuro)
+                        saida = min(ultima_chegada + timedelta(days=aleatorio.randint(0, 25), hours=aleatorio.randint(0, 8)), self.agora)
+                        retirada.data_retirada = saida
+                        for encomenda in encomendas[-qtd:]:
+                            encomenda.data_entrega = saida
+                            _, _, calculado = calcular_cobranca(encomenda.data_chegada, encomenda.valor_base, saida)
+                            encomenda.valor_calculado = Decimal(str(calculado))
+                            # Uma parte recebe desconto no balcão
+                            encomenda.valor_cobrado = encomenda.valor_calculado if aleatorio.random() < 0.9 else encomenda.valor_base
+                            total_visita += encomenda.valor_cobrado
+                        retirada.valor_total = total_visita
+                        baixas.append((retirada, encomendas[-qtd:]))
+
+                Encomenda.objects.bulk_create(encomendas)
+                # Recibo congelado como o da baixa (depois do bulk_create, que preenche os ids das encomendas)
+                donos = Cliente.objects.in_bulk({r.retirado_por_id for r in retiradas})
+                for retirada, itens in baixas:
+                    for encomenda in itens:
+                        encomenda.cliente = donos[encomenda.cliente_id]
+                    retirada.recibo = recibos.montar(donos[retirada.retirado_por_id], itens)
+                for cancelada, refeita in canceladas:
+                    cancelada.data_retirada = refeita.data_retirada - timedelta(minutes=aleatorio.randint(1, 30))
+                    cancelada.valor_total, cancelada.recibo = refeita.valor_total, refeita.recibo
+                # data_retirada é auto_now_add (o bulk_create grava "agora"): corrige com a data sorteada
+                Retirada.objects.bulk_update(
+                    retiradas + [cancelada for cancelada, _ in canceladas], ['data_retirada', 'valor_total', 'recibo'], batch_size=1000,
+                )
+
+            total_encomendas += len(encomendas)
+            total_retiradas += len(retiradas) + len(canceladas)
+            self.stdout.write(f"Encomendas: {total_encomendas}/{quantidade}")
+
+        return total_retiradas, total_encomendas
+
+    def _anotacoes(self, clientes, quantidade):
+        aleatorio = self.aleatorio
+        criadas = 0
+        for inicio in range(0, quantidade, self.lote):
+            lote = [
+                AnotacaoCliente(
+                    cliente_id=aleatorio.choice(clientes),
+                    anotacao=aleatorio.choice(ANOTACOES),
+                    data_hora=self.agora - timedelta(minutes=aleatorio.randint(0, 60 * 24 * 365)),
+                )
+                for _ in range(min(self.lote, quantidade - inicio))
+            ]
+            AnotacaoCliente.objects.bulk_create(lote)
+            criadas += len(lote)
+        return criadas
@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from entregas import lixeira
+
+
+class Command(BaseCommand):
+    help = 'Apaga (deixando uma lápide) ou arquiva as encomendas descartadas e nunca retiradas mais antigas que o prazo de retenção.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.LIXEIRA_RETENCAO_DIAS, help='Idade mínima (em dias, pela data de chegada).')
+        parser.add_argument('--lote', type=int, default=200, help='Encomendas por transação.')
+        parser.add_argument('--pausa', type=float, default=0.5, help='Segundos de espera entre lotes.')
+        parser.add_argument('--arquivar', action='store_true', help='Move para o arquivo de encomendas em vez de apagar.')
+        parser.add_argument('--ignorar-horario', action='store_true', help='Roda mesmo dentro de LIXEIRA_HORARIO_BLOQUEADO.')
+        parser.add_argument('--confirmar', action='store_true', help='Executa de fato. Sem esta opção apenas mostra o relatório.')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['lote'] < 1:
+            raise CommandError('--dias e --lote precisam ser maiores que zero.')
+        corte = timezone.now() - timedelta(days=options['dias'])
+        destino = 'arquivadas' if options['arquivar'] else 'apagadas (com lápide)'
+
+        if not options['confirmar']:
+            self._relatorio(corte, destino)
+            self.stdout.write(self.style.WARNING("Simulação apenas. Use --confirmar para executar."))
+            return
+
+        total = 0
+        while True:
+            if not options['ignorar_horario'] and lixeira.em_horario_bloqueado():
+                self.stdout.write(self.style.WARNING(
+                    f"Horário bloqueado ({settings.LIXEIRA_HORARIO_BLOQUEADO}): parando após {total} encomenda(s). "
+                    "O restante fica para a próxima execução."
+                ))
+                break
+            feitas = lixeira.expurgar_lote(corte, options['lote'], arquivar=options['arquivar'])
+            if not feitas:
+                break
+            total += feitas
+            self.stdout.write(f"  ... {total} encomenda(s)")
+            time.sleep(options['pausa'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} encomenda(s) {destino}."))
+
+    def _relatorio(self, corte, destino):
+        qs = lixeira.expurgaveis(corte)
+        resumo = qs.aggregate(qtd=Count('id'), mais_antiga=Min('data_chegada'), mais_recente=Max('data_chegada'))
+        self.stdout.write(f"Corte: chegadas antes de {timezone.localtime(corte):%d/%m/%Y}")
+        if not resumo['qtd']:
+            self.stdout.write("Nenhuma encomenda descartada elegível.")
+            return
+
+        self.stdout.write(
+            f"{resumo['qtd']} encomenda(s) seriam {destino}, chegadas entre "
+            f"{timezone.localtime(resumo['mais_antiga']):%d/%m/%Y} e {timezone.localtime(resumo['mais_recente']):%d/%m/%Y}:"
+        )
+        por_mes = qs.annotate(mes=TruncMonth('data_chegada')).values('mes').annotate(qtd=Count('id')).order_by('mes')
+        for linha in por_mes:
+            self.stdout.write(f"  {linha['mes']:%m/%Y}: {linha['qtd']}")
@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from entregas.deduplicacao import mesclar_clientes
+from entregas.models import Cliente, Encomenda, Retirada, AnotacaoCliente
+
+
+class Command(BaseCommand):
+    help = 'Mescla clientes duplicados no cliente principal (encomendas, retiradas e anotações são transferidas).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('principal', type=int, help='ID do cliente que permanece.')
+        parser.add_argument('duplicados', type=int, nargs='+', help='IDs dos clientes que serão absorvidos e apagados.')
+        parser.add_argument('--confirmar', action='store_true', help='Executa de fato. Sem esta opção apenas mostra o que seria feito.')
+        parser.add_argument('--usuario', help='Username registrado no histórico do admin.')
+
+    def handle(self, *args, **options):
+        principal_id, duplicados = options['principal'], options['duplicados']
+
+        if not options['confirmar']:
+            self.stdout.write(f"Principal: {Cliente.objects.filter(pk=principal_id).first()}")
+            for cliente in Cliente.objects.filter(pk__in=duplicados):
+                self.stdout.write(
+                    f"  <- {cliente}: {Encomenda.objects.filter(cliente=cliente).count()} encomenda(s), "
+                    f"{Retirada.objects.filter(retirado_por=cliente).count()} retirada(s), "
+                    f"{AnotacaoCliente.objects.filter(cliente=cliente).count()} anotação(ões)"
+                )
+            self.stdout.write(self.style.WARNING("Simulação apenas. Use --confirmar para mesclar."))
+            return
+
+        usuario = None
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+            if usuario is None:
+                raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+
+        try:
+            principal, movidas = mesclar_clientes(principal_id, duplicados, usuario=usuario)
+        except ValidationError as e:
+            raise CommandError('; '.join(e.messages))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{principal} absorveu {len(set(duplicados) - {principal_id})} cliente(s): "
+            f"{movidas['encomendas']} encomenda(s), {movidas['retiradas']} retirada(s), {movidas['anotacoes']} anotação(ões); "
+            f"do arquivo: {movidas['encomendas_arquivadas']} encomenda(s), {movidas['retiradas_arquivadas']} retirada(s)."
+        ))
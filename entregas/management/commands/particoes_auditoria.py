@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from entregas import auditoria
+
+# --- MANUTENÇÃO DAS PARTIÇÕES DA AUDITORIA ---
+# Cria com antecedência as partições mensais de EventoAuditoria. Rode periodicamente (ex: uma vez
+# por mês): eventos de um mês sem partição vão para a partição padrão, o que impede criar a
+# partição daquele mês depois sem antes mover as linhas.
+
+
+class Command(BaseCommand):
+    help = 'Cria as partições mensais futuras da tabela de auditoria (EventoAuditoria).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=12, help='Quantos meses à frente (a partir do atual) garantir.')
+
+    def handle(self, *args, **options):
+        criadas = auditoria.criar_particoes(timezone.now(), options['meses'])
+        for nome in criadas:
+            self.stdout.write(f"Criada: {nome}")
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM entregas_eventoauditoria_padrao")
+            na_padrao = cursor.fetchone()[0]
+        if na_padrao:
+            self.stdout.write(self.style.WARNING(
+                f"{na_padrao} evento(s) na partição padrão: crie as partições daqueles meses movendo as linhas."
+            ))
+        self.stdout.write(self.style.SUCCESS(f"{len(criadas)} partição(ões) criada(s)."))
@@ -0,0 +1,61 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from entregas import tarefas
+
+
+class Command(BaseCommand):
+    help = 'Trabalhador da fila de tarefas em segundo plano (Tarefa). Rode um ou mais processos em paralelo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos de espera quando a fila está vazia.')
+        parser.add_argument('--ate-esvaziar', action='store_true', help='Sai quando não houver mais tarefas vencidas (ex: para rodar via cron).')
+        parser.add_argument('--max-tarefas', type=int, default=0, help='Sai depois de N tarefas (0 = sem limite), para reciclar o processo.')
+
+    def handle(self, *args, **options):
+        if options['intervalo'] <= 0 or options['max_tarefas'] < 0:
+            raise CommandError('--intervalo precisa ser maior que zero e --max-tarefas não pode ser negativo.')
+        trabalhador = tarefas.identificar_trabalhador()
+        self._parar = False
+        # SIGTERM (deploy/reinício) termina a tarefa atual antes de sair, em vez de deixá-la travada
+        signal.signal(signal.SIGTERM, self._pedir_parada)
+        signal.signal(signal.SIGINT, self._pedir_parada)
+
+        self.stdout.write(f"Trabalhador {trabalhador} iniciado.")
+        feitas = 0
+        ultima_manutencao = 0.0
+        while not self._parar:
+            close_old_connections()
+            if time.monotonic() - ultima_manutencao > 300:
+                voltaram, falharam = tarefas.recuperar_travadas()
+                apagadas = tarefas.limpar_concluidas()
+                tarefas.garantir_periodicas()
+                if voltaram or falharam or apagadas:
+                    self.stdout.write(f"Manutenção: {voltaram} devolvida(s) à fila, {falharam} falha(s) por tempo, {apagadas} concluída(s) antiga(s) apagada(s).")
+                ultima_manutencao = time.monotonic()
+
+            tarefa = tarefas.reservar(trabalhador)
+            if tarefa is None:
+                if options['ate_esvaziar']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            inicio = time.monotonic()
+            ok = tarefas.executar(tarefa)
+            estilo = self.style.SUCCESS if ok else self.style.ERROR
+            self.stdout.write(estilo(
+                f"#{tarefa.pk} {tarefa.nome} tentativa {tarefa.tentativas}/{tarefa.max_tentativas}: "
+                f"{'ok' if ok else 'erro'} em {time.monotonic() - inicio:.1f}s"
+            ))
+            feitas += 1
+            if options['max_tarefas'] and feitas >= options['max_tarefas']:
+                break
+
+        self.stdout.write(f"Trabalhador {trabalhador} encerrado após {feitas} tarefa(s).")
+
+    def _pedir_parada(self, signum, frame):
+        self._parar = True
@@ -0,0 +1,287 @@
+import atexit
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, connections
+from django.utils import timezone
+
+from . import tarefas
+
+logger = logging.getLogger(__name__)
+
+# --- MÉTRICAS POR TELA (LATÊNCIA, SQL E TAMANHO DA RESPOSTA) ---
+# Cada requisição é somada em histogramas do próprio processo, agrupados pelo nome da rota
+# (ex: "admin:entregas_encomenda_changelist"). Nada vai ao banco durante a requisição: a cada
+# METRICAS_INTERVALO o acumulado é gravado de uma vez na tabela MetricaRota por uma única thread
+# de fundo do processo, e a janela em aberto é gravada também quando o processo termina
+# (reinício/deploy do gunicorn).
+# Registros com mais de METRICAS_RETENCAO_DIAS são apagados pela tarefa periódica "limpar_metricas".
+# Com METRICAS_ATIVAS=0 o middleware se remove da pilha (MiddlewareNotUsed) e não custa nada.
+
+
+def _geometricos(inicio, fim, fator):
+    limites = []
+    valor = inicio
+    while valor < fim:
+        limites.append(round(valor, 3))
+        valor *= fator
+    return tuple(limites)
+
+
+# Limites superiores das faixas de cada histograma (o último balde recebe tudo acima)
+LIMITES = {
+    'latencia_ms': _geometricos(0.5, 120000, 1.15),
+    'sql_ms': _geometricos(0.1, 120000, 1.15),
+    'consultas': tuple(range(0, 31)) + tuple(int(v) for v in _geometricos(35, 100000, 1.2)),
+    'bytes': tuple(int(v) for v in _geometricos(256, 64 * 1024 * 1024, 1.25)),
+}
+ROTA_DESCONHECIDA = 'sem_rota'
+
+
+class Histograma:
+    __slots__ = ('limites', 'baldes', 'soma', 'maximo')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.baldes = {}
+        self.soma = 0
+        self.maximo = 0
+
+    def registrar(self, valor):
+        indice = bisect.bisect_left(self.limites, valor)
+        self.baldes[indice] = self.baldes.get(indice, 0) + 1
+        self.soma += valor
+        if valor > self.maximo:
+            self.maximo = valor
+
+    @property
+    def total(self):
+        return sum(self.baldes.values())
+
+    def percentil(self, p):
+        # Devolve o limite superior da faixa onde cai o percentil (nunca acima do máximo visto)
+        total = self.total
+        if not total:
+            return None
+        alvo = max(1, -(-total * p // 100))
+        acumulado = 0
+        for indice in sorted(self.baldes):
+            acumulado += self.baldes[indice]
+            if acumulado >= alvo:
+                if indice >= len(self.limites):
+                    return self.maximo
+                return min(self.limites[indice], self.maximo)
+        return self.maximo
+
+    def media(self):
+        total = self.total
+        return self.soma / total if total else None
+
+    def somar(self, outro):
+        for indice, qtd in outro.baldes.items():
+            self.baldes[indice] = self.baldes.get(indice, 0) + qtd
+        self.soma += outro.soma
+        self.maximo = max(self.maximo, outro.maximo)
+
+    def para_json(self):
+        return {'b': {str(i): q for i, q in self.baldes.items()}, 'soma': self.soma, 'max': self.maximo}
+
+    @classmethod
+    def de_json(cls, limites, dados):
+        histograma = cls(limites)
+        histograma.baldes = {int(i): q for i, q in dados.get('b', {}).items()}
+        histograma.soma = dados.get('soma', 0)
+        histograma.maximo = dados.get('max', 0)
+        return histograma
+
+
+class _Acumulado:
+    __slots__ = ('requisicoes', 'erros', 'histogramas')
+
+    def __init__(self):
+        self.requisicoes = 0
+        self.erros = 0
+        self.histogramas = {nome: Histograma(limites) for nome, limites in LIMITES.items()}
+
+
+class Coletor:
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._rotas = {}
+        self._inicio = timezone.now()
+        self._gravador = None
+
+    def registrar(self, rota, status, latencia_ms, consultas, sql_ms, tamanho):
+        with self._lock:
+            acumulado = self._rotas.get(rota)
+            if acumulado is None:
+                acumulado = self._rotas[rota] = _Acumulado()
+            acumulado.requisicoes += 1
+            if status >= 500:
+                acumulado.erros += 1
+            h = acumulado.histogramas
+            h['latencia_ms'].registrar(latencia_ms)
+            h['consultas'].registrar(consultas)
+            h['sql_ms'].registrar(sql_ms)
+            h['bytes'].registrar(tamanho)
+
+            # Iniciada na primeira requisição do worker (e não no import): uma thread criada antes
+            # do fork do gunicorn não existiria nos filhos
+            if self._gravador is None or not self._gravador.is_alive():
+                self._gravador = threading.Thread(target=self._gravar_periodicamente, name='metricas', daemon=True)
+                self._gravador.start()
+
+    def _trocar(self):
+        with self._lock:
+            lote, inicio = self._rotas, self._inicio
+            self._rotas = {}
+            self._inicio = timezone.now()
+        return lote, inicio
+
+    def _gravar_periodicamente(self):
+        while True:
+            time.sleep(self.intervalo)
+            lote, inicio = self._trocar()
+            self._gravar(lote, inicio, timezone.now())
+
+    def descarregar(self):
+        # Grava imediatamente o que estiver acumulado (no encerramento do processo, via atexit)
+        lote, inicio = self._trocar()
+        self._gravar(lote, inicio, timezone.now(), fechar_conexao=False)
+
+    def _gravar(self, lote, inicio, fim, fechar_conexao=True):
+        from .models import MetricaRota
+
+        if not lote:
+            return
+        try:
+            MetricaRota.objects.bulk_create([
+                MetricaRota(
+                    rota=rota[:200], inicio=inicio, fim=fim,
+                    requisicoes=acumulado.requisicoes, erros=acumulado.erros,
+                    histogramas={nome: h.para_json() for nome, h in acumulado.histogramas.items()},
+                )
+                for rota, acumulado in lote.items()
+            ])
+        except Exception:
+            logger.exception("Falha ao gravar as métricas das rotas")
+        finally:
+            if fechar_conexao:
+                connections.close_all()
+
+
+_coletor = None
+
+
+def get_coletor():
+    global _coletor
+    if _coletor is None:
+        _coletor = Coletor(getattr(settings, 'METRICAS_INTERVALO', 60))
+        if getattr(settings, 'METRICAS_ATIVAS', False):
+            atexit.register(_coletor.descarregar)
+    return _coletor
+
+
+@contextmanager
+def medir_sql(conexao=connection):
+    # Conta as consultas e soma o tempo gasto no banco enquanto o bloco executa
+    medida = {'consultas': 0, 'sql_ms': 0.0}
+
+    def envoltorio(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            medida['sql_ms'] += (time.perf_counter() - inicio) * 1000
+            medida['consultas'] += 1
+
+    with conexao.execute_wrapper(envoltorio):
+        yield medida
+
+
+class MetricasMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS_ATIVAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.coletor = get_coletor()
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        with medir_sql() as medida:
+            response = self.get_response(request)
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+
+        # Só o nome da rota (nunca o caminho), para a quantidade de séries não crescer sem limite
+        match = getattr(request, 'resolver_match', None)
+        rota = match.view_name if match is not None else ROTA_DESCONHECIDA
+        if response.streaming:
+            tamanho = int(response.get('Content-Length') or 0)
+        else:
+            tamanho = len(response.content)
+
+        self.coletor.registrar(rota, response.status_code, latencia_ms, medida['consultas'], medida['sql_ms'], tamanho)
+        return response
+
+
+# --- RELATÓRIO ---
+def resumo_por_rota(horas=24):
+    from .models import MetricaRota
+
+    desde = timezone.now() - timedelta(hours=horas)
+    rotas = {}
+    for rota, requisicoes, erros, histogramas in (
+        MetricaRota.objects.filter(inicio__gte=desde)
+        .values_list('rota', 'requisicoes', 'erros', 'histogramas')
+        .iterator(chunk_size=500)
+    ):
+        acumulado = rotas.get(rota)
+        if acumulado is None:
+            acumulado = rotas[rota] = _Acumulado()
+        acumulado.requisicoes += requisicoes
+        acumulado.erros += erros
+        for nome, dados in histogramas.items():
+            if nome in LIMITES:
+                acumulado.histogramas[nome].somar(Histograma.de_json(LIMITES[nome], dados))
+
+    linhas = []
+    for rota, acumulado in rotas.items():
+        latencia = acumulado.histogramas['latencia_ms']
+        consultas = acumulado.histogramas['consultas']
+        sql = acumulado.histogramas['sql_ms']
+        tamanho = acumulado.histogramas['bytes']
+        linhas.append({
+            'rota': rota,
+            'requisicoes': acumulado.requisicoes,
+            'erros': acumulado.erros,
+            'p50': latencia.percentil(50),
+            'p95': latencia.percentil(95),
+            'p99': latencia.percentil(99),
+            'max': latencia.maximo,
+            'tempo_total_s': latencia.soma / 1000,
+            'consultas_media': consultas.media(),
+            'consultas_p95': consultas.percentil(95),
+            'consultas_max': consultas.maximo,
+            'sql_p95': sql.percentil(95),
+            'sql_fracao': (sql.soma / latencia.soma) if latencia.soma else 0,
+            'bytes_p95': tamanho.percentil(95),
+        })
+    linhas.sort(key=lambda linha: -(linha['p95'] or 0))
+    return linhas
+
+
+# --- LIMPEZA (TAREFA PERIÓDICA DA FILA) ---
+
+@tarefas.registrar('limpar_metricas', proxima_execucao=lambda agora: agora + timedelta(days=1))
+def limpar_metricas():
+    from .models import MetricaRota
+
+    corte = timezone.now() - timedelta(days=settings.METRICAS_RETENCAO_DIAS)
+    return MetricaRota.objects.filter(inicio__lt=corte).delete()[0]
@@ -0,0 +1,18 @@
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0018_anotacaocliente'),
+    ]
+
+    operations = [
+        # Índice no RG: a consulta pública busca por "cpf = X OR rg = X" a cada pesquisa
+        migrations.AlterField(
+            model_name='cliente',
+            name='rg',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True, validators=[django.core.validators.RegexValidator('^\\d+$', 'Este campo deve conter apenas números (sem pontos ou traços).')]),
+        ),
+    ]
@@ -0,0 +1,67 @@
+import re
+
+import django.db.models.functions.text
+from django.db import migrations, models, transaction
+
+TAMANHO_LOTE = 1000
+
+
+# Cópia de entregas.models.normalizar_telefone (migrações não devem depender do código atual)
+def normalizar_telefone(valor):
+    digitos = re.sub(r'\D', '', str(valor or ''))
+    digitos = digitos.lstrip('0')
+    if digitos.startswith('55') and len(digitos) >= 12:
+        digitos = digitos[2:]
+    return digitos or None
+
+
+def preencher_telefones(apps, schema_editor):
+    # Preenche em lotes curtos, cada um na sua transação, para não travar a tabela inteira
+    Cliente = apps.get_model('entregas', 'Cliente')
+    ultimo_id = 0
+    while True:
+        with transaction.atomic():
+            lote = list(
+                Cliente.objects.filter(pk__gt=ultimo_id)
+                .exclude(telefone__isnull=True, telefone2__isnull=True)
+                .order_by('pk')
+                .only('pk', 'telefone', 'telefone2')[:TAMANHO_LOTE]
+            )
+            if not lote:
+                break
+            for cliente in lote:
+                cliente.telefone_normalizado = normalizar_telefone(cliente.telefone)
+                cliente.telefone2_normalizado = normalizar_telefone(cliente.telefone2)
+            Cliente.objects.bulk_update(lote, ['telefone_normalizado', 'telefone2_normalizado'])
+            ultimo_id = lote[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('entregas', '0019_cliente_rg_indice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone2_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.RunPython(preencher_telefones, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.text.Right('telefone_normalizado', 8), name='cliente_tel1_sufixo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.text.Right('telefone2_normalizado', 8), name='cliente_tel2_sufixo_idx'),
+        ),
+    ]
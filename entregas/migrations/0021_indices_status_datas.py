@@ -0,0 +1,40 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY não trava as escritas na tabela (o balcão continua funcionando),
+    # mas não pode rodar dentro de uma transação.
+    atomic = False
+
+    dependencies = [
+        ('entregas', '0020_cliente_telefones_normalizados'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='encomenda',
+            index=models.Index(fields=['status', 'descartado', 'data_entrega'], name='encomenda_status_entrega_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='encomenda',
+            index=models.Index(fields=['status', 'descartado', 'data_chegada'], name='encomenda_status_chegada_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='encomenda',
+            index=models.Index(condition=models.Q(('descartado', False), ('status', 'PENDENTE')), fields=['data_chegada'], name='encomenda_pendentes_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='encomenda',
+            index=models.Index(condition=models.Q(('descartado', False), ('status', 'PENDENTE')), fields=['cliente'], name='encomenda_pendentes_cli_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='encomenda',
+            index=models.Index(condition=models.Q(('descartado', True)), fields=['data_chegada'], name='encomenda_lixeira_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='retirada',
+            index=models.Index(fields=['status', 'data_retirada'], name='retirada_status_data_idx'),
+        ),
+    ]
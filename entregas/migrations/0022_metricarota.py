@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0021_indices_status_datas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricaRota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rota', models.CharField(max_length=200, verbose_name='Rota')),
+                ('inicio', models.DateTimeField(verbose_name='Início da Janela')),
+                ('fim', models.DateTimeField(verbose_name='Fim da Janela')),
+                ('requisicoes', models.PositiveIntegerField(default=0)),
+                ('erros', models.PositiveIntegerField(default=0)),
+                ('histogramas', models.JSONField(default=dict)),
+            ],
+            options={
+                'verbose_name': 'Métrica de Rota',
+                'verbose_name_plural': 'Métricas de Rotas',
+                'indexes': [models.Index(fields=['inicio'], name='metricarota_inicio_idx')],
+            },
+        ),
+    ]
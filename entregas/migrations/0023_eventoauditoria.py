@@ -0,0 +1,102 @@
+import datetime
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# Tabela particionada por mês (PARTITION BY RANGE), criada à mão porque o Django não gera esse DDL.
+# A chave primária precisa incluir a coluna de particionamento. O estado do Django continua vendo
+# um modelo comum com "id" como chave primária.
+CRIAR_TABELA = """
+CREATE TABLE entregas_eventoauditoria (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    data timestamp with time zone NOT NULL,
+    usuario_id integer NULL,
+    usuario_nome varchar(150) NOT NULL,
+    content_type_id integer NOT NULL,
+    object_id bigint NOT NULL,
+    object_repr varchar(200) NOT NULL,
+    acao smallint NOT NULL CHECK (acao >= 0),
+    mensagem text NOT NULL,
+    PRIMARY KEY (id, data)
+) PARTITION BY RANGE (data);
+
+CREATE TABLE entregas_eventoauditoria_padrao PARTITION OF entregas_eventoauditoria DEFAULT;
+
+CREATE INDEX auditoria_objeto_data_idx ON entregas_eventoauditoria (content_type_id, object_id, data);
+CREATE INDEX auditoria_usuario_data_idx ON entregas_eventoauditoria (usuario_id, data);
+CREATE INDEX auditoria_data_brin ON entregas_eventoauditoria USING brin (data);
+
+CREATE FUNCTION entregas_auditoria_somente_insercao() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'A auditoria aceita apenas inserções (% recusado)', TG_OP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER auditoria_somente_insercao
+    BEFORE UPDATE OR DELETE ON entregas_eventoauditoria
+    FOR EACH ROW EXECUTE FUNCTION entregas_auditoria_somente_insercao();
+"""
+
+REMOVER_TABELA = """
+DROP TABLE IF EXISTS entregas_eventoauditoria CASCADE;
+DROP FUNCTION IF EXISTS entregas_auditoria_somente_insercao();
+"""
+
+
+def criar_particoes_iniciais(apps, schema_editor):
+    # Mês atual e os 12 seguintes; os próximos são criados pelo comando "particoes_auditoria"
+    hoje = datetime.date.today()
+    for i in range(13):
+        ano, mes = hoje.year + (hoje.month - 1 + i) // 12, (hoje.month - 1 + i) % 12 + 1
+        inicio = datetime.datetime(ano, mes, 1, tzinfo=datetime.timezone.utc)
+        fim = datetime.datetime(ano + mes // 12, mes % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+        schema_editor.execute(
+            f"CREATE TABLE entregas_eventoauditoria_p{inicio:%Y_%m} PARTITION OF entregas_eventoauditoria "
+            f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entregas', '0022_metricarota'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CRIAR_TABELA, REMOVER_TABELA),
+                migrations.RunPython(criar_particoes_iniciais, migrations.RunPython.noop),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='EventoAuditoria',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('data', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data')),
+                        ('usuario_nome', models.CharField(blank=True, max_length=150, verbose_name='Nome do Operador')),
+                        ('object_id', models.BigIntegerField()),
+                        ('object_repr', models.CharField(max_length=200)),
+                        ('acao', models.PositiveSmallIntegerField(verbose_name='Ação')),
+                        ('mensagem', models.TextField(blank=True, verbose_name='Mensagem')),
+                        ('content_type', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='contenttypes.contenttype')),
+                        ('usuario', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Operador')),
+                    ],
+                    options={
+                        'verbose_name': 'Evento de Auditoria',
+                        'verbose_name_plural': 'Eventos de Auditoria',
+                        'indexes': [
+                            models.Index(fields=['content_type', 'object_id', 'data'], name='auditoria_objeto_data_idx'),
+                            models.Index(fields=['usuario', 'data'], name='auditoria_usuario_data_idx'),
+                            django.contrib.postgres.indexes.BrinIndex(fields=['data'], name='auditoria_data_brin'),
+                        ],
+                    },
+                ),
+            ],
+        ),
+    ]
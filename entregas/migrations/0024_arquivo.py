@@ -0,0 +1,61 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0023_eventoauditoria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetiradaArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data_retirada', models.DateTimeField(verbose_name='Data e Hora da Retirada')),
+                ('valor_total', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Valor Total Cobrado')),
+                ('status', models.CharField(choices=[('ATIVA', 'Ativa'), ('CANCELADA', 'Cancelada')], max_length=20, verbose_name='Status da Retirada')),
+                ('arquivada_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Arquivada em')),
+                ('operador', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Operador (Caixa)')),
+                ('retirado_por', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='retiradas_arquivadas', to='entregas.cliente', verbose_name='Retirado por')),
+            ],
+            options={
+                'verbose_name': 'Retirada Arquivada',
+                'verbose_name_plural': 'Retiradas Arquivadas',
+                'ordering': ['-data_retirada'],
+                'indexes': [models.Index(fields=['data_retirada'], name='retirada_arq_data_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EncomendaArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('descricao', models.CharField(max_length=200, verbose_name='Descrição da Encomenda')),
+                ('remetente', models.CharField(max_length=255, verbose_name='Remetente')),
+                ('observacao', models.CharField(blank=True, max_length=150, null=True, verbose_name='Observação')),
+                ('data_chegada', models.DateTimeField(verbose_name='Data de Chegada')),
+                ('data_entrega', models.DateTimeField(blank=True, null=True, verbose_name='Data de Entrega')),
+                ('valor_base', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Valor Base')),
+                ('valor_calculado', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Valor Calculado')),
+                ('valor_cobrado', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Valor Final Cobrado')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Aguardando Retirada'), ('ENTREGUE', 'Entregue ao Cliente')], max_length=20)),
+                ('descartado', models.BooleanField(default=False, verbose_name='Descartada')),
+                ('arquivada_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Arquivada em')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='encomendas_arquivadas', to='entregas.cliente')),
+                ('retirada', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='encomendas', to='entregas.retiradaarquivada', verbose_name='Retirada Vinculada')),
+            ],
+            options={
+                'verbose_name': 'Encomenda Arquivada',
+                'verbose_name_plural': 'Encomendas Arquivadas',
+                'ordering': ['-data_chegada'],
+                'indexes': [
+                    models.Index(fields=['status', 'descartado', 'data_entrega'], name='encomenda_arq_entrega_idx'),
+                    models.Index(fields=['data_chegada'], name='encomenda_arq_chegada_idx'),
+                ],
+            },
+        ),
+    ]
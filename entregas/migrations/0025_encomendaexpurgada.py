@@ -0,0 +1,26 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0024_arquivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncomendaExpurgada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cliente_id', models.BigIntegerField(db_index=True)),
+                ('descricao', models.CharField(max_length=200)),
+                ('data_chegada', models.DateTimeField()),
+                ('expurgada_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Encomenda Expurgada',
+                'verbose_name_plural': 'Encomendas Expurgadas',
+            },
+        ),
+    ]
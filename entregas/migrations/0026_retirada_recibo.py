@@ -0,0 +1,97 @@
+from django.db import migrations, models, transaction
+
+TAMANHO_LOTE = 500
+
+
+# Cópia de entregas.recibos.montar (migrações não devem depender do código atual)
+def _cliente(cliente):
+    return {
+        'id': cliente.pk, 'nome': cliente.nome, 'observacao': cliente.observacao,
+        'cpf': cliente.cpf, 'rg': cliente.rg, 'telefone': cliente.telefone, 'email': cliente.email,
+    }
+
+
+def montar_recibo(retirado_por, encomendas):
+    grupos = {}
+    for enc in sorted(encomendas, key=lambda e: (e.cliente.nome, e.data_chegada)):
+        referencia = enc.data_entrega or enc.data_chegada
+        dias_estoque = max(0, (referencia - enc.data_chegada).days)
+        valor_sugerido = float(enc.valor_base) * max(1, dias_estoque // 10)
+        grupo = grupos.setdefault(enc.cliente_id, {
+            'cliente': _cliente(enc.cliente), 'itens': [], 'subtotal': 0.0, 'sugerido': 0.0, 'desconto': 0.0,
+        })
+        grupo['itens'].append({
+            'id': enc.pk,
+            'descricao': enc.descricao,
+            'remetente': enc.remetente,
+            'data_chegada': enc.data_chegada.isoformat(),
+            'dias_estoque_calculado': dias_estoque,
+            'valor_base': float(enc.valor_base),
+            'valor_sugerido': valor_sugerido,
+            'valor_cobrado': float(enc.valor_cobrado) if enc.valor_cobrado is not None else None,
+        })
+        grupo['sugerido'] += valor_sugerido
+        if enc.valor_cobrado:
+            grupo['subtotal'] += float(enc.valor_cobrado)
+    for grupo in grupos.values():
+        grupo['desconto'] = max(0.0, grupo['sugerido'] - grupo['subtotal'])
+    return {
+        'versao': 1,
+        'retirado_por': _cliente(retirado_por),
+        'grupos': list(grupos.values()),
+        'qtd_itens': sum(len(g['itens']) for g in grupos.values()),
+        'sugerido_geral': sum(g['sugerido'] for g in grupos.values()),
+        'desconto_geral': sum(g['desconto'] for g in grupos.values()),
+    }
+
+
+def _preencher(Retirada, Encomenda):
+    # Lotes curtos, cada um na sua transação. Só retiradas com encomendas vinculadas: as canceladas
+    # antigas já não têm de onde tirar o recibo e continuam sem ele.
+    ultimo_id = 0
+    while True:
+        with transaction.atomic():
+            lote = list(
+                Retirada.objects.filter(pk__gt=ultimo_id, recibo__isnull=True)
+                .select_related('retirado_por').order_by('pk')[:TAMANHO_LOTE]
+            )
+            if not lote:
+                break
+            encomendas = {}
+            for enc in Encomenda.objects.filter(retirada__in=lote).select_related('cliente'):
+                encomendas.setdefault(enc.retirada_id, []).append(enc)
+            preenchidas = []
+            for retirada in lote:
+                if retirada.pk in encomendas:
+                    retirada.recibo = montar_recibo(retirada.retirado_por, encomendas[retirada.pk])
+                    preenchidas.append(retirada)
+            Retirada.objects.bulk_update(preenchidas, ['recibo'])
+            ultimo_id = lote[-1].pk
+
+
+def preencher_recibos(apps, schema_editor):
+    _preencher(apps.get_model('entregas', 'Retirada'), apps.get_model('entregas', 'Encomenda'))
+    _preencher(apps.get_model('entregas', 'RetiradaArquivada'), apps.get_model('entregas', 'EncomendaArquivada'))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('entregas', '0025_encomendaexpurgada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retirada',
+            name='recibo',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Recibo'),
+        ),
+        migrations.AddField(
+            model_name='retiradaarquivada',
+            name='recibo',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Recibo'),
+        ),
+        migrations.RunPython(preencher_recibos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0026_retirada_recibo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, verbose_name='Tarefa')),
+                ('argumentos', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EXECUTANDO', 'Executando'), ('CONCLUIDA', 'Concluída'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=20)),
+                ('executar_apos', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Executar Após')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('max_tentativas', models.PositiveSmallIntegerField(default=3, verbose_name='Máximo de Tentativas')),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Criada Em')),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciada Em')),
+                ('concluida_em', models.DateTimeField(blank=True, null=True, verbose_name='Concluída Em')),
+                ('trabalhador', models.CharField(blank=True, max_length=100, verbose_name='Processo')),
+                ('resultado', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('erro', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Tarefa em Segundo Plano',
+                'verbose_name_plural': 'Tarefas em Segundo Plano',
+                'ordering': ['-id'],
+                'indexes': [
+                    models.Index(condition=models.Q(('status', 'PENDENTE')), fields=['executar_apos', 'id'], name='tarefa_fila_idx'),
+                    models.Index(fields=['status', 'concluida_em'], name='tarefa_status_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0027_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notificacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('CHEGADA', 'Encomenda chegou'), ('AUMENTO_TAXA', 'Taxa de armazenagem vai aumentar')], max_length=20)),
+                ('referencia', models.PositiveSmallIntegerField(default=0)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('ENVIADA', 'Enviada'), ('SEM_CONTATO', 'Cliente sem e-mail'), ('DISPENSADA', 'Dispensada (encomenda já saiu)'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=20)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Criada Em')),
+                ('enviada_em', models.DateTimeField(blank=True, null=True, verbose_name='Enviada Em')),
+                ('erro', models.TextField(blank=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes', to='entregas.cliente')),
+                ('encomenda', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='entregas.encomenda')),
+            ],
+            options={
+                'verbose_name': 'Notificação',
+                'verbose_name_plural': 'Notificações',
+                'ordering': ['-id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDENTE')), fields=['id'], name='notificacao_pendente_idx')],
+                'constraints': [models.UniqueConstraint(fields=('encomenda', 'tipo', 'referencia'), name='notificacao_unica_por_evento')],
+            },
+        ),
+    ]
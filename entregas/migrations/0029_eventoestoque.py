@@ -0,0 +1,27 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0028_notificacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ADICIONADA', 'Encomenda adicionada'), ('ENTREGUE', 'Encomenda entregue'), ('CANCELADA', 'Entrega cancelada (voltou ao estoque)'), ('DESCARTADA', 'Encomenda descartada')], max_length=12)),
+                ('encomenda_id', models.BigIntegerField()),
+                ('cliente_id', models.BigIntegerField()),
+                ('data', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Evento de Estoque',
+                'verbose_name_plural': 'Eventos de Estoque',
+                'indexes': [models.Index(fields=['data'], name='eventoestoque_data_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0029_eventoestoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='versao',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='encomenda',
+            name='versao',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
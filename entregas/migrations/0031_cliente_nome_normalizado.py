@@ -0,0 +1,72 @@
+import re
+import unicodedata
+
+from django.db import migrations, models, transaction
+
+TAMANHO_LOTE = 1000
+
+
+# Cópia de entregas.models.normalizar_texto (migrações não devem depender do código atual)
+def normalizar_texto(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r'[^a-z0-9]+', ' ', texto)
+    return ' '.join(texto.split())
+
+
+def preencher_nomes(apps, schema_editor):
+    # Preenche em lotes curtos, cada um na sua transação, para não travar a tabela inteira
+    Cliente = apps.get_model('entregas', 'Cliente')
+    ultimo_id = 0
+    while True:
+        with transaction.atomic():
+            lote = list(Cliente.objects.filter(pk__gt=ultimo_id).order_by('pk').only('pk', 'nome')[:TAMANHO_LOTE])
+            if not lote:
+                break
+            for cliente in lote:
+                cliente.nome_normalizado = normalizar_texto(cliente.nome)[:200]
+            Cliente.objects.bulk_update(lote, ['nome_normalizado'])
+            ultimo_id = lote[-1].pk
+
+
+def criar_indice_trigramas(apps, schema_editor):
+    # Índice de trigramas (busca por trecho do nome) só onde a extensão pg_trgm existe no servidor;
+    # sem ela o autocomplete segue com a busca por início de palavra
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS cliente_nome_trgm_idx ON entregas_cliente USING gin (nome_normalizado gin_trgm_ops)"
+    )
+
+
+def remover_indice_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS cliente_nome_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('entregas', '0030_versao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='nome_normalizado',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(preencher_nomes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['nome_normalizado'], name='cliente_nome_norm_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(criar_indice_trigramas, remover_indice_trigramas),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0031_cliente_nome_normalizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacao',
+            name='reservada_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reservada Em'),
+        ),
+        migrations.AlterField(
+            model_name='notificacao',
+            name='status',
+            field=models.CharField(choices=[('PENDENTE', 'Pendente'), ('ENVIANDO', 'Enviando'), ('ENVIADA', 'Enviada'), ('SEM_CONTATO', 'Cliente sem e-mail'), ('DISPENSADA', 'Dispensada (encomenda já saiu)'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=20),
+        ),
+    ]
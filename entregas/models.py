@@ -1,8 +1,16 @@
 from django.db import models
+from django.db.models import Count, Q
+from django.db.models.functions import Length, Right
+from django.db.models.lookups import Exact, LessThan
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import BrinIndex
 from django.utils import timezone
+import re
+import unicodedata
 
 # --- VALIDADOR DE CPF ---
 def validar_cpf_algoritmo(value):
@@ -22,7 +30,103 @@ def validar_cpf_algoritmo(value):
         if digit != int(value[i]):
             raise ValidationError('CPF inválido (Dígitos verificadores não conferem).')
 
-class Cliente(models.Model):
+# --- REGRA DE COBRANÇA: o valor base é multiplicado a cada ciclo completo de 10 dias em estoque ---
+def calcular_cobranca(data_chegada, valor_base, referencia):
+    dias_estoque = (referencia - data_chegada).days
+    if dias_estoque < 0: dias_estoque = 0
+    multiplicador = max(1, dias_estoque // 10)
+    return dias_estoque, multiplicador, float(valor_base) * multiplicador
+
+# --- TELEFONES NORMALIZADOS (apenas dígitos, sem o código do país) ---
+def normalizar_telefone(valor):
+    digitos = re.sub(r'\D', '', str(valor or ''))
+    digitos = digitos.lstrip('0')  # prefixo de chamada interurbana/internacional (0XX, 00)
+    if digitos.startswith('55') and len(digitos) >= 12:
+        digitos = digitos[2:]
+    return digitos or None
+
+# --- TEXTO NORMALIZADO (sem acentos, minúsculo, só letras/números separados por um espaço) ---
+def normalizar_texto(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r'[^a-z0-9]+', ' ', texto)
+    return ' '.join(texto.split())
+
+class ClienteQuerySet(models.QuerySet):
+    def por_telefone(self, numero):
+        # Busca reversa de telefone: casa com ou sem DDI (+55), com ou sem DDD e com ou sem o
+        # nono dígito, usando os índices sobre os últimos 8 dígitos dos telefones normalizados.
+        digitos = normalizar_telefone(numero)
+        if not digitos or len(digitos) < 8:
+            return self.none()
+        sufixo = digitos[-8:]
+
+        condicao = Q()
+        for campo in ('telefone_normalizado', 'telefone2_normalizado'):
+            mesmo_numero = Q(Exact(Right(campo, 8), sufixo))
+            if len(digitos) >= 10:
+                # Com DDD informado, o DDD precisa bater quando o cadastro também tiver DDD
+                mesmo_numero &= Q(**{f'{campo}__startswith': digitos[:2]}) | Q(LessThan(Length(campo), 10))
+            condicao |= mesmo_numero
+        return self.filter(condicao)
+
+# --- FOTOGRAFIA DOS VALORES CARREGADOS DO BANCO ---
+# Guarda os valores de cada campo no momento em que o objeto é lido (from_db) e após cada save(),
+# para que o clean() compare "antes x depois" sem buscar o registro no banco de novo.
+class FotografiaMixin:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._fotografia = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        adiados = self.get_deferred_fields()
+        self._fotografia = {
+            f.attname: getattr(self, f.attname)
+            for f in self._meta.concrete_fields if f.attname not in adiados
+        }
+
+    def valores_originais(self, *campos):
+        # Valores dos campos como estão no banco. Objetos montados à mão (sem passar por
+        # from_db) caem na busca tradicional para não perder a validação.
+        if not self.pk:
+            return None
+        fotografia = getattr(self, '_fotografia', None)
+        if fotografia is not None and fotografia.get(self._meta.pk.attname) == self.pk and all(c in fotografia for c in campos):
+            return {c: fotografia[c] for c in campos}
+        return type(self)._default_manager.filter(pk=self.pk).values(*campos).first()
+
+# --- CONTROLE OTIMISTA DE CONCORRÊNCIA (CAMPO "versao") ---
+# Cada UPDATE feito pelo save() só vale se a versão no banco ainda for a que o objeto carregou (ou a
+# que o formulário trouxe no campo oculto) e já grava a próxima: "UPDATE ... WHERE id = X AND versao = N
+# SET versao = N + 1". Se outra tela salvou antes, nenhuma linha muda e o save() levanta
+# ConflitoDeEdicao em vez de sobrescrever a alteração alheia. Não segura lock entre a leitura e o save.
+# Quem altera em lote com queryset.update() deve incrementar a versão (versao=F('versao') + 1).
+class ConflitoDeEdicao(Exception):
+    pass
+
+class VersaoMixin:
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # save(update_fields=[...]) sem a versão é uma atualização parcial explícita: fica fora do controle
+        if update_fields is not None and 'versao' not in update_fields:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        esperada = self.versao
+        campo = self._meta.get_field('versao')
+        values = [(f, m, esperada + 1 if f is campo else v) for f, m, v in values]
+        if super()._do_update(base_qs.filter(versao=esperada), using, pk_val, values, update_fields, forced_update):
+            self.versao = esperada + 1
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise ConflitoDeEdicao(
+                f"{self._meta.verbose_name} #{pk_val}: outra pessoa salvou este registro enquanto você editava. "
+                "Recarregue a página para ver os dados atuais; suas alterações não foram salvas."
+            )
+        return False
+
+class Cliente(VersaoMixin, FotografiaMixin, models.Model):
     apenas_numeros = RegexValidator(r'^\d+$', 'Este campo deve conter apenas números (sem pontos ou traços).')
 
     nome = models.CharField(max_length=200)
@@ -34,7 +138,7 @@ class Cliente(models.Model):
         error_messages={'unique': 'Já existe um cliente cadastrado com este CPF.'}
     )
     
-    rg = models.CharField(max_length=20, blank=True, null=True, validators=[apenas_numeros])
+    rg = models.CharField(max_length=20, blank=True, null=True, db_index=True, validators=[apenas_numeros])
     
     genero = models.CharField(max_length=20, choices=[('M', 'Masculino'), ('F', 'Feminino'), ('O', 'Outro')], blank=True, null=True)
     telefone = models.CharField(max_length=20, blank=True, null=True, verbose_name="Telefone 1")
@@ -42,25 +146,58 @@ class Cliente(models.Model):
     email = models.EmailField(blank=True, null=True)
     data_cadastro = models.DateTimeField(auto_now_add=True)
 
+    # Cópias só com dígitos dos telefones, mantidas pelo save() (usadas na busca por telefone)
+    telefone_normalizado = models.CharField(max_length=20, blank=True, null=True, editable=False)
+    telefone2_normalizado = models.CharField(max_length=20, blank=True, null=True, editable=False)
+    # Nome sem acentos/caixa, mantido pelo save() (usado pelo autocomplete de clientes)
+    nome_normalizado = models.CharField(max_length=200, blank=True, default='', editable=False)
+
+    versao = models.PositiveIntegerField(default=1)
+
+    objects = ClienteQuerySet.as_manager()
+
     def clean(self):
-        # 1. Validação de Unicidade de RG (RG não pode ser igual a outro RG)
-        if self.rg:
-            if Cliente.objects.filter(rg=self.rg).exclude(pk=self.pk).exists():
-                raise ValidationError({'rg': 'Já existe um cliente cadastrado com este RG.'})
+        # Cada verificação só roda se os campos dela mudaram desde a leitura (fotografia)
+        original = self.valores_originais('nome', 'cpf', 'rg')
+        atual = {'nome': self.nome, 'cpf': self.cpf or None, 'rg': self.rg or None}
+        mudou = lambda *campos: original is None or any(original[c] != atual[c] for c in campos)
 
+        # As três verificações abaixo são resolvidas numa única consulta
+        filtro = Q(pk__in=[])
+        contagens = {}
+        if self.rg and mudou('rg'):
+            # 1. Validação de Unicidade de RG (RG não pode ser igual a outro RG)
+            rg_duplicado = Q(rg=self.rg) & ~Q(pk=self.pk)
             # 2. NOVA VALIDAÇÃO (SOLICITADA): RG não pode ser igual a um CPF existente
             # Isso impede que o RG digitado coincida com o CPF de qualquer pessoa no sistema
-            if Cliente.objects.filter(cpf=self.rg).exists():
-                raise ValidationError({'rg': 'Este número já está cadastrado como CPF no sistema. Por segurança, ele não pode ser usado como RG.'})
+            rg_como_cpf = Q(cpf=self.rg)
+            filtro |= rg_duplicado | rg_como_cpf
+            contagens['rg_duplicado'] = Count('pk', filter=rg_duplicado)
+            contagens['rg_como_cpf'] = Count('pk', filter=rg_como_cpf)
 
         # 3. Validação de Nome (se não tiver docs)
-        if not self.cpf and not self.rg:
-            if Cliente.objects.filter(nome__iexact=self.nome).exclude(pk=self.pk).exists():
-                raise ValidationError('Já existe um cliente com este Nome. Informe CPF ou RG.')
+        if not self.cpf and not self.rg and mudou('nome', 'cpf', 'rg'):
+            nome_duplicado = Q(nome__iexact=self.nome) & ~Q(pk=self.pk)
+            filtro |= nome_duplicado
+            contagens['nome_duplicado'] = Count('pk', filter=nome_duplicado)
+
+        if not contagens:
+            return
+
+        conflitos = Cliente.objects.filter(filtro).aggregate(**contagens)
+        if conflitos.get('rg_duplicado'):
+            raise ValidationError({'rg': 'Já existe um cliente cadastrado com este RG.'})
+        if conflitos.get('rg_como_cpf'):
+            raise ValidationError({'rg': 'Este número já está cadastrado como CPF no sistema. Por segurança, ele não pode ser usado como RG.'})
+        if conflitos.get('nome_duplicado'):
+            raise ValidationError('Já existe um cliente com este Nome. Informe CPF ou RG.')
 
     def save(self, *args, **kwargs):
         if not self.cpf: self.cpf = None
         if not self.rg: self.rg = None
+        self.telefone_normalizado = normalizar_telefone(self.telefone)
+        self.telefone2_normalizado = normalizar_telefone(self.telefone2)
+        self.nome_normalizado = normalizar_texto(self.nome)[:200]
         super().save(*args, **kwargs)
 
     # TRAVA: Proíbe deletar clientes ligados a retiradas passadas
@@ -69,6 +206,8 @@ class Cliente(models.Model):
             raise ValidationError("Este cliente não pode ser apagado pois é responsável por uma ou mais Retiradas no histórico.")
         if self.encomenda_set.filter(retirada__isnull=False).exists():
             raise ValidationError("Este cliente possui encomendas vinculadas a uma Retirada financeira. Ele não pode ser apagado.")
+        if self.retiradas_arquivadas.exists() or self.encomendas_arquivadas.exists():
+            raise ValidationError("Este cliente possui histórico no arquivo de encomendas. Ele não pode ser apagado.")
         return super().delete(*args, **kwargs)
 
     def __str__(self):
@@ -81,6 +220,12 @@ class Cliente(models.Model):
         ordering = ['nome']
         verbose_name = 'Cliente'
         verbose_name_plural = 'Clientes'
+        indexes = [
+            models.Index(Right('telefone_normalizado', 8), name='cliente_tel1_sufixo_idx'),
+            models.Index(Right('telefone2_normalizado', 8), name='cliente_tel2_sufixo_idx'),
+            # varchar_pattern_ops: atende LIKE 'prefixo%' qualquer que seja a collation do banco
+            models.Index(fields=['nome_normalizado'], opclasses=['varchar_pattern_ops'], name='cliente_nome_norm_idx'),
+        ]
 
 # NOVA CLASSE: O RECIBO BLINDADO
 class Retirada(models.Model):
@@ -94,6 +239,8 @@ class Retirada(models.Model):
     data_retirada = models.DateTimeField(auto_now_add=True, verbose_name="Data e Hora da Retirada")
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Valor Total Cobrado")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ATIVA', verbose_name="Status da Retirada")
+    # Recibo calculado na baixa (ver entregas/recibos.py); a tela da retirada lê daqui
+    recibo = models.JSONField(null=True, blank=True, editable=False, verbose_name="Recibo")
 
     def __str__(self):
         return f"Retirada #{self.id} - {self.retirado_por.nome}"
@@ -102,8 +249,11 @@ class Retirada(models.Model):
         ordering = ['-data_retirada']
         verbose_name = 'Retirada'
         verbose_name_plural = 'Histórico de Retiradas'
+        indexes = [
+            models.Index(fields=['status', 'data_retirada'], name='retirada_status_data_idx'),
+        ]
 
-class Encomenda(models.Model):
+class Encomenda(VersaoMixin, FotografiaMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDENTE', 'Aguardando Retirada'),
         ('ENTREGUE', 'Entregue ao Cliente'),
@@ -134,22 +284,21 @@ class Encomenda(models.Model):
     # NOVO: Vínculo da caixa com o Recibo
     retirada = models.ForeignKey(Retirada, on_delete=models.PROTECT, blank=True, null=True, related_name='encomendas', verbose_name="Retirada Vinculada")
 
+    versao = models.PositiveIntegerField(default=1)
+
+    CAMPOS_BLINDADOS = ('data_chegada', 'descricao', 'valor_base', 'remetente', 'valor_cobrado')
+
     def clean(self):
-        if self.pk:
-            try:
-                old_obj = Encomenda.objects.get(pk=self.pk)
-                if old_obj.retirada_id and self.retirada_id:
-                    if self.descartado:
-                        raise ValidationError({'descartado': 'Uma encomenda vinculada a uma Retirada não pode ser descartada.'})
-                    if self.status == 'PENDENTE':
-                        raise ValidationError({'status': 'Uma encomenda entregue não pode ser alterada manualmente. Cancele a Retirada associada na tela de Auditoria.'})
-                    
-                    if (old_obj.data_chegada != self.data_chegada or old_obj.descricao != self.descricao or 
-                        old_obj.valor_base != self.valor_base or old_obj.remetente != self.remetente or 
-                        old_obj.valor_cobrado != self.valor_cobrado):
-                        raise ValidationError('Os dados logísticos e financeiros de uma encomenda vinculada a uma Retirada são blindados (Somente Leitura).')
-            except Encomenda.DoesNotExist:
-                pass
+        # Compara com a fotografia tirada ao carregar do banco (sem nova consulta)
+        old_obj = self.valores_originais('retirada_id', *self.CAMPOS_BLINDADOS)
+        if old_obj and old_obj['retirada_id'] and self.retirada_id:
+            if self.descartado:
+                raise ValidationError({'descartado': 'Uma encomenda vinculada a uma Retirada não pode ser descartada.'})
+            if self.status == 'PENDENTE':
+                raise ValidationError({'status': 'Uma encomenda entregue não pode ser alterada manualmente. Cancele a Retirada associada na tela de Auditoria.'})
+            
+            if any(old_obj[campo] != getattr(self, campo) for campo in self.CAMPOS_BLINDADOS):
+                raise ValidationError('Os dados logísticos e financeiros de uma encomenda vinculada a uma Retirada são blindados (Somente Leitura).')
 
     def save(self, *args, **kwargs):
         # Se voltar para Pendente, limpa TUDO (incluindo o cobrado)
@@ -183,6 +332,85 @@ class Encomenda(models.Model):
         # Proteção contra duplicidade exata:
         # Não permite criar outra encomenda com mesmo cliente, descrição e data exata (segundos)
         unique_together = ('cliente', 'descricao', 'data_chegada')
+        # Índices dos filtros usados em quase toda tela (status + descartado + data)
+        indexes = [
+            models.Index(fields=['status', 'descartado', 'data_entrega'], name='encomenda_status_entrega_idx'),
+            models.Index(fields=['status', 'descartado', 'data_chegada'], name='encomenda_status_chegada_idx'),
+            # Parciais: só o estoque atual (pendentes não descartadas) e a lixeira, que são pequenos
+            models.Index(fields=['data_chegada'], condition=Q(status='PENDENTE', descartado=False), name='encomenda_pendentes_idx'),
+            models.Index(fields=['cliente'], condition=Q(status='PENDENTE', descartado=False), name='encomenda_pendentes_cli_idx'),
+            models.Index(fields=['data_chegada'], condition=Q(descartado=True), name='encomenda_lixeira_idx'),
+        ]
+
+# --- ARQUIVO (HISTÓRICO FRIO) ---
+# Cópias das retiradas quitadas e das encomendas entregues/descartadas mais antigas que o prazo de
+# retenção (ver entregas/arquivo.py), com os mesmos IDs da tabela de origem. Ficam fora da tabela
+# do balcão, mas continuam protegidas: o cliente não pode ser apagado enquanto tiver histórico aqui.
+class RetiradaArquivada(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    retirado_por = models.ForeignKey(Cliente, on_delete=models.PROTECT, related_name='retiradas_arquivadas', verbose_name="Retirado por")
+    operador = models.ForeignKey(User, on_delete=models.PROTECT, related_name='+', verbose_name="Operador (Caixa)")
+    data_retirada = models.DateTimeField(verbose_name="Data e Hora da Retirada")
+    valor_total = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Valor Total Cobrado")
+    status = models.CharField(max_length=20, choices=Retirada.STATUS_CHOICES, verbose_name="Status da Retirada")
+    recibo = models.JSONField(null=True, blank=True, editable=False, verbose_name="Recibo")
+    arquivada_em = models.DateTimeField(default=timezone.now, verbose_name="Arquivada em")
+
+    def __str__(self):
+        return f"Retirada #{self.id} - {self.retirado_por.nome}"
+
+    class Meta:
+        ordering = ['-data_retirada']
+        verbose_name = 'Retirada Arquivada'
+        verbose_name_plural = 'Retiradas Arquivadas'
+        indexes = [
+            models.Index(fields=['data_retirada'], name='retirada_arq_data_idx'),
+        ]
+
+class EncomendaArquivada(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT, related_name='encomendas_arquivadas')
+    descricao = models.CharField(max_length=200, verbose_name="Descrição da Encomenda")
+    remetente = models.CharField(max_length=255, verbose_name="Remetente")
+    observacao = models.CharField(max_length=150, blank=True, null=True, verbose_name="Observação")
+    data_chegada = models.DateTimeField(verbose_name="Data de Chegada")
+    data_entrega = models.DateTimeField(verbose_name="Data de Entrega", blank=True, null=True)
+    valor_base = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Valor Base")
+    valor_calculado = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, verbose_name="Valor Calculado")
+    valor_cobrado = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, verbose_name="Valor Final Cobrado")
+    status = models.CharField(max_length=20, choices=Encomenda.STATUS_CHOICES)
+    descartado = models.BooleanField(default=False, verbose_name="Descartada")
+    retirada = models.ForeignKey(RetiradaArquivada, on_delete=models.PROTECT, blank=True, null=True, related_name='encomendas', verbose_name="Retirada Vinculada")
+    arquivada_em = models.DateTimeField(default=timezone.now, verbose_name="Arquivada em")
+
+    def __str__(self):
+        return f"{self.descricao} - {self.cliente.nome}"
+
+    class Meta:
+        ordering = ['-data_chegada']
+        verbose_name = 'Encomenda Arquivada'
+        verbose_name_plural = 'Encomendas Arquivadas'
+        indexes = [
+            models.Index(fields=['status', 'descartado', 'data_entrega'], name='encomenda_arq_entrega_idx'),
+            models.Index(fields=['data_chegada'], name='encomenda_arq_chegada_idx'),
+        ]
+
+# --- LÁPIDE DAS ENCOMENDAS EXPURGADAS DA LIXEIRA ---
+# Registro mínimo do que foi apagado definitivamente pelo "limpar_lixeira" (ver entregas/lixeira.py),
+# para responder "o que aconteceu com a encomenda #X?". Sem chaves estrangeiras: sobrevive ao cliente.
+class EncomendaExpurgada(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    cliente_id = models.BigIntegerField(db_index=True)
+    descricao = models.CharField(max_length=200)
+    data_chegada = models.DateTimeField()
+    expurgada_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"#{self.id} - {self.descricao} (expurgada em {self.expurgada_em:%d/%m/%Y})"
+
+    class Meta:
+        verbose_name = 'Encomenda Expurgada'
+        verbose_name_plural = 'Encomendas Expurgadas'
 
 class PalavraChave(models.Model):
     cliente = models.CharField(max_length=255, verbose_name="Cliente")
@@ -208,4 +436,149 @@ class AnotacaoCliente(models.Model):
     class Meta:
         ordering = ['-data_hora']
         verbose_name = 'Anotação de Cliente'
-        verbose_name_plural = 'Anotações de Clientes'
\ No newline at end of file
+        verbose_name_plural = 'Anotações de Clientes'
+
+class MetricaRota(models.Model):
+    # Histogramas de uma janela de coleta (ver entregas/metricas.py), um registro por rota
+    rota = models.CharField(max_length=200, verbose_name="Rota")
+    inicio = models.DateTimeField(verbose_name="Início da Janela")
+    fim = models.DateTimeField(verbose_name="Fim da Janela")
+    requisicoes = models.PositiveIntegerField(default=0)
+    erros = models.PositiveIntegerField(default=0)
+    histogramas = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.rota} ({self.inicio:%d/%m/%Y %H:%M})"
+
+    class Meta:
+        verbose_name = 'Métrica de Rota'
+        verbose_name_plural = 'Métricas de Rotas'
+        indexes = [
+            models.Index(fields=['inicio'], name='metricarota_inicio_idx'),
+        ]
+
+class EventoAuditoria(models.Model):
+    # Trilha de auditoria só de inserções (ver entregas/auditoria.py). No PostgreSQL a tabela é
+    # particionada por mês em "data" (chave primária (id, data)) e recusa UPDATE e DELETE.
+    # Usuário e tipo de objeto não têm chave estrangeira no banco: o histórico sobrevive à exclusão deles.
+    data = models.DateTimeField(default=timezone.now, verbose_name="Data")
+    usuario = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+', verbose_name="Operador")
+    usuario_nome = models.CharField(max_length=150, blank=True, verbose_name="Nome do Operador")
+    content_type = models.ForeignKey(ContentType, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    object_id = models.BigIntegerField()
+    object_repr = models.CharField(max_length=200)
+    acao = models.PositiveSmallIntegerField(verbose_name="Ação")
+    mensagem = models.TextField(blank=True, verbose_name="Mensagem")
+
+    def __str__(self):
+        return f"{self.object_repr} ({self.data:%d/%m/%Y %H:%M})"
+
+    class Meta:
+        verbose_name = 'Evento de Auditoria'
+        verbose_name_plural = 'Eventos de Auditoria'
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'data'], name='auditoria_objeto_data_idx'),
+            models.Index(fields=['usuario', 'data'], name='auditoria_usuario_data_idx'),
+            BrinIndex(fields=['data'], name='auditoria_data_brin'),
+        ]
+
+# --- FILA DE TAREFAS EM SEGUNDO PLANO ---
+# Tarefas guardadas no próprio banco e executadas pelo "manage.py processar_tarefas" (ver entregas/tarefas.py).
+class Tarefa(models.Model):
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('EXECUTANDO', 'Executando'),
+        ('CONCLUIDA', 'Concluída'),
+        ('FALHOU', 'Falhou'),
+    ]
+    nome = models.CharField(max_length=100, verbose_name="Tarefa")
+    argumentos = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
+    executar_apos = models.DateTimeField(default=timezone.now, verbose_name="Executar Após")
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    max_tentativas = models.PositiveSmallIntegerField(default=3, verbose_name="Máximo de Tentativas")
+    criada_em = models.DateTimeField(default=timezone.now, verbose_name="Criada Em")
+    iniciada_em = models.DateTimeField(null=True, blank=True, verbose_name="Iniciada Em")
+    concluida_em = models.DateTimeField(null=True, blank=True, verbose_name="Concluída Em")
+    trabalhador = models.CharField(max_length=100, blank=True, verbose_name="Processo")
+    resultado = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    erro = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.nome} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-id']
+        verbose_name = 'Tarefa em Segundo Plano'
+        verbose_name_plural = 'Tarefas em Segundo Plano'
+        indexes = [
+            # Só as pendentes interessam ao trabalhador: o índice fica pequeno mesmo com o histórico crescendo
+            models.Index(fields=['executar_apos', 'id'], name='tarefa_fila_idx', condition=Q(status='PENDENTE')),
+            models.Index(fields=['status', 'concluida_em'], name='tarefa_status_idx'),
+        ]
+
+# --- CAIXA DE SAÍDA DE NOTIFICAÇÕES ---
+# Avisos ao cliente registrados no momento do evento e enviados depois, em lotes, pelo trabalhador
+# da fila (ver entregas/notificacoes.py). Um registro por encomenda e evento; o envio junta os do mesmo cliente.
+class Notificacao(models.Model):
+    TIPO_CHOICES = [
+        ('CHEGADA', 'Encomenda chegou'),
+        ('AUMENTO_TAXA', 'Taxa de armazenagem vai aumentar'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ENVIADA', 'Enviada'),
+        ('SEM_CONTATO', 'Cliente sem e-mail'),
+        ('DISPENSADA', 'Dispensada (encomenda já saiu)'),
+        ('FALHOU', 'Falhou'),
+    ]
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='notificacoes')
+    # Sem chave estrangeira no banco: o arquivamento e a limpeza da lixeira apagam encomendas em lote
+    encomenda = models.ForeignKey(Encomenda, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    # No aviso de aumento, o multiplicador que a taxa vai atingir (um aviso por ciclo)
+    referencia = models.PositiveSmallIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    criada_em = models.DateTimeField(default=timezone.now, verbose_name="Criada Em")
+    # Quando o trabalhador reservou a notificação para enviar (status ENVIANDO)
+    reservada_em = models.DateTimeField(null=True, blank=True, verbose_name="Reservada Em")
+    enviada_em = models.DateTimeField(null=True, blank=True, verbose_name="Enviada Em")
+    erro = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - cliente #{self.cliente_id}"
+
+    class Meta:
+        ordering = ['-id']
+        verbose_name = 'Notificação'
+        verbose_name_plural = 'Notificações'
+        constraints = [
+            models.UniqueConstraint(fields=['encomenda', 'tipo', 'referencia'], name='notificacao_unica_por_evento'),
+        ]
+        indexes = [
+            models.Index(fields=['id'], name='notificacao_pendente_idx', condition=Q(status='PENDENTE')),
+        ]
+
+# --- EVENTOS DE ESTOQUE (TELAS AO VIVO) ---
+# Registro curto das mudanças de estoque transmitidas às telas abertas (ver entregas/eventos.py).
+# É só um log de poucas horas: ids soltos, sem chaves estrangeiras.
+class EventoEstoque(models.Model):
+    TIPO_CHOICES = [
+        ('ADICIONADA', 'Encomenda adicionada'),
+        ('ENTREGUE', 'Encomenda entregue'),
+        ('CANCELADA', 'Entrega cancelada (voltou ao estoque)'),
+        ('DESCARTADA', 'Encomenda descartada'),
+    ]
+    tipo = models.CharField(max_length=12, choices=TIPO_CHOICES)
+    encomenda_id = models.BigIntegerField()
+    cliente_id = models.BigIntegerField()
+    data = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Evento de Estoque'
+        verbose_name_plural = 'Eventos de Estoque'
+        indexes = [
+            models.Index(fields=['data'], name='eventoestoque_data_idx'),
+        ]
@@ -0,0 +1,181 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import tarefas
+from .models import Encomenda, Notificacao
+
+# --- NOTIFICAÇÕES AOS CLIENTES (CAIXA DE SAÍDA) ---
+# Os eventos ("encomenda chegou", "a taxa de armazenagem vai aumentar") só são registrados em
+# Notificacao no momento em que acontecem: um INSERT, sem rede nenhuma no salvamento do admin.
+# Quem envia é o trabalhador da fila (manage.py processar_tarefas):
+#   - cada chegada agenda um "enviar_notificacoes" para daqui a NOTIFICACOES_JANELA segundos (um só
+#     por vez), então várias encomendas lançadas em sequência para o mesmo cliente viram uma mensagem;
+#   - o "avisar_aumento_taxa" roda todo dia em NOTIFICACOES_HORARIO_AVISO e avisa das encomendas cujo
+#     multiplicador da taxa sobe nos próximos NOTIFICACOES_AVISO_DIAS dias (uma vez por ciclo).
+# O envio é feito em lotes por um backend de e-mail do Django (NOTIFICACOES_EMAIL_BACKEND): SMTP em
+# produção, console ou arquivo (EMAIL_FILE_PATH) para testar. Uma conexão SMTP serve o lote inteiro.
+# Cada lote é reservado (status ENVIANDO) numa transação curta e enviado fora dela; envios que falham
+# voltam à fila com espera crescente (TAREFAS_ESPERA_RETENTATIVA * 2^n) até MAX_TENTATIVAS.
+
+MAX_TENTATIVAS = 3
+
+
+def _agendar_envio():
+    tarefas.agendar_unica(
+        'enviar_notificacoes', executar_apos=timezone.now() + timedelta(seconds=settings.NOTIFICACOES_JANELA),
+    )
+
+
+def registrar_chegadas(encomendas):
+    if not settings.NOTIFICACOES_ATIVAS:
+        return
+    novas = [
+        Notificacao(cliente_id=enc.cliente_id, encomenda=enc, tipo='CHEGADA')
+        for enc in encomendas if not enc.descartado and enc.status == 'PENDENTE'
+    ]
+    if novas:
+        Notificacao.objects.bulk_create(novas, ignore_conflicts=True)
+        transaction.on_commit(_agendar_envio)
+
+
+def registrar_avisos_aumento(agora=None):
+    # O multiplicador é dias // 10 (mínimo 1): sobe para 2 no 20º dia em estoque, 3 no 30º, ...
+    agora = agora or timezone.now()
+    novas = []
+    pendentes = Encomenda.objects.filter(status='PENDENTE', descartado=False).values_list('pk', 'cliente_id', 'data_chegada')
+    for pk, cliente_id, data_chegada in pendentes.iterator(chunk_size=2000):
+        dias = max(0, (agora - data_chegada).days)
+        proximo = max(2, dias // 10 + 1)
+        if proximo * 10 - dias <= settings.NOTIFICACOES_AVISO_DIAS:
+            novas.append(Notificacao(cliente_id=cliente_id, encomenda_id=pk, tipo='AUMENTO_TAXA', referencia=proximo))
+    # O aviso de um ciclo já registrado é ignorado pela restrição única (encomenda, tipo, referencia)
+    Notificacao.objects.bulk_create(novas, ignore_conflicts=True, batch_size=500)
+    return len(novas)
+
+
+def montar_mensagem(cliente, notificacoes):
+    chegadas = [n.encomenda for n in notificacoes if n.tipo == 'CHEGADA']
+    aumentos = [n for n in notificacoes if n.tipo == 'AUMENTO_TAXA']
+    linhas = [f"Olá, {cliente.nome}!", ""]
+    if chegadas:
+        linhas.append("Chegaram encomendas para você na Drogafoz:" if len(chegadas) > 1 else "Chegou uma encomenda para você na Drogafoz:")
+        linhas += [f"  - {enc.descricao} (de {enc.remetente}), em {timezone.localtime(enc.data_chegada):%d/%m/%Y}" for enc in chegadas]
+        linhas.append("")
+    if aumentos:
+        linhas.append("A taxa de armazenagem destas encomendas vai aumentar:")
+        for n in aumentos:
+            data = timezone.localtime(n.encomenda.data_chegada + timedelta(days=n.referencia * 10))
+            linhas.append(f"  - {n.encomenda.descricao}: a partir de {data:%d/%m/%Y} passa a {n.referencia}x o valor base")
+        linhas.append("")
+    linhas.append("Retire no balcão apresentando um documento com foto.")
+
+    assunto = "Encomenda aguardando retirada" if chegadas else "Aviso de aumento da taxa de armazenagem"
+    return EmailMessage(assunto, "\n".join(linhas), settings.NOTIFICACOES_REMETENTE, [cliente.email])
+
+
+def _enviar_lote(lote, conexao, totais):
+    agora = timezone.now()
+    por_cliente = defaultdict(list)
+    for n in lote:
+        por_cliente[n.cliente_id].append(n)
+
+    for notificacoes in por_cliente.values():
+        cliente = notificacoes[0].cliente
+        validas = []
+        for n in notificacoes:
+            # Entregue, descartada ou já arquivada/expurgada desde o registro: não há mais o que avisar
+            if n.encomenda is None or n.encomenda.status != 'PENDENTE' or n.encomenda.descartado:
+                n.status = 'DISPENSADA'
+            elif not cliente.email:
+                n.status = 'SEM_CONTATO'
+            else:
+                validas.append(n)
+        if not validas:
+            continue
+
+        try:
+            conexao.send_messages([montar_mensagem(cliente, validas)])
+        except Exception as e:
+            for n in validas:
+                n.tentativas += 1
+                n.status = 'FALHOU' if n.tentativas >= MAX_TENTATIVAS else 'PENDENTE'
+                n.erro = str(e)[:1000]
+        else:
+            for n in validas:
+                n.status, n.enviada_em, n.erro = 'ENVIADA', agora, ''
+            totais['mensagens'] += 1
+
+    for n in lote:
+        totais[n.status.lower()] += 1
+    Notificacao.objects.bulk_update(lote, ['status', 'tentativas', 'enviada_em', 'erro'])
+
+
+def _reservar(ultimo, tamanho_lote):
+    # Transação curta só para a reserva (skip_locked: dois trabalhadores nunca pegam o mesmo aviso); o
+    # envio acontece depois, sem transação nem trava aberta enquanto o servidor SMTP responde
+    with transaction.atomic():
+        pks = list(
+            Notificacao.objects.filter(status='PENDENTE', pk__gt=ultimo).order_by('pk')
+            .select_for_update(skip_locked=True).values_list('pk', flat=True)[:tamanho_lote]
+        )
+        Notificacao.objects.filter(pk__in=pks).update(status='ENVIANDO', reservada_em=timezone.now())
+    return list(Notificacao.objects.filter(pk__in=pks).select_related('cliente', 'encomenda').order_by('pk'))
+
+
+def recuperar_interrompidas():
+    # Reservadas por um trabalhador que morreu no meio do envio: podem ter saído ou não. Vão para
+    # FALHOU (e não de volta à fila) para nunca mandar duas vezes; a ação "Enviar novamente" as reenvia.
+    limite = timezone.now() - timedelta(seconds=settings.TAREFAS_TEMPO_LIMITE)
+    return Notificacao.objects.filter(status='ENVIANDO', reservada_em__lt=limite).update(
+        status='FALHOU', erro='Interrompida durante o envio: pode ter sido enviada ou não.',
+    )
+
+
+def enviar_pendentes(tamanho_lote=100):
+    totais = Counter()
+    recuperar_interrompidas()
+    ultimo = 0
+    espera = None
+    with get_connection(settings.NOTIFICACOES_EMAIL_BACKEND) as conexao:
+        while True:
+            lote = _reservar(ultimo, tamanho_lote)
+            if not lote:
+                break
+            ultimo = lote[-1].pk
+            _enviar_lote(lote, conexao, totais)
+            # Falhas que voltaram para a fila: nova tentativa com espera crescente, sem depender da
+            # próxima chegada ou do aviso diário
+            tentativas = [n.tentativas for n in lote if n.status == 'PENDENTE']
+            if tentativas:
+                atual = settings.TAREFAS_ESPERA_RETENTATIVA * 2 ** (min(tentativas) - 1)
+                espera = atual if espera is None else min(espera, atual)
+    if espera is not None:
+        tarefas.agendar_unica('enviar_notificacoes', executar_apos=timezone.now() + timedelta(seconds=espera))
+    return dict(totais)
+
+
+# --- TAREFAS DA FILA ---
+
+def _proximo_aviso(agora):
+    hora = datetime.strptime(settings.NOTIFICACOES_HORARIO_AVISO, '%H:%M').time()
+    local = timezone.localtime(agora)
+    alvo = local.replace(hour=hora.hour, minute=hora.minute, second=0, microsecond=0)
+    return alvo if alvo > local else alvo + timedelta(days=1)
+
+
+@tarefas.registrar('enviar_notificacoes')
+def tarefa_enviar_notificacoes():
+    return enviar_pendentes()
+
+
+@tarefas.registrar('avisar_aumento_taxa', proxima_execucao=_proximo_aviso)
+def tarefa_avisar_aumento_taxa():
+    if not settings.NOTIFICACOES_ATIVAS:
+        return {}
+    candidatos = registrar_avisos_aumento()
+    return {'candidatos': candidatos, **enviar_pendentes()}
@@ -0,0 +1,134 @@
+import threading
+import uuid
+from collections import deque
+
+from django.core.cache import cache
+
+from .autocompletar import rotulo
+from .models import Cliente, PalavraChave, normalizar_texto
+
+# --- SUGESTÃO DE DONO PELAS PALAVRAS-CHAVE ---
+# As palavras-chave (PalavraChave: "palavra X -> cliente Y") ficavam só no post-it da tela inicial e
+# eram conferidas de olho a cada chegada. Aqui todas são compiladas num único autômato Aho-Corasick
+# sobre o texto normalizado (sem acento/caixa/pontuação), e a descrição, o remetente e a observação da
+# encomenda são percorridos uma vez cada, qualquer que seja a quantidade de palavras cadastradas.
+# Só valem ocorrências de palavras inteiras ("ana" não casa com "banana").
+#
+# O autômato de cada processo é remontado sob demanda quando a versão no cache muda; salvar ou apagar
+# uma PalavraChave troca a versão (entregas/signals.py).
+
+PREFIXO = 'palavras_chave:v1'
+CAMPOS = ('descricao', 'remetente', 'observacao')
+
+
+class Automato:
+    def __init__(self, palavras):
+        # palavras: lista de textos já normalizados; as saídas são os índices nessa lista
+        self.palavras = palavras
+        self.transicoes = [{}]
+        self.falhas = [0]
+        self.saidas = [()]
+        for indice, palavra in enumerate(palavras):
+            estado = 0
+            for letra in palavra:
+                proximo = self.transicoes[estado].get(letra)
+                if proximo is None:
+                    proximo = len(self.transicoes)
+                    self.transicoes[estado][letra] = proximo
+                    self.transicoes.append({})
+                    self.falhas.append(0)
+                    self.saidas.append(())
+                estado = proximo
+            self.saidas[estado] += (indice,)
+
+        # Ligações de falha em largura: cada estado herda as saídas do seu sufixo mais longo
+        fila = deque(self.transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for letra, proximo in self.transicoes[estado].items():
+                fila.append(proximo)
+                falha = self.falhas[estado]
+                while falha and letra not in self.transicoes[falha]:
+                    falha = self.falhas[falha]
+                destino = self.transicoes[falha].get(letra, 0)
+                self.falhas[proximo] = destino if destino != proximo else 0
+                self.saidas[proximo] += self.saidas[self.falhas[proximo]]
+
+    def buscar(self, texto):
+        # Índices das palavras encontradas em 'texto' (normalizado) como palavras inteiras
+        encontradas = set()
+        estado = 0
+        for fim, letra in enumerate(texto, start=1):
+            while estado and letra not in self.transicoes[estado]:
+                estado = self.falhas[estado]
+            estado = self.transicoes[estado].get(letra, 0)
+            for indice in self.saidas[estado]:
+                inicio = fim - len(self.palavras[indice])
+                if (inicio == 0 or texto[inicio - 1] == ' ') and (fim == len(texto) or texto[fim] == ' '):
+                    encontradas.add(indice)
+        return encontradas
+
+
+_trava = threading.Lock()
+_compilado = None
+
+
+def invalidar():
+    cache.set(f"{PREFIXO}:versao", uuid.uuid4().hex, timeout=None)
+
+
+def _versao():
+    chave = f"{PREFIXO}:versao"
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, uuid.uuid4().hex, timeout=None)
+        versao = cache.get(chave)
+    return versao
+
+
+def compilar():
+    # {palavra normalizada: [nomes de cliente]}: a mesma palavra pode apontar para mais de um cliente
+    donos = {}
+    for cliente, palavra in PalavraChave.objects.order_by('pk').values_list('cliente', 'palavra').iterator():
+        normalizada = normalizar_texto(palavra)
+        if normalizada and cliente.strip():
+            nomes = donos.setdefault(normalizada, [])
+            if cliente.strip() not in nomes:
+                nomes.append(cliente.strip())
+    palavras = list(donos)
+    return Automato(palavras), [donos[p] for p in palavras]
+
+
+def automato():
+    global _compilado
+    versao = _versao()
+    atual = _compilado
+    if atual is not None and atual[0] == versao:
+        return atual[1], atual[2]
+    with _trava:
+        if _compilado is None or _compilado[0] != versao:
+            _compilado = (versao, *compilar())
+        return _compilado[1], _compilado[2]
+
+
+def sugerir(descricao='', remetente='', observacao=''):
+    maquina, donos = automato()
+    # Agrupado pelo nome normalizado: "Maria Souza" e "MARIA SOUZA" anotados à mão são o mesmo cliente
+    achados = {}
+    for campo, texto in zip(CAMPOS, (descricao, remetente, observacao)):
+        for indice in maquina.buscar(normalizar_texto(texto)):
+            for nome in donos[indice]:
+                achado = achados.setdefault(normalizar_texto(nome) or nome, {'cliente': nome, 'palavras': [], 'campos': [], 'clientes': []})
+                if maquina.palavras[indice] not in achado['palavras']:
+                    achado['palavras'].append(maquina.palavras[indice])
+                if campo not in achado['campos']:
+                    achado['campos'].append(campo)
+    if not achados:
+        return []
+
+    # Cadastros com o mesmo nome (normalizado) do cliente anotado, para selecionar direto no formulário
+    linhas = Cliente.objects.filter(nome_normalizado__in=achados).order_by('-pk').values_list('pk', 'nome', 'observacao', 'cpf', 'nome_normalizado')
+    for pk, nome, observacao, cpf, normalizado in linhas[:50]:
+        achados[normalizado]['clientes'].append({'id': pk, 'text': rotulo(pk, nome, observacao, cpf)})
+
+    return sorted(achados.values(), key=lambda a: (-len(a['palavras']), -max(map(len, a['palavras'])), a['cliente']))
@@ -0,0 +1,64 @@
+from django.utils.dateparse import parse_datetime
+
+from .models import calcular_cobranca
+
+# --- RECIBO CONGELADO DA RETIRADA ---
+# O recibo (grupos por cliente, dias em estoque, valor sugerido, cobrado e descontos) é calculado uma
+# única vez, na baixa, e gravado em Retirada.recibo. A tela da retirada e as reimpressões leem dele:
+# mostram exatamente o que o caixa viu, mesmo que a regra de cobrança ou os cadastros mudem depois,
+# e mesmo depois de um cancelamento (quando as encomendas voltam para o estoque).
+#
+# Retiradas antigas, anteriores ao campo, têm o recibo preenchido pela migração 0026.
+
+VERSAO = 1
+
+
+def _cliente(cliente):
+    return {
+        'id': cliente.pk, 'nome': cliente.nome, 'observacao': cliente.observacao,
+        'cpf': cliente.cpf, 'rg': cliente.rg, 'telefone': cliente.telefone, 'email': cliente.email,
+    }
+
+
+def montar(retirado_por, encomendas):
+    # 'encomendas' já com os valores da baixa (e o cliente carregado, para não consultar um a um)
+    grupos = {}
+    for enc in sorted(encomendas, key=lambda e: (e.cliente.nome, e.data_chegada)):
+        dias_estoque, _, valor_sugerido = calcular_cobranca(enc.data_chegada, enc.valor_base, enc.data_entrega or enc.data_chegada)
+        grupo = grupos.setdefault(enc.cliente_id, {
+            'cliente': _cliente(enc.cliente), 'itens': [], 'subtotal': 0.0, 'sugerido': 0.0, 'desconto': 0.0,
+        })
+        grupo['itens'].append({
+            'id': enc.pk,
+            'descricao': enc.descricao,
+            'remetente': enc.remetente,
+            'data_chegada': enc.data_chegada.isoformat(),
+            'dias_estoque_calculado': dias_estoque,
+            'valor_base': float(enc.valor_base),
+            'valor_sugerido': valor_sugerido,
+            'valor_cobrado': float(enc.valor_cobrado) if enc.valor_cobrado is not None else None,
+        })
+        grupo['sugerido'] += valor_sugerido
+        if enc.valor_cobrado:
+            grupo['subtotal'] += float(enc.valor_cobrado)
+
+    # Desconto por cliente (nunca negativo, caso tenha sido cobrado a mais) e totais gerais
+    for grupo in grupos.values():
+        grupo['desconto'] = max(0.0, grupo['sugerido'] - grupo['subtotal'])
+
+    return {
+        'versao': VERSAO,
+        'retirado_por': _cliente(retirado_por),
+        'grupos': list(grupos.values()),
+        'qtd_itens': sum(len(g['itens']) for g in grupos.values()),
+        'sugerido_geral': sum(g['sugerido'] for g in grupos.values()),
+        'desconto_geral': sum(g['desconto'] for g in grupos.values()),
+    }
+
+
+def ler(recibo):
+    # Devolve as datas como datetime para os filtros de data dos templates
+    for grupo in recibo['grupos']:
+        for item in grupo['itens']:
+            item['data_chegada'] = parse_datetime(item['data_chegada'])
+    return recibo
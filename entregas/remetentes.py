@@ -0,0 +1,211 @@
+import heapq
+import threading
+import uuid
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import tarefas
+from .models import Encomenda, EncomendaArquivada, Tarefa, normalizar_texto
+
+# --- SUGESTÃO DE REMETENTES ---
+# O remetente é digitado à mão em toda chegada, mas poucos (farmácias, laboratórios, marketplaces)
+# cobrem quase todas as encomendas. Em vez de um DISTINCT na tabela a cada tecla, as sugestões saem de
+# um índice de frequência dos remetentes já usados:
+#   - contagens: {nome normalizado (sem acento/caixa): [grafia mais usada, quantidade]}, montado com um
+#     GROUP BY nas encomendas (quentes e arquivadas) pela tarefa periódica "atualizar_remetentes" e
+#     guardado no cache junto com uma versão;
+#   - cada processo mantém uma cópia ordenada pelo início de cada palavra ("sao joao" acha "Drogaria
+#     São João"), e só a remonta quando a versão no cache muda: a busca é um bisect em memória;
+#   - encomendas novas somam na cópia local; um remetente nunca visto também entra nas contagens do
+#     cache (e troca a versão), para aparecer nos outros processos sem esperar a próxima atualização.
+# A requisição nunca faz o GROUP BY: sem contagens no cache (primeira execução, cache expirado), a
+# busca responde com a cópia que tiver (ou vazia) e antecipa a tarefa da fila. Por isso o recurso
+# precisa de um cache compartilhado entre a fila e os workers ('file' ou 'db'): com 'locmem' fica
+# desligado por padrão (REMETENTES_ATIVOS).
+
+PREFIXO = 'remetentes:v1'
+CHAVE_CONTAGENS = f"{PREFIXO}:contagens"
+CHAVE_VERSAO = f"{PREFIXO}:versao"
+
+
+def _timeout():
+    # Folga sobre o intervalo da tarefa periódica: o índice não expira entre duas atualizações
+    return settings.REMETENTES_ATUALIZACAO * 2
+
+
+class IndiceRemetentes:
+    def __init__(self, contagens, versao=None):
+        self.versao = versao
+        self.contagens = contagens
+        self.inicios = sorted(
+            (inicio, normalizado) for normalizado in contagens for inicio in self._inicios(normalizado)
+        )
+        # Prefixos curtos (e o vazio, ao focar o campo) casam com boa parte do índice: resposta guardada
+        self._curtos = {}
+
+    @staticmethod
+    def _inicios(normalizado):
+        palavras = normalizado.split()
+        return {' '.join(palavras[i:]) for i in range(len(palavras))}
+
+    def adicionar(self, remetente):
+        # Devolve True se o remetente ainda não estava no índice
+        normalizado = normalizar_texto(remetente)
+        if not normalizado:
+            return False
+        self._curtos.clear()
+        if normalizado in self.contagens:
+            self.contagens[normalizado][1] += 1
+            return False
+        self.contagens[normalizado] = [remetente.strip(), 1]
+        for inicio in self._inicios(normalizado):
+            insort(self.inicios, (inicio, normalizado))
+        return True
+
+    def sugerir(self, termo, limite=10):
+        prefixo = normalizar_texto(termo)
+        if len(prefixo) <= 2:
+            chave = (prefixo, limite)
+            if chave not in self._curtos:
+                self._curtos[chave] = self._buscar(prefixo, limite)
+            return self._curtos[chave]
+        return self._buscar(prefixo, limite)
+
+    def _buscar(self, prefixo, limite):
+        if prefixo:
+            encontrados = set()
+            i = bisect_left(self.inicios, (prefixo,))
+            while i < len(self.inicios) and self.inicios[i][0].startswith(prefixo):
+                encontrados.add(self.inicios[i][1])
+                i += 1
+        else:
+            encontrados = self.contagens
+        melhores = heapq.nlargest(limite, encontrados, key=lambda n: (self.contagens[n][1], n))
+        return [{'remetente': self.contagens[n][0], 'quantidade': self.contagens[n][1]} for n in melhores]
+
+
+_trava = threading.Lock()
+_indice = None
+
+
+# --- MONTAGEM E CACHE ---
+
+def contar_no_banco():
+    # Quantidade por grafia, somada por nome normalizado; a grafia exibida é a mais usada
+    por_grafia = {}
+    for modelo in (Encomenda, EncomendaArquivada):
+        for remetente, quantidade in modelo.objects.order_by().values_list('remetente').annotate(n=Count('pk')).iterator():
+            if remetente:
+                por_grafia[remetente.strip()] = por_grafia.get(remetente.strip(), 0) + quantidade
+
+    contagens = {}
+    for grafia, quantidade in por_grafia.items():
+        normalizado = normalizar_texto(grafia)
+        if not normalizado:
+            continue
+        atual = contagens.get(normalizado)
+        if atual is None:
+            contagens[normalizado] = [grafia, quantidade, quantidade]
+            continue
+        if quantidade > atual[2]:
+            atual[0], atual[2] = grafia, quantidade
+        atual[1] += quantidade
+    return {normalizado: [grafia, total] for normalizado, (grafia, total, _) in contagens.items()}
+
+
+def atualizar():
+    contagens = contar_no_banco()
+    versao = uuid.uuid4().hex
+    cache.set_many({CHAVE_CONTAGENS: contagens, CHAVE_VERSAO: versao}, timeout=_timeout())
+    return contagens, versao
+
+
+def _pedir_atualizacao():
+    # Antecipa a tarefa periódica (ou enfileira uma), no máximo uma vez por minuto
+    if not cache.add(f"{PREFIXO}:pedido", 1, timeout=60):
+        return
+    agora = timezone.now()
+    if not Tarefa.objects.filter(nome='atualizar_remetentes', status='PENDENTE').update(executar_apos=agora):
+        tarefas.agendar_unica('atualizar_remetentes', executar_apos=agora)
+
+
+def indice():
+    # Cópia deste processo; remontada só quando a versão do cache muda. Nunca consulta as encomendas:
+    # sem contagens no cache, segue com a cópia atual (ou vazia) e pede a atualização à fila
+    global _indice
+    versao = cache.get(CHAVE_VERSAO)
+    atual = _indice
+    if atual is not None and versao is not None and atual.versao == versao:
+        return atual
+    with _trava:
+        if _indice is not None and _indice.versao == versao and versao is not None:
+            return _indice
+        contagens = cache.get(CHAVE_CONTAGENS) if versao is not None else None
+        if contagens is not None:
+            _indice = IndiceRemetentes(contagens, versao)
+        elif _indice is None:
+            _indice = IndiceRemetentes({})
+    if contagens is None:
+        _pedir_atualizacao()
+    return _indice
+
+
+def sugerir(termo, limite=10):
+    if not settings.REMETENTES_ATIVOS:
+        return []
+    return indice().sugerir(termo, limite)
+
+
+# --- ATUALIZAÇÃO INCREMENTAL (ENCOMENDAS NOVAS) ---
+
+def _somar(remetentes):
+    # Duas gravações simultâneas de remetentes inéditos podem se sobrescrever no cache: o que se
+    # perder volta na próxima atualização periódica
+    with _trava:
+        atual = _indice
+        novos = [r for r in remetentes if atual.adicionar(r)] if atual is not None else remetentes
+        if not novos:
+            return
+        # Remetente inédito: entra também nas contagens compartilhadas, com nova versão para os outros
+        # processos. Se a cópia deste processo estava em dia, só acompanha a versão nova (sem remontar).
+        compartilhado = cache.get_many([CHAVE_CONTAGENS, CHAVE_VERSAO])
+        contagens = compartilhado.get(CHAVE_CONTAGENS)
+        if contagens is None:
+            return
+        ineditos = {normalizar_texto(r): r.strip() for r in novos}
+        ineditos = {n: r for n, r in ineditos.items() if n and n not in contagens}
+        if not ineditos:
+            return
+        for normalizado, remetente in ineditos.items():
+            contagens[normalizado] = [remetente, 1]
+        versao = uuid.uuid4().hex
+        if atual is not None and atual.versao == compartilhado.get(CHAVE_VERSAO):
+            atual.versao = versao
+        cache.set_many({CHAVE_CONTAGENS: contagens, CHAVE_VERSAO: versao}, timeout=_timeout())
+
+
+def registrar(remetentes):
+    if not settings.REMETENTES_ATIVOS:
+        return
+    remetentes = [r for r in remetentes if r]
+    if remetentes:
+        transaction.on_commit(lambda: _somar(remetentes), robust=True)
+
+
+# --- TAREFA PERIÓDICA DA FILA ---
+
+@tarefas.registrar(
+    'atualizar_remetentes',
+    proxima_execucao=lambda agora: agora + timedelta(seconds=settings.REMETENTES_ATUALIZACAO),
+)
+def tarefa_atualizar_remetentes():
+    if not settings.REMETENTES_ATIVOS:
+        return 0
+    contagens, _ = atualizar()
+    return len(contagens)
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+# --- SESSÕES EM CACHE (COM O BANCO COMO RESERVA) ---
+# Igual ao 'cached_db' do Django: a leitura vem do cache e só vai ao banco quando falta no cache;
+# a escrita vai para os dois. A diferença é o teto SESSION_CACHE_TIMEOUT para a cópia em cache.
+# Com o cache 'locmem' cada worker tem a sua cópia, e o logout só apaga a do worker que o atendeu:
+# o teto limita por quanto tempo uma sessão encerrada ainda vale nos demais workers.
+
+
+class _CacheComTeto:
+    def __init__(self, cache, teto):
+        self._cache = cache
+        self._teto = teto
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT or timeout is None or timeout > self._teto:
+            timeout = self._teto
+        return self._cache.set(key, value, timeout, version)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def __getattr__(self, nome):
+        return getattr(self._cache, nome)
+
+
+class SessionStore(cached_db.SessionStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        teto = getattr(settings, 'SESSION_CACHE_TIMEOUT', None)
+        if teto:
+            self._cache = _CacheComTeto(self._cache, teto)
@@ -0,0 +1,77 @@
+from django.contrib.auth.models import Group, User
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import autenticacao, autocompletar, consultas, eventos, notificacoes, palavras_chave, remetentes
+from .models import Cliente, Encomenda, PalavraChave
+
+
+# --- INVALIDAÇÃO DO CACHE DA CONSULTA PÚBLICA ---
+@receiver([post_save, post_delete], sender=Encomenda)
+def encomenda_alterada(sender, instance, **kwargs):
+    consultas.invalidar_cliente(instance.cliente_id)
+
+
+@receiver([post_save, post_delete], sender=Cliente)
+def cliente_alterado(sender, instance, **kwargs):
+    consultas.invalidar_cliente(instance.pk)
+    # Um documento recém-cadastrado pode estar em cache como "não encontrado"
+    consultas.invalidar_documentos(instance.cpf, instance.rg)
+    autocompletar.invalidar()
+
+
+# --- AVISO DE CHEGADA (só registra na caixa de saída; o envio é feito pelo trabalhador da fila) ---
+@receiver(post_save, sender=Encomenda)
+def encomenda_criada(sender, instance, created, **kwargs):
+    if created:
+        notificacoes.registrar_chegadas([instance])
+
+
+# --- ÍNDICE DE SUGESTÃO DE REMETENTES (soma depois do commit) ---
+@receiver(post_save, sender=Encomenda)
+def encomenda_remetente(sender, instance, created, **kwargs):
+    if created:
+        remetentes.registrar([instance.remetente])
+
+
+# --- MUDANÇAS DE ESTOQUE PARA AS TELAS ABERTAS (publicadas depois do commit) ---
+@receiver(post_save, sender=Encomenda)
+def encomenda_movimentada(sender, instance, created, **kwargs):
+    tipo = eventos.tipo_da_mudanca(instance, created)
+    if tipo:
+        eventos.publicar([instance], tipo)
+
+
+# --- AUTÔMATO DAS PALAVRAS-CHAVE (remontado na próxima busca) ---
+@receiver([post_save, post_delete], sender=PalavraChave)
+def palavra_chave_alterada(sender, instance, **kwargs):
+    palavras_chave.invalidar()
+
+
+# --- INVALIDAÇÃO DO USUÁRIO/PERMISSÕES EM CACHE ---
+@receiver([post_save, post_delete], sender=User)
+def usuario_alterado(sender, instance, **kwargs):
+    # Inclui troca de senha (set_password + save), desativação e mudança de is_staff/is_superuser
+    autenticacao.invalidar_usuario(instance.pk)
+
+
+@receiver(user_logged_out)
+def usuario_saiu(sender, request, user, **kwargs):
+    if user is not None:
+        autenticacao.invalidar_usuario(user.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def permissoes_usuario_alteradas(sender, instance, **kwargs):
+    if isinstance(instance, User):
+        autenticacao.invalidar_usuario(instance.pk)
+    else:
+        autenticacao.invalidar_permissoes()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+def permissoes_grupo_alteradas(sender, **kwargs):
+    autenticacao.invalidar_permissoes()
@@ -0,0 +1,142 @@
+import io
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarefa
+
+# --- FILA DE TAREFAS EM SEGUNDO PLANO ---
+# Trabalho demorado (manutenções, recálculos, exportações grandes) não precisa prender um worker do
+# gunicorn: a view só grava uma Tarefa e quem executa é o "manage.py processar_tarefas", num processo
+# à parte. A fila fica no próprio banco, sem serviço externo:
+#   - no PostgreSQL cada trabalhador reserva a próxima tarefa com SELECT ... FOR UPDATE SKIP LOCKED,
+#     então vários trabalhadores nunca pegam a mesma e não esperam um pelo outro;
+#   - no SQLite (desenvolvimento), sem SKIP LOCKED, a reserva é um UPDATE condicional ao status.
+# Enfileirar dentro de uma transação é seguro: se ela for desfeita, a tarefa some junto.
+#
+# Uma tarefa que falha volta para a fila com espera crescente (TAREFAS_ESPERA_RETENTATIVA * 2^n) até
+# esgotar max_tentativas; uma que ficou EXECUTANDO além de TAREFAS_TEMPO_LIMITE (trabalhador morto
+# no meio) é devolvida à fila. As funções executáveis são registradas por nome com @registrar; as
+# periódicas informam também quando rodar de novo, e o trabalhador mantém uma execução agendada de cada.
+
+REGISTRO = {}
+PERIODICAS = {}
+
+
+def registrar(nome, proxima_execucao=None):
+    # proxima_execucao(agora) -> datetime: torna a tarefa periódica (ver garantir_periodicas)
+    def decorador(funcao):
+        REGISTRO[nome] = funcao
+        if proxima_execucao is not None:
+            PERIODICAS[nome] = proxima_execucao
+        return funcao
+    return decorador
+
+
+def enfileirar(nome, executar_apos=None, max_tentativas=3, **argumentos):
+    if nome not in REGISTRO:
+        raise ValueError(f"Tarefa desconhecida: {nome}")
+    return Tarefa.objects.create(
+        nome=nome, argumentos=argumentos, max_tentativas=max_tentativas,
+        executar_apos=executar_apos or timezone.now(),
+    )
+
+
+def agendar_unica(nome, executar_apos=None, **argumentos):
+    # Enfileira só se ainda não houver uma igual esperando: várias chamadas próximas viram uma execução
+    if Tarefa.objects.filter(nome=nome, status='PENDENTE').exists():
+        return None
+    return enfileirar(nome, executar_apos=executar_apos, **argumentos)
+
+
+def garantir_periodicas():
+    agora = timezone.now()
+    em_andamento = set(
+        Tarefa.objects.filter(nome__in=PERIODICAS, status__in=('PENDENTE', 'EXECUTANDO')).values_list('nome', flat=True)
+    )
+    return [enfileirar(nome, executar_apos=proxima(agora)) for nome, proxima in PERIODICAS.items() if nome not in em_andamento]
+
+
+def identificar_trabalhador():
+    return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+
+def reservar(trabalhador):
+    # Marca a próxima tarefa vencida como EXECUTANDO e a devolve (None se a fila estiver vazia)
+    agora = timezone.now()
+    fila = Tarefa.objects.filter(status='PENDENTE', executar_apos__lte=agora).order_by('executar_apos', 'pk')
+    reserva = {'status': 'EXECUTANDO', 'iniciada_em': agora, 'trabalhador': trabalhador, 'tentativas': F('tentativas') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = fila.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            Tarefa.objects.filter(pk=pk).update(**reserva)
+        return Tarefa.objects.get(pk=pk)
+
+    for pk in fila.values_list('pk', flat=True)[:10]:
+        # Outro trabalhador pode ter reservado entre a leitura e o UPDATE: aí nenhuma linha muda
+        if Tarefa.objects.filter(pk=pk, status='PENDENTE').update(**reserva):
+            return Tarefa.objects.get(pk=pk)
+    return None
+
+
+def executar(tarefa):
+    # Roda fora de transação: a função controla as suas (ex: lotes curtos do arquivamento)
+    try:
+        funcao = REGISTRO.get(tarefa.nome)
+        if funcao is None:
+            raise LookupError(f"Tarefa desconhecida: {tarefa.nome}")
+        resultado = funcao(**tarefa.argumentos)
+    except Exception:
+        erro = traceback.format_exc()
+        if tarefa.tentativas < tarefa.max_tentativas:
+            espera = settings.TAREFAS_ESPERA_RETENTATIVA * 2 ** (tarefa.tentativas - 1)
+            campos = {'status': 'PENDENTE', 'executar_apos': timezone.now() + timedelta(seconds=espera)}
+        else:
+            campos = {'status': 'FALHOU', 'concluida_em': timezone.now()}
+        Tarefa.objects.filter(pk=tarefa.pk, status='EXECUTANDO').update(erro=erro, **campos)
+        return False
+
+    Tarefa.objects.filter(pk=tarefa.pk, status='EXECUTANDO').update(
+        status='CONCLUIDA', concluida_em=timezone.now(), resultado=resultado, erro='',
+    )
+    return True
+
+
+def recuperar_travadas():
+    # Tarefas cujo trabalhador morreu no meio: voltam para a fila (ou falham, se já esgotaram as tentativas)
+    limite = timezone.now() - timedelta(seconds=settings.TAREFAS_TEMPO_LIMITE)
+    travadas = Tarefa.objects.filter(status='EXECUTANDO', iniciada_em__lt=limite)
+    erro = 'Interrompida: passou de TAREFAS_TEMPO_LIMITE sem concluir.'
+    falharam = travadas.filter(tentativas__gte=F('max_tentativas')).update(status='FALHOU', concluida_em=timezone.now(), erro=erro)
+    voltaram = travadas.update(status='PENDENTE', executar_apos=timezone.now(), erro=erro)
+    return voltaram, falharam
+
+
+def limpar_concluidas():
+    corte = timezone.now() - timedelta(days=settings.TAREFAS_RETENCAO_DIAS)
+    return Tarefa.objects.filter(status='CONCLUIDA', concluida_em__lt=corte).delete()[0]
+
+
+# --- TAREFAS REGISTRADAS ---
+# As rotinas de manutenção podem ser agendadas pela fila (ex: enfileirar('limpar_lixeira', confirmar=True)).
+
+def _comando(nome):
+    def executar_comando(**opcoes):
+        saida = io.StringIO()
+        call_command(nome, stdout=saida, **opcoes)
+        return saida.getvalue()
+    return executar_comando
+
+
+for _nome in ('arquivar_encomendas', 'limpar_lixeira', 'particoes_auditoria'):
+    registrar(_nome)(_comando(_nome))
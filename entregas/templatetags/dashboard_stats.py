@@ -1,19 +1,24 @@
 from django import template
 from django.db.models import Sum
 from django.utils import timezone
+from datetime import timedelta
 from entregas.models import Encomenda, PalavraChave, AnotacaoCliente, Cliente
 
 register = template.Library()
 
 @register.simple_tag
 def get_stats():
-    now = timezone.now()
+    now = timezone.localtime()
     
     # 1. Calcula lucro do mês atual (apenas das entregues neste mês/ano)
+    # Intervalo de datas em vez de __month/__year para o banco conseguir usar o índice de data_entrega
+    inicio_mes = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    inicio_prox_mes = (inicio_mes + timedelta(days=32)).replace(day=1)
     lucro = Encomenda.objects.filter(
         status='ENTREGUE',
-        data_entrega__month=now.month,
-        data_entrega__year=now.year
+        descartado=False,
+        data_entrega__gte=inicio_mes,
+        data_entrega__lt=inicio_prox_mes
     ).aggregate(Sum('valor_cobrado'))['valor_cobrado__sum'] or 0
     
     # 2. Conta quantas estão no armazém (Pendentes e Não Descartadas)
@@ -1,3 +1,395 @@
-from django.test import TestCase
+import random
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import consultas, limitador
+from .models import AnotacaoCliente, Cliente, Encomenda, PalavraChave, Retirada
+from .templatetags.dashboard_stats import get_stats
+
+
+def gerar_cpf(numero):
+    # CPF válido a partir de um número sequencial (9 dígitos base + 2 verificadores)
+    base = [int(d) for d in f"{numero % 10**9:09d}"]
+    if len(set(base)) == 1:
+        base[-1] = (base[-1] + 1) % 10
+    for i in range(9, 11):
+        soma = sum(d * ((i + 1) - n) for n, d in enumerate(base))
+        base.append(((soma * 10) % 11) % 10)
+    return ''.join(map(str, base))
+
+
+def semear_base(qtd_clientes, qtd_encomendas, qtd_retiradas, semente=0):
+    # Base com proporções parecidas com a de produção: a maior parte já entregue ao longo
+    # de três anos, poucas pendentes e uma pequena lixeira.
+    aleatorio = random.Random(semente)
+    agora = timezone.now()
+    operador = User.objects.create_user('caixa', password='senha-caixa', is_staff=True, is_superuser=True)
+
+    clientes = Cliente.objects.bulk_create([
+        Cliente(
+            nome=f"Cliente {i}",
+            cpf=gerar_cpf(i + 1) if i % 2 == 0 else None,
+            rg=str(1000000 + i) if i % 2 else None,
+            telefone=f"45999{i:06d}",
+        )
+        for i in range(qtd_clientes)
+    ], batch_size=2000)
+
+    retiradas = Retirada.objects.bulk_create([
+        Retirada(
+            retirado_por=aleatorio.choice(clientes),
+            operador=operador,
+            valor_total=10,
+            status='CANCELADA' if i % 20 == 0 else 'ATIVA',
+        )
+        for i in range(qtd_retiradas)
+    ], batch_size=2000)
+    # data_retirada é auto_now_add: espalha as datas depois de inserir
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE entregas_retirada SET data_retirada = data_retirada - (id % 1000) * INTERVAL '1 day'"
+            if connection.vendor == 'postgresql' else
+            "UPDATE entregas_retirada SET data_retirada = datetime(data_retirada, '-' || (id % 1000) || ' days')"
+        )
+
+    encomendas = []
+    for i in range(qtd_encomendas):
+        cliente = aleatorio.choice(clientes)
+        if i % 50 == 0:
+            chegada = agora - timedelta(days=aleatorio.randint(0, 1000))
+            encomendas.append(Encomenda(cliente=cliente, descricao=f"Caixa {i}", remetente='Loja', data_chegada=chegada, descartado=True))
+        elif i % 25 == 1:
+            chegada = agora - timedelta(days=aleatorio.randint(0, 120), minutes=i)
+            encomendas.append(Encomenda(cliente=cliente, descricao=f"Caixa {i}", remetente='Loja', data_chegada=chegada))
+        else:
+            chegada = agora - timedelta(days=aleatorio.randint(31, 1095), minutes=i)
+            entrega = chegada + timedelta(days=aleatorio.randint(0, 30))
+            encomendas.append(Encomenda(
+                cliente=cliente, descricao=f"Caixa {i}", remetente='Loja', data_chegada=chegada,
+                data_entrega=entrega, status='ENTREGUE', valor_cobrado=10, valor_calculado=10,
+                retirada=aleatorio.choice(retiradas),
+            ))
+    Encomenda.objects.bulk_create(encomendas, batch_size=5000)
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE entregas_cliente, entregas_encomenda, entregas_retirada')
+    return operador, clientes
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Planos de execução verificados apenas no PostgreSQL')
+class IndicesPlanoExecucaoTests(TestCase):
+    # Garante que as consultas mais frequentes usam os índices de status/descartado/datas
+    # em vez de varrer a tabela inteira (Seq Scan) numa base de tamanho realista.
+    TABELAS = ('entregas_encomenda', 'entregas_retirada')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operador, cls.clientes = semear_base(qtd_clientes=3000, qtd_encomendas=60000, qtd_retiradas=15000, semente=33)
+
+    def assertSemSeqScan(self, funcao, tabelas=TABELAS, ignorar_contagens=False):
+        with CaptureQueriesContext(connection) as ctx:
+            funcao()
+        consultas_sql = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].lstrip().upper().startswith('SELECT') and any(t in q['sql'] for t in tabelas)
+            and not (ignorar_contagens and q['sql'].startswith('SELECT COUNT(*)'))
+        ]
+        self.assertTrue(consultas_sql, 'Nenhuma consulta às tabelas verificadas foi executada.')
+        for sql in consultas_sql:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN ' + sql)
+                plano = '\n'.join(linha[0] for linha in cursor.fetchall())
+            for tabela in tabelas:
+                if f'Seq Scan on {tabela}' in plano:
+                    self.fail(f"Seq Scan em {tabela}:\n{sql}\n\n{plano}")
+
+    def _request(self, caminho):
+        request = RequestFactory().get(caminho)
+        request.user = self.operador
+        return request
+
+    def test_dashboard_inicio(self):
+        self.assertSemSeqScan(get_stats)
+
+    def test_relatorio_periodo(self):
+        agora = timezone.now()
+        inicio = agora.replace(day=1)
+
+        def relatorio():
+            qs = Encomenda.objects.filter(descartado=False)
+            qs.filter(status='ENTREGUE', data_entrega__range=(inicio, agora)).aggregate(Sum('valor_cobrado'))
+            qs.filter(status='ENTREGUE', data_entrega__range=(inicio, agora)).count()
+            qs.filter(status='PENDENTE').count()
+
+        self.assertSemSeqScan(relatorio)
+
+    def test_changelist_pendentes(self):
+        model_admin = admin.site._registry[Encomenda]
+        self.assertSemSeqScan(lambda: list(model_admin.get_changelist_instance(self._request('/admin/entregas/encomenda/')).result_list))
+
+    def test_changelist_retiradas(self):
+        # A contagem do paginador cobre ~95% da tabela (todas as ativas): ali o Seq Scan é o plano
+        # correto. O que precisa do índice (status, data_retirada) é a página ordenada por data.
+        model_admin = admin.site._registry[Retirada]
+        self.assertSemSeqScan(
+            lambda: list(model_admin.get_changelist_instance(self._request('/admin/entregas/retirada/')).result_list),
+            ignorar_contagens=True,
+        )
+
+    def test_busca_cliente_por_telefone(self):
+        # Número colado na busca de clientes: só os índices (telefones normalizados, CPF, RG, id). A
+        # contagem sem filtro ("de N no total") do changelist varre a tabela e fica de fora.
+        model_admin = admin.site._registry[Cliente]
+        for termo in ('(45) 99900-0123', '+55 45 99900 0123', self.clientes[0].cpf):
+            self.assertSemSeqScan(
+                lambda: list(model_admin.get_changelist_instance(self._request(f'/admin/entregas/cliente/?q={termo}')).result_list),
+                tabelas=('entregas_cliente',), ignorar_contagens=True,
+            )
+
+    def test_consulta_publica(self):
+        documento = self.clientes[0].cpf
+        self.assertSemSeqScan(
+            lambda: consultas._buscar_no_banco(documento),
+            tabelas=('entregas_cliente', 'entregas_encomenda'),
+        )
+
+
+# O armazenamento com manifesto (whitenoise) exige collectstatic; nos testes os estáticos não importam
+ESTATICOS_SEM_MANIFESTO = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(LIMITADOR_ATIVO=False, STORAGES=ESTATICOS_SEM_MANIFESTO)
+class OrcamentoConsultasTests(TestCase):
+    # Teto de consultas SQL por tela. Os tetos não dependem da quantidade de linhas exibidas:
+    # uma consulta nova por linha (list_display, laço da baixa, recibo) estoura o teto na hora.
+    @classmethod
+    def setUpTestData(cls):
+        cls.operador, cls.clientes = semear_base(qtd_clientes=300, qtd_encomendas=3000, qtd_retiradas=400, semente=36)
+        for i, cliente in enumerate(cls.clientes[:30]):
+            AnotacaoCliente.objects.create(cliente=cliente, anotacao=f"Anotação {i}")
+            PalavraChave.objects.create(cliente=cliente.nome, palavra=f"palavra {i}")
+        cls.pendentes = list(
+            Encomenda.objects.filter(status='PENDENTE', descartado=False).order_by('cliente_id').values_list('id', flat=True)[:40]
+        )
+        cls.retirada = Retirada.objects.annotate(qtd=Count('encomendas')).filter(qtd__gte=3).first()
+
+    def setUp(self):
+        self.client.force_login(self.operador)
+
+    def assertOrcamento(self, limite, funcao):
+        with CaptureQueriesContext(connection) as ctx:
+            resposta = funcao()
+        if len(ctx.captured_queries) > limite:
+            consultas_sql = '\n'.join(f"{i}. {q['sql']}" for i, q in enumerate(ctx.captured_queries, 1))
+            self.fail(f"{len(ctx.captured_queries)} consultas (teto: {limite}):\n{consultas_sql}")
+        return resposta
+
+    def test_changelist_encomendas(self):
+        resposta = self.assertOrcamento(9, lambda: self.client.get('/admin/entregas/encomenda/'))
+        self.assertEqual(resposta.status_code, 200)
+        resposta = self.assertOrcamento(9, lambda: self.client.get('/admin/entregas/encomenda/?status=ENTREGUE'))
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_changelist_clientes(self):
+        resposta = self.assertOrcamento(6, lambda: self.client.get('/admin/entregas/cliente/'))
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_changelist_retiradas(self):
+        resposta = self.assertOrcamento(9, lambda: self.client.get('/admin/entregas/retirada/'))
+        self.assertEqual(resposta.status_code, 200)
+        for retirada in resposta.context['cl'].result_list[:5]:
+            self.assertEqual(retirada.qtd_encomendas, retirada.encomendas.count())
+            self.assertEqual(retirada.qtd_clientes, retirada.encomendas.values('cliente').distinct().count())
+
+    def test_confirmacao_baixa(self):
+        resposta = self.assertOrcamento(12, lambda: self.client.post('/admin/entregas/encomenda/', {
+            'action': 'marcar_entregue', admin.helpers.ACTION_CHECKBOX_NAME: self.pendentes,
+        }))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Confirmação de Entrega')
+
+    def test_baixa_com_versao_desatualizada(self):
+        # Outro caixa altera a última encomenda depois da leitura da baixa: o save dela encontra outra
+        # versão no banco (ConflitoDeEdicao) e a baixa inteira é desfeita, inclusive as já salvas
+        selecionadas = self.pendentes[:3]
+        dados = {
+            'action': 'marcar_entregue', 'post': 'yes', 'retirante': self.clientes[0].pk,
+            admin.helpers.ACTION_CHECKBOX_NAME: selecionadas,
+            **{f'valor_{pk}': '10,00' for pk in selecionadas},
+        }
+        retiradas_antes = Retirada.objects.count()
+
+        def outro_caixa(*args, **kwargs):
+            Encomenda.objects.filter(pk=max(selecionadas)).update(versao=F('versao') + 1)
+
+        with mock.patch('entregas.admin.auditoria.registrar', side_effect=outro_caixa):
+            resposta = self.client.post('/admin/entregas/encomenda/', dados)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'foi alterada em outro caixa durante a baixa')
+        self.assertEqual(Retirada.objects.count(), retiradas_antes)
+        self.assertFalse(Encomenda.objects.filter(pk__in=selecionadas).exclude(status='PENDENTE', retirada=None).exists())
+
+    def test_baixa_publica_eventos_num_lote(self):
+        # Os eventos de estoque das N encomendas baixadas saem numa única gravação depois do commit
+        selecionadas = self.pendentes[:3]
+        dados = {
+            'action': 'marcar_entregue', 'post': 'yes', 'retirante': self.clientes[0].pk,
+            admin.helpers.ACTION_CHECKBOX_NAME: selecionadas,
+            **{f'valor_{pk}': '10,00' for pk in selecionadas},
+        }
+        with mock.patch('entregas.eventos._gravar') as gravar, self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post('/admin/entregas/encomenda/', dados)
+        self.assertEqual(resposta.status_code, 302)
+        gravar.assert_called_once()
+        self.assertEqual(sorted(e.encomenda_id for e in gravar.call_args.args[0]), sorted(selecionadas))
+
+    def test_recibo_retirada(self):
+        resposta = self.assertOrcamento(5, lambda: self.client.get(f'/admin/entregas/retirada/{self.retirada.pk}/change/'))
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_relatorio(self):
+        resposta = self.assertOrcamento(23, lambda: self.client.get('/admin/relatorio/'))
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_inicio_admin(self):
+        resposta = self.assertOrcamento(9, lambda: self.client.get('/admin/'))
+        self.assertEqual(resposta.status_code, 200)
+
+    @mock.patch('entregas.views.validar_recaptcha', return_value=True)
+    def test_consulta_publica(self, _):
+        self.client.logout()
+        documento = Cliente.objects.filter(encomenda__status='PENDENTE', encomenda__descartado=False).exclude(cpf=None).values_list('cpf', flat=True)[0]
+        consultas.invalidar_documentos(documento)
+        resposta = self.assertOrcamento(1, lambda: self.client.post('/consulta/', {'q': documento, 'g-recaptcha-response': 'x'}))
+        self.assertTrue(resposta.context['cliente_existe'])
+        self.assertTrue(resposta.context['resultados'])
+        resposta = self.assertOrcamento(1, lambda: self.client.get('/api/v1/consulta/', HTTP_X_DOCUMENTO=documento))
+        self.assertEqual(resposta.status_code, 200)
+        # Documento na URL não é mais aceito
+        self.assertEqual(self.client.get('/api/v1/consulta/', {'documento': documento}).status_code, 400)
+
+
+SEM_CACHE_DE_SESSAO = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+}
+COM_CACHE_DE_SESSAO = {
+    'SESSION_ENGINE': 'entregas.sessoes',
+    'AUTHENTICATION_BACKENDS': ['entregas.autenticacao.BackendUsuarioEmCache'],
+}
+
+
+@override_settings(STORAGES=ESTATICOS_SEM_MANIFESTO)
+class SessaoUsuarioEmCacheTests(TestCase):
+    # Sessão + usuário (+ permissões, para quem não é superusuário) vindos do cache em vez do banco
+    URL = '/admin/autocomplete/?app_label=entregas&model_name=encomenda&field_name=cliente&term=ana'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superusuario = User.objects.create_user('gerente', password='senha-gerente', is_staff=True, is_superuser=True)
+        cls.caixa = User.objects.create_user('caixa', password='senha-caixa', is_staff=True)
+        cls.caixa.user_permissions.add(*Permission.objects.filter(codename__in=['view_cliente', 'view_encomenda', 'change_encomenda']))
+        Cliente.objects.create(nome='Ana Paula', cpf=gerar_cpf(1), telefone='45999990000')
+
+    def setUp(self):
+        cache.clear()
+
+    def _consultas_por_requisicao(self, ajustes, usuario, senha):
+        # Client novo a cada configuração: o SessionMiddleware fixa o SESSION_ENGINE ao ser carregado
+        with override_settings(**ajustes):
+            cliente = Client()
+            cliente.login(username=usuario.username, password=senha)
+            self.assertEqual(cliente.get(self.URL).status_code, 200)  # aquece o cache
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(cliente.get(self.URL).status_code, 200)
+            cliente.logout()
+        return len(ctx.captured_queries)
+
+    def test_reducao_de_consultas(self):
+        for usuario, senha, economia in ((self.superusuario, 'senha-gerente', 2), (self.caixa, 'senha-caixa', 4)):
+            with self.subTest(usuario=usuario.username):
+                sem_cache = self._consultas_por_requisicao(SEM_CACHE_DE_SESSAO, usuario, senha)
+                com_cache = self._consultas_por_requisicao(COM_CACHE_DE_SESSAO, usuario, senha)
+                # sessão + usuário (+ permissões do usuário e dos grupos)
+                self.assertEqual(sem_cache - com_cache, economia, f"{sem_cache} -> {com_cache} consultas")
+
+    @override_settings(**COM_CACHE_DE_SESSAO)
+    def test_logout_invalida_sessao(self):
+        self.client.login(username='caixa', password='senha-caixa')
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+        cookie = self.client.cookies['sessionid'].value
+        self.client.logout()
+
+        # Mesmo reapresentando o cookie antigo, a sessão não existe mais nem no cache nem no banco
+        self.client.cookies['sessionid'] = cookie
+        self.assertEqual(self.client.get(self.URL).status_code, 302)
+
+    @override_settings(**COM_CACHE_DE_SESSAO)
+    def test_troca_de_senha_derruba_outras_sessoes(self):
+        self.client.login(username='caixa', password='senha-caixa')
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+
+        caixa = User.objects.get(pk=self.caixa.pk)
+        caixa.set_password('senha-nova')
+        caixa.save()
+        self.assertEqual(self.client.get(self.URL).status_code, 302)
+
+    @override_settings(**COM_CACHE_DE_SESSAO)
+    def test_remover_permissao_vale_na_hora(self):
+        self.client.login(username='caixa', password='senha-caixa')
+        self.assertEqual(self.client.get('/admin/entregas/cliente/').status_code, 200)
+
+        self.caixa.user_permissions.remove(Permission.objects.get(codename='view_cliente'))
+        self.assertEqual(self.client.get('/admin/entregas/cliente/').status_code, 403)
+
+        caixa = User.objects.get(pk=self.caixa.pk)
+        caixa.is_active = False
+        caixa.save()
+        self.assertEqual(self.client.get(self.URL).status_code, 302)
+
+
+class BackendMemoriaTests(TestCase):
+    # Baldes do limitador em memória: poda respeitando o período de cada balde
+    def test_poda_por_balde(self):
+        backend = limitador.BackendMemoria()
+        with mock.patch.object(limitador.BackendMemoria, 'MAX_CHAVES', 10), \
+                mock.patch('entregas.limitador.time.monotonic') as relogio:
+            relogio.return_value = 0
+            backend.consumir('consulta_documento:1', 1, 300)
+            for i in range(9):
+                backend.consumir(f'consulta_ip:{i}', 5, 60)
+
+            # 100 s depois: os baldes de IP (60 s) já expiraram, o do documento (300 s) não
+            relogio.return_value = 100
+            backend.consumir('consulta_ip:novo', 5, 60)
+            self.assertEqual(set(backend._baldes), {'consulta_documento:1', 'consulta_ip:novo'})
+            self.assertFalse(backend.consumir('consulta_documento:1', 1, 300)[0])
+
+    def test_cheio_descarta_os_mais_antigos(self):
+        backend = limitador.BackendMemoria()
+        with mock.patch.object(limitador.BackendMemoria, 'MAX_CHAVES', 10), \
+                mock.patch('entregas.limitador.time.monotonic') as relogio:
+            for i in range(10):
+                relogio.return_value = i
+                backend.consumir(f'consulta_ip:{i}', 1, 60)
+            backend.consumir('consulta_ip:0', 1, 60)  # reacessado: passa a ser o mais recente
+
+            relogio.return_value = 20
+            backend.consumir('consulta_ip:novo', 1, 60)
+            self.assertEqual(len(backend._baldes), 10)
+            self.assertNotIn('consulta_ip:1', backend._baldes)
+            self.assertIn('consulta_ip:0', backend._baldes)
@@ -1,17 +1,60 @@
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Sum, Count, Avg, F, Q, Min, Max
+from django.db.models import Sum, Count, F, Q, Min, Max
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.utils.timezone import make_aware
 from django.conf import settings
 from .models import Encomenda, Cliente, AnotacaoCliente
 from .models import PalavraChave
+from . import arquivo, consultas, eventos, limitador, metricas
 from django.shortcuts import redirect
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_GET
+import hashlib
 import json
 import urllib.request
 import urllib.parse
 
+# --- AGREGAÇÕES SOBRE A TABELA QUENTE + ARQUIVO ---
+# Cada item de 'querysets' é o mesmo filtro aplicado a Encomenda e, quando o período alcança o arquivo,
+# a EncomendaArquivada (ver arquivo.tabelas_de_encomendas); os resultados parciais são somados.
+def _somar(querysets, expressao):
+    return sum((qs.aggregate(total=expressao)['total'] or 0 for qs in querysets), 0)
+
+def _contar(querysets):
+    return sum(qs.count() for qs in querysets)
+
+def _media_dias_estoque(querysets):
+    # Média ponderada de (entrega - chegada): soma das durações / quantidade, somadas entre as tabelas
+    soma, qtd = timedelta(0), 0
+    for qs in querysets:
+        parcial = qs.aggregate(soma=Sum(F('data_entrega') - F('data_chegada')), qtd=Count('data_entrega'))
+        if parcial['qtd']:
+            soma += parcial['soma']
+            qtd += parcial['qtd']
+    return (soma / qtd).days if qtd else 0
+
+def _top_clientes(querysets, limite=5):
+    agrupar = lambda qs: qs.values('cliente__nome', 'cliente__observacao').annotate(total_gasto=Sum('valor_cobrado'), qtd=Count('id'))
+    if len(querysets) == 1:
+        return list(agrupar(querysets[0]).order_by('-total_gasto')[:limite])
+
+    totais = {}
+    for qs in querysets:
+        for linha in agrupar(qs).order_by():
+            chave = (linha['cliente__nome'], linha['cliente__observacao'])
+            if chave in totais:
+                totais[chave]['total_gasto'] = (totais[chave]['total_gasto'] or 0) + (linha['total_gasto'] or 0)
+                totais[chave]['qtd'] += linha['qtd']
+            else:
+                totais[chave] = linha
+    return sorted(totais.values(), key=lambda linha: linha['total_gasto'] or 0, reverse=True)[:limite]
+
 @staff_member_required
 def relatorio_entregas(request):
     # --- 1. CONFIGURAÇÃO DE DATAS ---
@@ -37,50 +80,54 @@ def relatorio_entregas(request):
     # Aplica o filtro de descartado=False globalmente para não entrar em nenhum cálculo do Dashboard
     qs_todas = Encomenda.objects.filter(descartado=False)
 
+    # Entregas antigas podem ter ido para o arquivo: períodos que o alcançam somam as duas tabelas
+    limite_arquivo = arquivo.limite_do_arquivo()
+    tabelas_periodo = arquivo.tabelas_de_encomendas(limite_arquivo, None if ignorar_periodo else dt_inicial)
+
     # --- 2. DADOS DO PERÍODO ---
     if ignorar_periodo:
         # Se ignorar, pega tudo
-        encomendas_entregues = qs_todas.filter(status='ENTREGUE') 
-        encomendas_chegadas = qs_todas 
+        encomendas_entregues = [m.objects.filter(descartado=False, status='ENTREGUE') for m in tabelas_periodo]
+        encomendas_chegadas = [m.objects.filter(descartado=False) for m in tabelas_periodo]
         periodo_label = "Todo o Histórico"
     else:
         # SAÍDAS
-        encomendas_entregues = qs_todas.filter(status='ENTREGUE', data_entrega__range=(dt_inicial, dt_final))
+        encomendas_entregues = [
+            m.objects.filter(descartado=False, status='ENTREGUE', data_entrega__range=(dt_inicial, dt_final)) for m in tabelas_periodo
+        ]
         # CHEGADAS
-        encomendas_chegadas = qs_todas.filter(data_chegada__range=(dt_inicial, dt_final))
+        encomendas_chegadas = [m.objects.filter(descartado=False, data_chegada__range=(dt_inicial, dt_final)) for m in tabelas_periodo]
         
         periodo_label = f"{dt_inicial.strftime('%d/%m/%Y')} até {dt_final.strftime('%d/%m/%Y')}"
 
     # --- CÁLCULOS FINANCEIROS (CORRIGIDO) ---
-    faturamento_real = encomendas_entregues.aggregate(Sum('valor_cobrado'))['valor_cobrado__sum'] or 0
+    faturamento_real = _somar(encomendas_entregues, Sum('valor_cobrado'))
     
     # Lógica de Desconto Corrigida:
     # Soma individualmente a diferença (Calculado - Cobrado) apenas quando houve desconto.
     # Isso impede que encomendas com lucro (cobrado a mais) anulem os descontos na soma total.
-    descontos_dados = encomendas_entregues.filter(
-        valor_calculado__gt=F('valor_cobrado')
-    ).aggregate(
-        total_desconto=Sum(F('valor_calculado') - F('valor_cobrado'))
-    )['total_desconto'] or 0
+    descontos_dados = _somar(
+        [qs.filter(valor_calculado__gt=F('valor_cobrado')) for qs in encomendas_entregues],
+        Sum(F('valor_calculado') - F('valor_cobrado')),
+    )
     
-    qtd_entregues = encomendas_entregues.count() 
-    qtd_chegadas = encomendas_chegadas.count()   
+    qtd_entregues = _contar(encomendas_entregues)
+    qtd_chegadas = _contar(encomendas_chegadas)
     
     ticket_medio = (faturamento_real / qtd_entregues) if qtd_entregues > 0 else 0
 
     # Tempo Médio Global
-    media_timedelta = qs_todas.filter(status='ENTREGUE').aggregate(media=Avg(F('data_entrega') - F('data_chegada')))['media']
-    tempo_medio_dias = media_timedelta.days if media_timedelta else 0
+    tempo_medio_dias = _media_dias_estoque([
+        m.objects.filter(descartado=False, status='ENTREGUE') for m in arquivo.tabelas_de_encomendas(limite_arquivo)
+    ])
 
     # Top 5 Clientes
-    top_clientes = encomendas_entregues.values('cliente__nome', 'cliente__observacao') \
-        .annotate(total_gasto=Sum('valor_cobrado'), qtd=Count('id')) \
-        .order_by('-total_gasto')[:5]
+    top_clientes = _top_clientes(encomendas_entregues)
 
     # Auditoria
-    entregas_zeradas = encomendas_entregues.filter(Q(valor_cobrado__isnull=True) | Q(valor_cobrado=0)).count()
+    entregas_zeradas = _contar([qs.filter(Q(valor_cobrado__isnull=True) | Q(valor_cobrado=0)) for qs in encomendas_entregues])
 
-    # --- 3. DADOS GERAIS DO ESTOQUE ---
+    # --- 3. DADOS GERAIS DO ESTOQUE (pendentes nunca vão para o arquivo) ---
     pendentes = qs_todas.filter(status='PENDENTE')
     estoque_qtd = pendentes.count()
     estoque_valor_base = pendentes.aggregate(Sum('valor_base'))['valor_base__sum'] or 0
@@ -137,11 +184,10 @@ def relatorio_entregas(request):
         fim_mes = make_aware(datetime(prox_ano_calc, prox_mes_calc, 1)) - timedelta(seconds=1)
         
         # Filtra direto no banco ignorando qualquer data do formulário principal
-        soma_mes = Encomenda.objects.filter(
-            status='ENTREGUE', 
-            descartado=False,
-            data_entrega__range=(inicio_mes, fim_mes)
-        ).aggregate(Sum('valor_cobrado'))['valor_cobrado__sum'] or 0
+        soma_mes = _somar([
+            m.objects.filter(status='ENTREGUE', descartado=False, data_entrega__range=(inicio_mes, fim_mes))
+            for m in arquivo.tabelas_de_encomendas(limite_arquivo, inicio_mes)
+        ], Sum('valor_cobrado'))
         
         label_mes = f"{meses_pt[mes_calculado-1]}/{ano_calculado}"
         
@@ -170,33 +216,41 @@ def relatorio_entregas(request):
         
     cli_dados = None
     if cliente_ids:
-        qs_cli = qs_todas.filter(cliente_id__in=cliente_ids)
+        tabelas_cli = arquivo.tabelas_de_encomendas(limite_arquivo, None if ignorar_periodo_cli else dt_ini_cli)
+        qs_cli = [m.objects.filter(descartado=False, cliente_id__in=cliente_ids) for m in tabelas_cli]
         
         if ignorar_periodo_cli:
             cli_recebidas = qs_cli
-            cli_retiradas = qs_cli.filter(status='ENTREGUE')
-            cli_lista = qs_cli.order_by('-data_chegada')
+            cli_retiradas = [qs.filter(status='ENTREGUE') for qs in qs_cli]
+            cli_lista = qs_cli
         else:
-            cli_recebidas = qs_cli.filter(data_chegada__range=(dt_ini_cli, dt_fim_cli))
-            cli_retiradas = qs_cli.filter(status='ENTREGUE', data_entrega__range=(dt_ini_cli, dt_fim_cli))
-            cli_lista = qs_cli.filter(
-                Q(data_chegada__range=(dt_ini_cli, dt_fim_cli)) | 
-                Q(status='ENTREGUE', data_entrega__range=(dt_ini_cli, dt_fim_cli))
-            ).order_by('-data_chegada')
+            cli_recebidas = [qs.filter(data_chegada__range=(dt_ini_cli, dt_fim_cli)) for qs in qs_cli]
+            cli_retiradas = [qs.filter(status='ENTREGUE', data_entrega__range=(dt_ini_cli, dt_fim_cli)) for qs in qs_cli]
+            cli_lista = [
+                qs.filter(
+                    Q(data_chegada__range=(dt_ini_cli, dt_fim_cli)) | 
+                    Q(status='ENTREGUE', data_entrega__range=(dt_ini_cli, dt_fim_cli))
+                ) for qs in qs_cli
+            ]
+        cli_lista = [qs.select_related('cliente').order_by('-data_chegada') for qs in cli_lista]
+        if len(cli_lista) > 1:
+            cli_lista = sorted((enc for qs in cli_lista for enc in qs), key=lambda enc: enc.data_chegada, reverse=True)
+        else:
+            cli_lista = cli_lista[0]
             
-        cli_aguardando = qs_cli.filter(status='PENDENTE')
+        cli_aguardando = qs_todas.filter(cliente_id__in=cliente_ids, status='PENDENTE')
         
-        cli_total_pago = cli_retiradas.aggregate(Sum('valor_cobrado'))['valor_cobrado__sum'] or 0
-        cli_descontos = cli_retiradas.filter(valor_calculado__gt=F('valor_cobrado')).aggregate(
-            total=Sum(F('valor_calculado') - F('valor_cobrado'))
-        )['total'] or 0
+        cli_total_pago = _somar(cli_retiradas, Sum('valor_cobrado'))
+        cli_descontos = _somar(
+            [qs.filter(valor_calculado__gt=F('valor_cobrado')) for qs in cli_retiradas],
+            Sum(F('valor_calculado') - F('valor_cobrado')),
+        )
         
-        cli_media_td = cli_retiradas.aggregate(media=Avg(F('data_entrega') - F('data_chegada')))['media']
-        cli_tempo_medio = cli_media_td.days if cli_media_td else 0
+        cli_tempo_medio = _media_dias_estoque(cli_retiradas)
         
         cli_dados = {
-            'qtd_recebidas': cli_recebidas.count(),
-            'qtd_retiradas': cli_retiradas.count(),
+            'qtd_recebidas': _contar(cli_recebidas),
+            'qtd_retiradas': _contar(cli_retiradas),
             'total_pago': cli_total_pago,
             'descontos': cli_descontos,
             'tempo_medio': cli_tempo_medio,
@@ -244,6 +298,40 @@ def relatorio_entregas(request):
     
     return render(request, 'admin/relatorio_ganhos.html', context)
 
+def validar_recaptcha(token):
+    # Token de teste de carga (ver RECAPTCHA_TOKEN_TESTE): nunca aceito fora do DEBUG
+    token_teste = getattr(settings, 'RECAPTCHA_TOKEN_TESTE', None)
+    if token_teste and settings.DEBUG and token == token_teste:
+        return True
+
+    # --- VALIDAÇÃO DO RECAPTCHA ENTERPRISE VIA REST API ---
+    project_id = getattr(settings, 'GOOGLE_PROJECT_ID', '')
+    api_key = getattr(settings, 'GOOGLE_API_KEY', '')
+    site_key = getattr(settings, 'RECAPTCHA_SITE_KEY', '')
+    
+    url = f'https://recaptchaenterprise.googleapis.com/v1/projects/{project_id}/assessments?key={api_key}'
+    
+    valores = {
+        "event": {
+            "token": token,
+            "expectedAction": "LOGIN",
+            "siteKey": site_key
+        }
+    }
+    
+    dados = json.dumps(valores).encode('utf-8')
+    req = urllib.request.Request(url, data=dados, headers={'Content-Type': 'application/json'})
+    
+    try:
+        resposta = urllib.request.urlopen(req)
+        resultado_json = json.loads(resposta.read().decode())
+        
+        propriedades_token = resultado_json.get('tokenProperties', {})
+        return bool(propriedades_token.get('valid'))
+    except Exception:
+        # Se houver erro de conexão com o Google, aborta a busca por segurança
+        return False
+
 def consulta_publica(request):
     # Aceita tanto POST quanto GET, mas a validação de segurança ocorre via POST
     query = request.POST.get('q') or request.GET.get('q')
@@ -254,77 +342,39 @@ def consulta_publica(request):
     
     # Executa a busca apenas se a requisição for POST (que traz o token do reCAPTCHA)
     if query and request.method == 'POST':
-        # --- 1. VALIDAÇÃO DO RECAPTCHA ENTERPRISE VIA REST API ---
-        recaptcha_response = request.POST.get('g-recaptcha-response')
-        
-        project_id = getattr(settings, 'GOOGLE_PROJECT_ID', '')
-        api_key = getattr(settings, 'GOOGLE_API_KEY', '')
-        site_key = getattr(settings, 'RECAPTCHA_SITE_KEY', '')
-        
-        url = f'https://recaptchaenterprise.googleapis.com/v1/projects/{project_id}/assessments?key={api_key}'
-        
-        valores = {
-            "event": {
-                "token": recaptcha_response,
-                "expectedAction": "LOGIN",
-                "siteKey": site_key
-            }
-        }
-        
-        dados = json.dumps(valores).encode('utf-8')
-        req = urllib.request.Request(url, data=dados, headers={'Content-Type': 'application/json'})
-        
-        try:
-            resposta = urllib.request.urlopen(req)
-            resultado_json = json.loads(resposta.read().decode())
-            
-            propriedades_token = resultado_json.get('tokenProperties', {})
-            if not propriedades_token.get('valid'):
-                erro_recaptcha = True
-        except Exception:
-            # Se houver erro de conexão com o Google, aborta a busca por segurança
-            erro_recaptcha = True
+        # Remove caracteres especiais para comparar apenas números
+        termo_limpo = query.replace('.', '').replace('-', '').strip()
+
+        # --- 0. LIMITE POR IP (antes de qualquer chamada externa ou consulta ao banco) ---
+        espera = limitador.verificar_consulta(request)
+
+        # --- 1. VALIDAÇÃO DO RECAPTCHA e LIMITE POR DOCUMENTO (só com o reCAPTCHA aprovado) ---
+        if not espera:
+            erro_recaptcha = not validar_recaptcha(request.POST.get('g-recaptcha-response'))
+            if not erro_recaptcha and len(termo_limpo) >= 4:
+                espera = limitador.verificar_documento(termo_limpo)
+
+        if espera:
+            response = render(request, 'publica/consulta.html', {
+                'resultados': [],
+                'query': query,
+                'total_geral': 0.0,
+                'erro_limite': True,
+                'recaptcha_site_key': getattr(settings, 'RECAPTCHA_SITE_KEY', '')
+            }, status=429)
+            response['Retry-After'] = str(espera)
+            return response
 
         # --- 2. BUSCA NO BANCO DE DADOS (Apenas se passar pelo reCAPTCHA) ---
         if not erro_recaptcha:
-            # Remove caracteres especiais para comparar apenas números
-            termo_limpo = query.replace('.', '').replace('-', '').strip()
-            
             # BLOQUEIO DE SEGURANÇA: Evita "força bruta" com pesquisas vazias ou muito curtas.
             if termo_limpo and len(termo_limpo) >= 4:
-                # Verifica se o cliente existe no banco independentemente de ter encomendas pendentes
-                cliente_existe = Cliente.objects.filter(Q(cpf=termo_limpo) | Q(rg=termo_limpo)).exists()
-                
-                # Busca EXATA pelo CPF ou RG. Impede SQL Injection e extração massiva em banco de dados
-                qs = Encomenda.objects.filter(
-                    Q(cliente__cpf=termo_limpo) | 
-                    Q(cliente__rg=termo_limpo),
-                    status='PENDENTE',
-                    descartado=False
-                ).order_by('-data_chegada')
-
-                agora = timezone.now()
-
-                for item in qs:
-                    # 1. Calcular dias em estoque
-                    dias_estoque = (agora - item.data_chegada).days
-                    if dias_estoque < 0: dias_estoque = 0
-                    
-                    # 2. Calcular multiplicador
-                    multiplicador = max(1, dias_estoque // 10)
-                    
-                    # 3. Calcular valor atualizado
-                    valor_final = float(item.valor_base) * multiplicador
-
-                    # Atributos para o template
-                    item.dias_display = dias_estoque
-                    item.valor_final_display = valor_final
-                    
-                    # Flag para destacar SOMENTE se ultrapassar 10 dias
-                    item.is_atrasado = (dias_estoque > 19) 
-                    
-                    resultados.append(item)
-                    total_geral += valor_final
+                # Busca EXATA pelo CPF ou RG (uma única consulta, com cache por documento).
+                # Impede SQL Injection e extração massiva em banco de dados
+                consulta = consultas.buscar_pendentes(termo_limpo)
+                cliente_existe = consulta['cliente_existe']
+                resultados = consulta['resultados']
+                total_geral = consulta['total_geral']
             else:
                 # Se o termo digitado for muito curto (menor que 4 caracteres), anula a busca
                 cliente_existe = False
@@ -338,6 +388,64 @@ def consulta_publica(request):
         'recaptcha_site_key': getattr(settings, 'RECAPTCHA_SITE_KEY', '')
     })
 
+# --- API JSON (v1) DA CONSULTA PÚBLICA ---
+# Mesmos dados e mesmas proteções da página /consulta/ (limite de requisições + reCAPTCHA),
+# em formato compacto para front-ends leves. Documento e token do reCAPTCHA vão nos cabeçalhos
+# X-Documento e X-Recaptcha-Token, nunca na URL (que acaba em logs de acesso e no histórico).
+# Suporta ETag / If-None-Match: se nada mudou desde a última resposta, devolve 304 sem corpo.
+# A requisição condicional ainda precisa de um token novo (são de uso único) e ainda paga a
+# avaliação remota do reCAPTCHA antes da comparação da ETag: o 304 economiza só os bytes do corpo.
+@require_GET
+def api_consulta_v1(request):
+    documento = (request.headers.get('X-Documento') or '').replace('.', '').replace('-', '').strip()
+    valido = len(documento) >= 4 and documento.isdigit()
+
+    espera = limitador.verificar_consulta(request)
+    if not espera:
+        if not valido:
+            return JsonResponse({'erro': 'documento_invalido'}, status=400)
+
+        token = request.headers.get('X-Recaptcha-Token')
+        if not validar_recaptcha(token):
+            return JsonResponse({'erro': 'recaptcha_invalido'}, status=403)
+
+        espera = limitador.verificar_documento(documento)
+    if espera:
+        response = JsonResponse({'erro': 'limite_excedido'}, status=429)
+        response['Retry-After'] = str(espera)
+        return response
+
+    consulta = consultas.buscar_pendentes(documento)
+    dados = {
+        'versao': 1,
+        'cliente_existe': consulta['cliente_existe'],
+        'encomendas': [
+            {
+                'data_chegada': timezone.localtime(item['data_chegada']).date().isoformat(),
+                'dias_em_estoque': item['dias_display'],
+                'valor_base': round(float(item['valor_base']), 2),
+                'valor_atual': round(item['valor_final_display'], 2),
+                'atrasada': item['is_atrasado'],
+            }
+            for item in consulta['resultados']
+        ],
+        'total': round(consulta['total_geral'], 2),
+    }
+
+    corpo = json.dumps(dados, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    etag = quote_etag(hashlib.sha256(corpo).hexdigest()[:32])
+
+    # Comparação fraca (RFC 9110): ignora o prefixo W/ das ETags enviadas pelo cliente
+    etags_cliente = [e.removeprefix('W/') for e in parse_etags(request.headers.get('If-None-Match', ''))]
+    if '*' in etags_cliente or etag in etags_cliente:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(corpo, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['X-Documento'])
+    return response
+
 def home(request):
     return render(request, 'publica/home.html')
 
@@ -380,4 +488,55 @@ def gerenciar_anotacoes(request):
             anotacao_id = request.POST.get('anotacao_id')
             if anotacao_id:
                 AnotacaoCliente.objects.filter(id=anotacao_id).delete()
-    return redirect('admin:index')
\ No newline at end of file
+    return redirect('admin:index')
+
+@staff_member_required
+def status_limitador(request):
+    # Contadores do limitador de requisições da consulta pública (permitidas x bloqueadas)
+    return JsonResponse(limitador.estatisticas())
+
+@staff_member_required
+def relatorio_metricas(request):
+    # Percentis de latência por tela e os maiores ofensores (tempo total e consultas por requisição)
+    try:
+        horas = int(request.GET.get('horas', 24))
+    except ValueError:
+        horas = 24
+    horas = min(max(horas, 1), 24 * 30)
+
+    linhas = metricas.resumo_por_rota(horas)
+    context = {
+        'title': 'Desempenho por Tela',
+        'horas': horas,
+        'opcoes_horas': [1, 24, 24 * 7, 24 * 30],
+        'linhas': linhas,
+        'piores_tempo_total': sorted(linhas, key=lambda l: -l['tempo_total_s'])[:10],
+        'piores_consultas': sorted(linhas, key=lambda l: -(l['consultas_p95'] or 0))[:10],
+        'metricas_ativas': settings.METRICAS_ATIVAS,
+        'intervalo': settings.METRICAS_INTERVALO,
+    }
+    return render(request, 'admin/relatorio_metricas.html', context)
+
+# --- MUDANÇAS DE ESTOQUE AO VIVO (SSE) ---
+# Assíncrona para que cada tela aberta não prenda uma thread. Sem servidor ASGI (gunicorn síncrono),
+# responde de uma vez e o EventSource reconecta a cada EVENTOS_INTERVALO segundos (ver entregas/eventos.py).
+async def fluxo_eventos(request):
+    usuario = await request.auser()
+    if not (usuario.is_active and usuario.is_staff):
+        return HttpResponseForbidden()
+    try:
+        # Reconexão: o navegador manda o Last-Event-ID; a primeira conexão, o último id visto pela página
+        ultimo = int(request.headers.get('Last-Event-ID') or request.GET.get('desde') or 0)
+    except ValueError:
+        ultimo = 0
+    if ultimo <= 0:
+        ultimo = await sync_to_async(eventos.ultimo_id)()
+
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(eventos.fluxo(ultimo), content_type='text/event-stream')
+    else:
+        response = HttpResponse(await sync_to_async(eventos.resposta_unica)(ultimo), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Sem buffer em proxies (nginx): cada evento sai assim que é gerado
+    response['X-Accel-Buffering'] = 'no'
+    return response